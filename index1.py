@@ -1,78 +1,1229 @@
-import streamlit as st
-import pandas as pd
-import numpy as np
+import time
+_script_started = time.perf_counter()
+_script_started_at = time.time()
+
 import os
+import sys
+import importlib
+import logging
 import json
+import copy
+import contextlib
+import random
+import heapq
+import bisect
+import itertools
+import math
+import threading
 import uuid 
 import datetime
-import time
-import plotly.express as px
-import plotly.graph_objects as go
 import tempfile
-import threading
 import io
+import csv
+import zipfile
 import re
-import base64
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import db
-
-# Set page configuration
-st.set_page_config(
-    page_title="Ledger Management System",
-    page_icon="🔥",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
-
-# Initialize Firebase with Streamlit secrets
+import hashlib
+import shutil
+import sqlite3
+import cProfile
+import marshal
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+logger = logging.getLogger("ledger")
+
+def in_script_run():
+    """True on a Streamlit script thread, False in worker threads and headless use"""
+    try:
+        return get_script_run_ctx(suppress_warning=True) is not None
+    except TypeError:  # Streamlit releases without suppress_warning
+        return get_script_run_ctx() is not None
+
+# Cold-start budget for the first script run in a fresh process
+STARTUP_BUDGET_MS = 2000
+
+@st.cache_resource
+def startup_profile():
+    """Process-wide record of cold import timings and script run times"""
+    return {"imports": {}, "first_run_ms": None, "last_run_ms": None, "logged": False}
+
+def timed_import(name):
+    """Import a module on demand, recording how long its first import took"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    startup_profile()["imports"][name] = (time.perf_counter() - started) * 1000
+    return module
+
+# Heavy third-party modules are timed; openpyxl, pyarrow and plotly load only when an export, archive or chart needs them
+pd = timed_import("pandas")
+np = timed_import("numpy")
+firebase_admin = timed_import("firebase_admin")
+credentials = timed_import("firebase_admin.credentials")
+db = timed_import("firebase_admin.db")
+firebase_exceptions = timed_import("firebase_admin.exceptions")
+
+# Set page configuration; ledger_cli.py imports this module headless and skips the page
+if __name__ == "__main__":
+    st.set_page_config(
+        page_title="Ledger Management System",
+        page_icon="🔥",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
+
+# Initialize Firebase with Streamlit secrets; failures are not cached so the next rerun retries
 @st.cache_resource
 def init_firebase():
-    try:
-        if not firebase_admin._apps:
-            # Try to get Firebase config from Streamlit secrets
-            firebase_config = st.secrets["firebase"]
-            
-            # Create credentials from secrets
-            cred_dict = {
-                "type": firebase_config["type"],
-                "project_id": firebase_config["project_id"],
-                "private_key_id": firebase_config["private_key_id"],
-                "private_key": firebase_config["private_key"],
-                "client_email": firebase_config["client_email"],
-                "client_id": firebase_config["client_id"],
-                "auth_uri": firebase_config["auth_uri"],
-                "token_uri": firebase_config["token_uri"],
-                "auth_provider_x509_cert_url": firebase_config["auth_provider_x509_cert_url"],
-                "client_x509_cert_url": firebase_config["client_x509_cert_url"],
-                "universe_domain": firebase_config.get("universe_domain", "googleapis.com")
+    if not firebase_admin._apps:
+        # Try to get Firebase config from Streamlit secrets
+        firebase_config = st.secrets["firebase"]
+        
+        # Create credentials from secrets
+        cred_dict = {
+            "type": firebase_config["type"],
+            "project_id": firebase_config["project_id"],
+            "private_key_id": firebase_config["private_key_id"],
+            "private_key": firebase_config["private_key"],
+            "client_email": firebase_config["client_email"],
+            "client_id": firebase_config["client_id"],
+            "auth_uri": firebase_config["auth_uri"],
+            "token_uri": firebase_config["token_uri"],
+            "auth_provider_x509_cert_url": firebase_config["auth_provider_x509_cert_url"],
+            "client_x509_cert_url": firebase_config["client_x509_cert_url"],
+            "universe_domain": firebase_config.get("universe_domain", "googleapis.com")
+        }
+        
+        cred = credentials.Certificate(cred_dict)
+        firebase_admin.initialize_app(cred, {
+            'databaseURL': firebase_config["database_url"]
+        })
+        
+        return True, db.reference('/')
+    else:
+        return True, db.reference('/')
+
+# Initialize Firebase
+try:
+    using_firebase, firebase_db = init_firebase()
+except Exception as e:
+    st.error(f"🔥 Firebase initialization failed: {e}")
+    st.error("Please check your Firebase configuration!")
+    using_firebase, firebase_db = False, None
+
+def root_ref():
+    """The database root, resolved lazily so the write worker survives a failed first init"""
+    if firebase_db is not None:
+        return firebase_db
+    if firebase_admin._apps:
+        return db.reference('/')
+    raise ConnectionError("Firebase is not initialized")
+
+# Hot-path metrics: every Firebase call is timed and sized, aggregated per rerun and per session
+DIAGNOSTICS_HISTORY = 30
+N_PLUS_ONE_THRESHOLD = 25
+BACKGROUND_RUN_CALLS = 1000  # calls outside a script run summarised as one "run" before starting the next
+
+def _new_metrics():
+    return {"calls": [], "by_op": {}, "slowest": [], "cache_hits": 0, "cache_misses": 0}
+
+@st.cache_resource
+def background_metrics():
+    """Metrics for calls made outside a script run, e.g. from worker threads; shared, so guarded by a lock"""
+    return {"session": _new_metrics(), "run": _new_metrics(), "runs": [], "run_open": False, "lock": threading.Lock()}
+
+def metrics_guard(state):
+    # Session metrics belong to one script thread; the background bucket is shared by every worker
+    return state.get("lock") or contextlib.nullcontext()
+
+def metrics_state():
+    if not in_script_run():
+        return background_metrics()
+    if 'metrics' not in st.session_state:
+        st.session_state.metrics = {"session": _new_metrics(), "run": _new_metrics(), "runs": [], "run_open": False}
+    return st.session_state.metrics
+
+def payload_size(value):
+    if value is None:
+        return 0
+    return len(json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8"))
+
+def path_template(path):
+    # "customer_transactions/abc/def" -> "customer_transactions/*/*" so N+1 patterns group together
+    parts = path.strip("/").split("/")
+    return "/".join(parts[:1] + ["*"] * (len(parts) - 1)) or "/"
+
+def record_call(op, path, elapsed_ms, size, ok):
+    call = {"op": op, "path": path, "ms": round(elapsed_ms, 2), "bytes": size, "ok": ok}
+    state = metrics_state()
+    with metrics_guard(state):
+        _record_call(state, call, elapsed_ms)
+    logger.debug(json.dumps({"event": "firebase_call", **call}))
+
+def _record_call(state, call, elapsed_ms):
+    op, size, ok = call["op"], call["bytes"], call["ok"]
+    state["run"]["calls"].append(call)
+
+    for scope in (state["run"], state["session"]):
+        stats = scope["by_op"].setdefault(op, {"count": 0, "ms": 0.0, "bytes": 0, "errors": 0, "max_ms": 0.0})
+        stats["count"] += 1
+        stats["ms"] += elapsed_ms
+        stats["bytes"] += size
+        stats["errors"] += 0 if ok else 1
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+    slowest = state["session"]["slowest"]
+    slowest.append(call)
+    slowest.sort(key=lambda c: c["ms"], reverse=True)
+    del slowest[10:]
+
+    # Worker threads and headless jobs never end a rerun, so their bucket is rolled over by size
+    if not in_script_run() and len(state["run"]["calls"]) >= BACKGROUND_RUN_CALLS:
+        end_rerun_metrics()
+        state["run"] = _new_metrics()
+
+def record_cache_lookup(hit):
+    state = metrics_state()
+    key = "cache_hits" if hit else "cache_misses"
+    with metrics_guard(state):
+        state["run"][key] += 1
+        state["session"][key] += 1
+
+def begin_rerun_metrics():
+    state = metrics_state()
+    if state["run_open"]:
+        # The previous run ended early (st.stop / st.rerun); close it before starting over
+        end_rerun_metrics()
+    state["run"] = _new_metrics()
+    state["run_open"] = True
+
+def end_rerun_metrics():
+    """Summarise the finished rerun, keep it in the history and log it"""
+    state = metrics_state()
+    run = state["run"]
+    calls = run["calls"]
+
+    per_path = {}
+    for call in calls:
+        template = path_template(call["path"])
+        per_path[template] = per_path.get(template, 0) + 1
+
+    summary = {
+        "event": "rerun_summary",
+        "at": datetime.datetime.now().strftime('%H:%M:%S'),
+        "calls": len(calls),
+        "ms": round(sum(c["ms"] for c in calls), 1),
+        "bytes": sum(c["bytes"] for c in calls),
+        "errors": sum(1 for c in calls if not c["ok"]),
+        "cache_hits": run["cache_hits"],
+        "cache_misses": run["cache_misses"],
+        "per_path": per_path
+    }
+    state["runs"].append(summary)
+    del state["runs"][:-DIAGNOSTICS_HISTORY]
+    state["run_open"] = False
+
+    repeated = {path: count for path, count in per_path.items() if count >= N_PLUS_ONE_THRESHOLD}
+    if repeated:
+        logger.warning(json.dumps({**summary, "event": "n_plus_one_suspect", "repeated": repeated}))
+    else:
+        logger.info(json.dumps(summary))
+    return summary
+
+# Session data cache: trees read this session, patched in place by our own writes
+DATA_CACHE_TTL = 60  # seconds before a cached tree is re-read from Firebase
+
+def data_cache():
+    if not in_script_run():
+        return None
+    if 'data_cache' not in st.session_state:
+        st.session_state.data_cache = {}
+    return st.session_state.data_cache
+
+def stale_reads():
+    """{path: time last read} of expired cache entries served this rerun because a refresh failed"""
+    if 'stale_reads' not in st.session_state:
+        st.session_state.stale_reads = {}
+    return st.session_state.stale_reads
+
+def clear_data_cache():
+    if 'data_cache' in st.session_state:
+        st.session_state.data_cache = {}
+
+def split_path(path):
+    return [part for part in path.strip("/").split("/") if part]
+
+def tree_get(tree, parts):
+    for part in parts:
+        if not isinstance(tree, dict):
+            return None
+        tree = tree.get(part)
+    return tree
+
+def tree_set(tree, parts, value):
+    """Set value at parts inside tree (None deletes) and return the possibly new root"""
+    if not parts:
+        return value
+    root = tree if isinstance(tree, dict) else {}
+    node = root
+    for part in parts[:-1]:
+        child = node.get(part)
+        if not isinstance(child, dict):
+            child = node[part] = {}
+        node = child
+    if value is None:
+        node.pop(parts[-1], None)
+    else:
+        node[parts[-1]] = value
+    return root
+
+def resolve_server_value(current, value):
+    # Server-side increments are mirrored locally against the cached value
+    if isinstance(value, dict) and ".sv" in value:
+        delta = value[".sv"].get("increment", 0)
+        return (current if isinstance(current, (int, float)) else 0) + delta
+    return value
+
+def apply_local(updates, keys=None):
+    """Apply a multi-path update to the session cache (or only the given keys); returns an undo log"""
+    cache = data_cache()
+    undo = []
+    if not cache:
+        return undo
+
+    for path, value in updates.items():
+        parts = split_path(path)
+        for key in list(keys if keys is not None else cache):
+            entry = cache[key]
+            key_parts = split_path(key)
+            if parts[:len(key_parts)] == key_parts:
+                # Cached tree contains the written path
+                relative = parts[len(key_parts):]
+                old = tree_get(entry["value"], relative)
+                undo.append((key, relative, old, entry))
+                entry["value"] = tree_set(entry["value"], relative, resolve_server_value(old, value))
+            elif key_parts[:len(parts)] == parts:
+                # Cached tree sits below the written path
+                undo.append((key, None, None, entry))
+                cache[key] = {"value": tree_get(value, key_parts[len(parts):]), "at": entry["at"]}
+    return undo
+
+def rollback_local(undo):
+    cache = data_cache()
+    if cache is None:
+        return
+    for key, relative, old, entry in reversed(undo):
+        if relative is None:
+            cache[key] = entry
+        elif key in cache:
+            cache[key]["value"] = tree_set(cache[key]["value"], relative, old)
+
+def increment(delta):
+    """Realtime Database server-side increment, safe to combine with other paths in one update"""
+    return {".sv": {"increment": delta}}
+
+# Durable write-ahead queue: writes are fsynced to a local journal and flushed by a worker thread
+LEDGER_DATA_DIR = os.environ.get("LEDGER_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".ledger"))
+# Batch jobs (ledger_cli.py) run with LEDGER_HEADLESS=1: writes go straight to Firebase and the
+# app's journal is left to the app's own worker
+HEADLESS = os.environ.get("LEDGER_HEADLESS") == "1"
+WRITE_QUEUE_MAX_ENTRIES = 200    # queued writes coalesced into one request
+WRITE_QUEUE_MAX_PATHS = 2000     # paths per coalesced multi-path update
+WRITE_QUEUE_WINDOW = 0.05        # seconds to wait for a burst to accumulate
+WRITE_QUEUE_MAX_BACKOFF = 60     # seconds
+
+def report_error(message):
+    """st.error for the page; headless jobs have no page, so the message and traceback go to the log"""
+    st.error(message)
+    if HEADLESS:
+        logger.error(message, exc_info=sys.exc_info()[0] is not None)
+
+def is_transient_error(error):
+    """Network and server errors are worth retrying; bad requests and auth failures are not"""
+    permanent = (
+        firebase_exceptions.InvalidArgumentError,
+        firebase_exceptions.FailedPreconditionError,
+        firebase_exceptions.PermissionDeniedError,
+        firebase_exceptions.UnauthenticatedError,
+        firebase_exceptions.NotFoundError,
+        ValueError,
+        TypeError
+    )
+    return not isinstance(error, permanent)
+
+def backoff_delay(attempt, cap=WRITE_QUEUE_MAX_BACKOFF):
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(cap, 0.5 * 2 ** attempt))
+
+def merge_server_values(old, new):
+    # Two queued increments of one path add up; an increment over a plain number applies to it
+    if isinstance(new, dict) and ".sv" in new:
+        delta = new[".sv"].get("increment", 0)
+        if isinstance(old, dict) and ".sv" in old:
+            return increment(old[".sv"].get("increment", 0) + delta)
+        if isinstance(old, (int, float)) and not isinstance(old, bool):
+            return old + delta
+    return new
+
+def coalesce_updates(batches):
+    """Merge multi-path updates in order into one update with no overlapping paths"""
+    merged = {}
+    below = {}     # path prefix -> merged keys underneath it
+    owned = set()  # merged values already copied and safe to modify
+
+    def add(key):
+        parts = key.split("/")
+        for i in range(1, len(parts)):
+            below.setdefault("/".join(parts[:i]), set()).add(key)
+
+    def remove(key):
+        parts = key.split("/")
+        for i in range(1, len(parts)):
+            below["/".join(parts[:i])].discard(key)
+        merged.pop(key, None)
+        owned.discard(key)
+
+    for updates in batches:
+        for path, value in updates.items():
+            parts = split_path(path)
+            key = "/".join(parts)
+
+            # An earlier write to an ancestor absorbs this one
+            ancestor = next(
+                ("/".join(parts[:i]) for i in range(1, len(parts)) if "/".join(parts[:i]) in merged),
+                None
+            )
+            if ancestor is not None:
+                if ancestor not in owned:
+                    merged[ancestor] = copy.deepcopy(merged[ancestor])
+                    owned.add(ancestor)
+                relative = parts[len(split_path(ancestor)):]
+                current = tree_get(merged[ancestor], relative)
+                merged[ancestor] = tree_set(merged[ancestor], relative, merge_server_values(current, value))
+                continue
+
+            # This write replaces everything queued underneath it
+            for descendant in list(below.get(key, ())):
+                remove(descendant)
+
+            merged[key] = merge_server_values(merged.get(key), value)
+            owned.discard(key)
+            add(key)
+
+    return merged
+
+class WriteQueue:
+    """Write-ahead journal of pending multi-path updates, flushed in coalesced groups"""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "write_queue.jsonl")
+        self.failed_path = os.path.join(directory, "write_queue_failed.jsonl")
+        self.condition = threading.Condition()
+        self.pending = []
+        self.failed = []
+        self.next_seq = 1
+        self.attempts = 0
+        self.retry_at = 0.0
+        self.last_error = None
+        self.last_synced_at = None
+        self.pruned_at = 0.0
+        self._replay()
+        self.journal = open(self.path, "a", encoding="utf-8")
+        self.worker = threading.Thread(target=self._run, name="ledger-write-queue", daemon=True)
+        self.worker.start()
+
+    def _replay(self):
+        # Entries after the last acknowledgement were never confirmed by Firebase
+        entries = []
+        acked = 0
+        if os.path.exists(self.path):
+            with open(self.path, "rb+") as journal:
+                data = journal.read()
+                # A crash mid-append leaves a torn final line; cut it off so the next append starts clean
+                complete = data.rfind(b"\n") + 1
+                if complete < len(data):
+                    journal.truncate(complete)
+                    journal.flush()
+                    os.fsync(journal.fileno())
+            for line in data[:complete].decode("utf-8", errors="replace").splitlines():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if "ack" in record:
+                    acked = max(acked, record["ack"])
+                else:
+                    entries.append(record)
+        self.pending = [(entry["seq"], entry["updates"]) for entry in entries if entry["seq"] > acked]
+        self.next_seq = max([acked] + [entry["seq"] for entry in entries]) + 1
+
+        if os.path.exists(self.failed_path):
+            with open(self.failed_path, encoding="utf-8") as failed:
+                self.failed = [json.loads(line) for line in failed if line.strip()]
+
+    def _append(self, record):
+        self.journal.write(json.dumps(record, separators=(",", ":"), default=str) + "\n")
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+    def enqueue(self, updates):
+        """Durably record an update; returns once it is on local disk"""
+        with self.condition:
+            seq = self.next_seq
+            self.next_seq += 1
+            record = {"seq": seq, "updates": updates}
+            self._append(record)
+            # Keep a private copy so later edits by the caller can't change what gets sent
+            self.pending.append((seq, json.loads(json.dumps(updates, default=str))))
+            self.condition.notify()
+            return seq
+
+    def pending_updates(self):
+        with self.condition:
+            return [updates for _, updates in self.pending]
+
+    def status(self):
+        with self.condition:
+            return {
+                "pending": len(self.pending),
+                "failed": len(self.failed),
+                "last_error": self.last_error,
+                "last_synced_at": self.last_synced_at,
+                "retry_in": max(self.retry_at - time.time(), 0) if self.pending else 0
             }
-            
-            cred = credentials.Certificate(cred_dict)
-            firebase_admin.initialize_app(cred, {
-                'databaseURL': firebase_config["database_url"]
-            })
-            
-            return True, db.reference('/')
+
+    def flush_now(self):
+        with self.condition:
+            self.retry_at = 0.0
+            self.condition.notify()
+
+    def retry_failed(self):
+        """Queue dead-lettered writes again"""
+        with self.condition:
+            failed, self.failed = self.failed, []
+            self._rewrite_failed()
+        for entry in failed:
+            self.enqueue(entry["updates"])
+
+    def discard_failed(self):
+        with self.condition:
+            self.failed = []
+            self._rewrite_failed()
+
+    def _rewrite_failed(self):
+        with open(self.failed_path, "w", encoding="utf-8") as failed:
+            for entry in self.failed:
+                failed.write(json.dumps(entry, default=str) + "\n")
+
+    def _ack(self, seqs):
+        with self.condition:
+            done = set(seqs)
+            self.pending = [(seq, updates) for seq, updates in self.pending if seq not in done]
+            if self.pending:
+                self._append({"ack": min(seq for seq, _ in self.pending) - 1})
+            else:
+                # Nothing outstanding: compact the journal
+                self.journal.close()
+                self.journal = open(self.path, "w", encoding="utf-8")
+            self.attempts = 0
+            self.retry_at = 0.0
+            self.last_error = None
+            self.last_synced_at = time.time()
+
+    def _dead_letter(self, seq, updates, error):
+        with self.condition:
+            self.failed.append({"seq": seq, "updates": updates, "error": str(error), "at": time.time()})
+            self._rewrite_failed()
+        logger.error(json.dumps({"event": "write_dead_lettered", "seq": seq, "error": str(error)}))
+
+    def _backoff(self, error):
+        with self.condition:
+            self.attempts += 1
+            delay = backoff_delay(self.attempts)
+            self.retry_at = time.time() + delay
+            self.last_error = str(error)
+        logger.warning(json.dumps({"event": "write_retry", "attempt": self.attempts, "delay_s": round(delay, 2), "error": str(error)}))
+
+    def _next_group(self):
+        with self.condition:
+            while not self.pending or time.time() < self.retry_at:
+                timeout = max(self.retry_at - time.time(), 0) if self.pending else None
+                self.condition.wait(timeout)
+        time.sleep(WRITE_QUEUE_WINDOW)
+
+        with self.condition:
+            group = []
+            paths = 0
+            for seq, updates in self.pending[:WRITE_QUEUE_MAX_ENTRIES]:
+                if group and paths + len(updates) > WRITE_QUEUE_MAX_PATHS:
+                    break
+                group.append((seq, updates))
+                paths += len(updates)
+            return group
+
+    def _run(self):
+        while True:
+            try:
+                self._flush_group(self._next_group())
+                self._prune_changelog()
+            except Exception:
+                # Never let the worker die; the journal still holds everything
+                logger.exception("write queue worker error")
+                time.sleep(1)
+
+    def _prune_changelog(self):
+        # Every write logs a change log entry, so it is trimmed here whether or not a warm snapshot reads it
+        if time.time() - self.pruned_at < CHANGELOG_PRUNE_INTERVAL:
+            return
+        self.pruned_at = time.time()
+        try:
+            FirebaseDB.prune_changelog()
+        except Exception as e:
+            logger.warning(json.dumps({"event": "changelog_prune_failed", "error": str(e)}))
+
+    def _flush_group(self, group):
+        try:
+            FirebaseDB._update(coalesce_updates([updates for _, updates in group]))
+        except Exception as e:
+            if is_transient_error(e):
+                self._backoff(e)
+            else:
+                self._isolate(group)
         else:
-            return True, db.reference('/')
-            
-    except Exception as e:
-        st.error(f"🔥 Firebase initialization failed: {e}")
-        st.error("Please check your Firebase configuration!")
-        return False, None
+            self._ack([seq for seq, _ in group])
 
-# Initialize Firebase
-using_firebase, firebase_db = init_firebase()
+    def _isolate(self, group):
+        # A permanent failure in a coalesced group: replay entries one at a time to find the bad ones
+        for seq, updates in group:
+            try:
+                FirebaseDB._update(updates)
+            except Exception as e:
+                if is_transient_error(e):
+                    self._backoff(e)
+                    return
+                self._dead_letter(seq, updates, e)
+            self._ack([seq])
+
+@st.cache_resource
+def write_queue():
+    """The process-wide write queue and its flush worker"""
+    return WriteQueue(LEDGER_DATA_DIR)
+
+# Read layer: identical concurrent reads share one request, transient failures are retried
+READ_RETRIES = 3
+READ_MAX_BACKOFF = 2  # seconds
+
+class ReadError(Exception):
+    """A Firebase read failed; distinct from a read that found no data"""
+
+class Singleflight:
+    """Collapse concurrent identical requests into one in-flight call"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, func):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {"done": threading.Event(), "result": None, "error": None, "followers": 0}
+            else:
+                call["followers"] += 1
+
+        if leader:
+            try:
+                call["result"] = func()
+            except Exception as e:
+                call["error"] = e
+            finally:
+                # No follower can join once the call is removed, so the count is final here
+                with self.lock:
+                    del self.calls[key]
+                call["done"].set()
+        else:
+            call["done"].wait()
+            record_cache_lookup(True)
+
+        if call["error"] is not None:
+            raise call["error"]
+        # Session caches patch their trees in place, so with followers the shared result stays
+        # untouched and everyone, the leader included, gets a private copy
+        if leader and not call["followers"]:
+            return call["result"]
+        return copy.deepcopy(call["result"])
+
+@st.cache_resource
+def read_flights():
+    return Singleflight()
+
+def overlay_pending(path, value):
+    """Lay writes still waiting in the write queue over a value read directly from Firebase"""
+    if HEADLESS:
+        return value
+    parts = split_path(path)
+    copied = False
+    for updates in write_queue().pending_updates():
+        for update_path, update_value in updates.items():
+            update_parts = split_path(update_path)
+            if update_parts[:len(parts)] == parts:
+                if not copied:
+                    # The read result may be shared with other readers of the same flight
+                    value = copy.deepcopy(value)
+                    copied = True
+                relative = update_parts[len(parts):]
+                resolved = resolve_server_value(tree_get(value, relative), copy.deepcopy(update_value))
+                value = tree_set(value, relative, resolved)
+            elif parts[:len(update_parts)] == update_parts:
+                value = copy.deepcopy(tree_get(update_value, parts[len(update_parts):]))
+    return value
+
+# Date-sortable transaction keys: "YYYYMMDD-<push id>" orders by date, then by creation time
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+DATED_KEY_PATTERN = re.compile(r'^\d{8}-[-0-9A-Za-z_]{20}$')
+
+class PushIdGenerator:
+    """Firebase-style push ids: 8 timestamp chars and 12 random chars, monotonic within the process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_time = 0
+        self.last_random = [0] * 12
+
+    def next_id(self):
+        with self.lock:
+            now = max(int(time.time() * 1000), self.last_time)
+            if now == self.last_time:
+                # Same millisecond: bump the random part so ids keep increasing
+                for i in range(11, -1, -1):
+                    if self.last_random[i] != 63:
+                        self.last_random[i] += 1
+                        break
+                    self.last_random[i] = 0
+            else:
+                self.last_time = now
+                self.last_random = [random.randrange(64) for _ in range(12)]
+
+            stamp = []
+            for _ in range(8):
+                stamp.append(PUSH_CHARS[now % 64])
+                now //= 64
+            return "".join(reversed(stamp)) + "".join(PUSH_CHARS[i] for i in self.last_random)
+
+@st.cache_resource
+def push_ids():
+    return PushIdGenerator()
+
+def transaction_key(date_str):
+    return f"{date_str.replace('-', '')}-{push_ids().next_id()}"
+
+def is_dated_key(key):
+    return bool(DATED_KEY_PATTERN.match(key))
+
+def key_matches_date(key, date_str):
+    return is_dated_key(key) and key[:8] == date_str.replace('-', '')
+
+def ordered_transactions(transactions):
+    """(id, transaction) pairs in ledger order.
+
+    Date-prefixed keys order themselves; only legacy random keys need the date looked up."""
+    if all(is_dated_key(key) for key in transactions):
+        return sorted(transactions.items())
+    return sorted(transactions.items(), key=lambda item: (item[1].get('date', ''), item[0]))
+
+# Change log: every write touching a party or transaction tree also adds changelog/{key} listing the
+# party-level paths it changed, so a snapshot can catch up by re-reading just those subtrees.
+# Keys are "<UTC timestamp to the microsecond>-<push id>" and sort by time
+CHANGELOG_SKEW = datetime.timedelta(minutes=2)    # clock drift allowed between writing servers
+CHANGELOG_RETENTION = datetime.timedelta(days=7)  # entries kept for snapshots to catch up from
+CHANGELOG_PRUNE_INTERVAL = 3600                   # seconds between prunes by the write queue worker
+
+def changelog_key(moment=None):
+    moment = moment or datetime.datetime.now(datetime.timezone.utc)
+    return f"{moment.strftime('%Y%m%d%H%M%S%f')}-{push_ids().next_id()}"
+
+def changelog_moment(key):
+    return datetime.datetime.strptime(key[:20], '%Y%m%d%H%M%S%f').replace(tzinfo=datetime.timezone.utc)
+
+def stamp_changelog(updates):
+    """Give placeholder change log entries ("changelog/~<id>") their time key as they are sent.
+
+    Stamping at send time rather than enqueue time keeps writes that waited in the queue
+    from landing behind a snapshot's cursor."""
+    if not any(path.startswith("changelog/~") for path in updates):
+        return updates
+    return {
+        (f"changelog/{changelog_key()}" if path.startswith("changelog/~") else path): value
+        for path, value in updates.items()
+    }
+
+def warm_roots():
+    """Top-level trees kept in the warm snapshot: every party and transaction collection"""
+    return [root for entity_type in ENTITY_TYPES for root in (f"{entity_type}s", f"{entity_type}_transactions")]
+
+def changelog_paths(updates):
+    """Party-level paths under the warm roots that a multi-path update changes"""
+    roots = set(warm_roots())
+    return sorted({
+        "/".join(parts[:2])
+        for parts in map(split_path, updates)
+        if parts and parts[0] in roots
+    })
+
+# Year shards: {entity_type}_transactions/{entity_id}/{YYYY}/{key} bounds the width of a party node.
+# Readers accept flat and sharded parties alike; meta/sharded/{entity_type} tells writers which to use
+def is_year_shard(key):
+    return len(key) == 4 and key.isdigit()
+
+def flatten_party(node):
+    """{transaction_id: transaction} from a party node, whether flat, sharded by year or mid-migration"""
+    if not node:
+        return {}
+    if not any(is_year_shard(key) for key in node):
+        return node
+    flat = {}
+    for key, value in node.items():
+        if is_year_shard(key):
+            flat.update(value or {})
+        else:
+            flat[key] = value
+    return flat
+
+def latest_transactions(tagged_transactions, limit):
+    """Most recent transactions first, without sorting the whole book"""
+    return heapq.nlargest(limit, tagged_transactions, key=lambda t: (t.get('date', ''), t.get('id', '')))
+
+# Monthly checkpoints: checkpoints/{entity_type}/{entity_id}/{YYYY-MM} holds that month's
+# debit/credit totals and line count in integer cents; balances are the running sum of monthly nets
+def to_cents(amount):
+    try:
+        return int(round(float(amount or 0) * 100))
+    except (TypeError, ValueError):
+        return 0
+
+def transaction_month(transaction):
+    month = (transaction or {}).get('date', '')[:7]
+    return month if len(month) == 7 else None
+
+def checkpoint_updates(entity_type, entity_id, changes):
+    """Checkpoint updates for a list of (old, new) transaction pairs of one party.
+
+    Every field is a server-side increment, so concurrent writers (or one working from a stale
+    cache) never overwrite each other's totals; closing balances are summed at read time."""
+    deltas = {}
+    for old, new in changes:
+        for transaction, sign in ((old, -1), (new, 1)):
+            month = transaction_month(transaction)
+            if not month:
+                continue
+            delta = deltas.setdefault(month, [0, 0, 0])
+            delta[0] += sign * to_cents(transaction.get('debit'))
+            delta[1] += sign * to_cents(transaction.get('credit'))
+            delta[2] += sign
+
+    base = f"checkpoints/{entity_type}/{entity_id}"
+    updates = {}
+    for month, (debit, credit, count) in deltas.items():
+        for field, value in (('debit_cents', debit), ('credit_cents', credit), ('count', count)):
+            if value:
+                updates[f"{base}/{month}/{field}"] = increment(value)
+    return updates
+
+# Daily rollups: daily_totals/{YYYY-MM-DD}/{entity_type} holds that day's debit/credit sums and line count
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+def daily_total_updates(entity_type, changes):
+    """Server-side increments of the daily rollups for (old, new) transaction pairs of any parties"""
+    deltas = {}
+    for old, new in changes:
+        for transaction, sign in ((old, -1), (new, 1)):
+            date = (transaction or {}).get('date', '')
+            if not DATE_PATTERN.match(date):
+                continue
+            delta = deltas.setdefault(date, [0, 0, 0])
+            delta[0] += sign * to_cents(transaction.get('debit'))
+            delta[1] += sign * to_cents(transaction.get('credit'))
+            delta[2] += sign
+
+    updates = {}
+    for date, (debit, credit, count) in deltas.items():
+        for field, value in (('debit_cents', debit), ('credit_cents', credit), ('count', count)):
+            if value:
+                updates[f"daily_totals/{date}/{entity_type}/{field}"] = increment(value)
+    return updates
+
+# Duplicate detection: txn_hashes/{entity_type}/{entity_id}/{fingerprint}/{transaction_id} = True
+WORD_PATTERN = re.compile(r'\w+')
+
+def _fingerprint(date, debit_cents, credit_cents, particular):
+    words = " ".join(WORD_PATTERN.findall(particular.lower()))
+    content = f"{date}|{debit_cents}|{credit_cents}|{words}"
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()[:20]
+
+def transaction_fingerprint(transaction):
+    """Content hash of date, amounts and particulars (case, spacing and punctuation ignored)"""
+    return _fingerprint(
+        str(transaction.get('date', '')),
+        to_cents(transaction.get('debit')),
+        to_cents(transaction.get('credit')),
+        str(transaction.get('particular', ''))
+    )
+
+def frame_fingerprints(df):
+    """transaction_fingerprint for every row of a transactions DataFrame"""
+    return pd.Series([
+        _fingerprint(date, int(debit), int(credit), particular)
+        for date, debit, credit, particular in zip(
+            df["date"].astype(str),
+            (df["debit"] * 100).round().astype("int64"),
+            (df["credit"] * 100).round().astype("int64"),
+            df["particular"].astype(str)
+        )
+    ], index=df.index, dtype=object)
+
+def scan_fingerprints(transactions):
+    """{fingerprint: {transaction_id: True}} computed from a party's {transaction_id: transaction}"""
+    fingerprints = {}
+    for transaction_id, transaction in (transactions or {}).items():
+        if isinstance(transaction, dict):
+            fingerprints.setdefault(transaction_fingerprint(transaction), {})[transaction_id] = True
+    return fingerprints
+
+def fingerprint_updates(entity_type, entity_id, removed=None, added=None):
+    """Hash index entries to drop for removed and add for added {transaction_id: transaction}"""
+    updates = {}
+    for transactions, value in ((removed, None), (added, True)):
+        for transaction_id, transaction in (transactions or {}).items():
+            if isinstance(transaction, dict):
+                updates[f"txn_hashes/{entity_type}/{entity_id}/{transaction_fingerprint(transaction)}/{transaction_id}"] = value
+    return updates
+
+def checkpoint_net_cents(record):
+    record = record or {}
+    return int(record.get('credit_cents') or 0) - int(record.get('debit_cents') or 0)
+
+def opening_balance_cents(checkpoints, month):
+    """Sum of the nets of every checkpoint before month, i.e. that month's opening balance"""
+    return sum(checkpoint_net_cents(record) for m, record in (checkpoints or {}).items() if m < month)
+
+def closing_balance(checkpoints):
+    """Current balance of a party from the nets of all its checkpoints"""
+    return sum(checkpoint_net_cents(record) for record in (checkpoints or {}).values()) / 100
+
+def closing_balances_cents(checkpoints):
+    """{month: closing balance in cents} from the running sum of monthly nets"""
+    closings = {}
+    running = 0
+    for month in sorted(checkpoints or {}):
+        running += checkpoint_net_cents(checkpoints[month])
+        closings[month] = running
+    return closings
+
+# Full-text search: a process-wide inverted index from particulars tokens to transactions
+SEARCH_RESULT_LIMIT = 50
+TOKEN_PATTERN = re.compile(r'[0-9a-z]+')
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(str(text or '').lower())
+
+class SearchIndex:
+    """Inverted index over transaction particulars, kept current by the writes it observes.
+
+    Documents are keyed (entity_type, entity_id, transaction_id). version is the data
+    version the index reflects; None means it has to be rebuilt."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version = None
+        self.postings = {}   # term -> {doc key: term frequency}
+        self.terms = []      # sorted terms, for prefix lookups
+        self.docs = {}       # doc key -> transaction
+        self.by_party = {}   # (entity_type, entity_id) -> set of transaction ids
+
+    def rebuild(self, version, documents):
+        with self.lock:
+            self.postings, self.terms, self.docs, self.by_party = {}, [], {}, {}
+            for key, transaction in documents:
+                self._add(key, transaction)
+            self.terms = sorted(self.postings)
+            self.version = version
+
+    def invalidate(self):
+        with self.lock:
+            self.version = None
+
+    def _add(self, key, transaction, keep_sorted=False):
+        self.docs[key] = transaction
+        self.by_party.setdefault(key[:2], set()).add(key[2])
+        for term in tokenize(transaction.get('particular')):
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                if keep_sorted:
+                    bisect.insort(self.terms, term)
+            postings[key] = postings.get(key, 0) + 1
+
+    def _remove(self, key):
+        transaction = self.docs.pop(key, None)
+        if transaction is None:
+            return
+        self.by_party.get(key[:2], set()).discard(key[2])
+        for term in set(tokenize(transaction.get('particular'))):
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(key, None)
+            if not postings:
+                del self.postings[term]
+                position = bisect.bisect_left(self.terms, term)
+                if position < len(self.terms) and self.terms[position] == term:
+                    del self.terms[position]
+
+    def _replace_party(self, entity_type, entity_id, node, year=None):
+        """Replace a party's documents, or only those of one year shard"""
+        for trans_id in list(self.by_party.get((entity_type, entity_id), ())):
+            if year is None or trans_id.startswith(year):
+                self._remove((entity_type, entity_id, trans_id))
+        for trans_id, transaction in flatten_party(node).items():
+            if isinstance(transaction, dict):
+                self._add((entity_type, entity_id, trans_id), transaction, keep_sorted=True)
+
+    def observe(self, updates):
+        """Apply a multi-path update that has just been written"""
+        with self.lock:
+            if self.version is None:
+                return
+            for path, value in updates.items():
+                parts = split_path(path)
+                if not parts or not parts[0].endswith("_transactions"):
+                    continue
+                entity_type = parts[0][:-len("_transactions")]
+                if len(parts) == 1:
+                    for party in [p for p in self.by_party if p[0] == entity_type]:
+                        self._replace_party(entity_type, party[1], None)
+                    for entity_id, transactions in (value or {}).items():
+                        self._replace_party(entity_type, entity_id, transactions)
+                elif len(parts) == 2:
+                    self._replace_party(entity_type, parts[1], value)
+                elif len(parts) == 3 and is_year_shard(parts[2]):
+                    self._replace_party(entity_type, parts[1], value, year=parts[2])
+                elif len(parts) == 3 or (len(parts) == 4 and is_year_shard(parts[2])):
+                    key = (entity_type, parts[1], parts[-1])
+                    self._remove(key)
+                    if isinstance(value, dict):
+                        self._add(key, value, keep_sorted=True)
+                else:
+                    # Field-level writes are not tracked; rebuild on next use
+                    self.version = None
+                    return
+            if "meta/data_version" in updates:
+                self.version += 1
+
+    def _matching_terms(self, token):
+        start = bisect.bisect_left(self.terms, token)
+        for term in itertools.islice(self.terms, start, None):
+            if not term.startswith(token):
+                break
+            # Whole-word matches outrank prefix matches
+            yield term, 1.0 if term == token else 0.5
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        """Ranked (score, key, transaction) hits containing every query token, or a prefix of it"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self.lock:
+            total = max(len(self.docs), 1)
+            scores = None
+            for token in tokens:
+                token_scores = {}
+                for term, weight in self._matching_terms(token):
+                    postings = self.postings[term]
+                    idf = math.log(1 + total / len(postings))
+                    for key, frequency in postings.items():
+                        token_scores[key] = token_scores.get(key, 0.0) + weight * frequency * idf
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {key: score + token_scores[key] for key, score in scores.items() if key in token_scores}
+                if not scores:
+                    return []
+
+            best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], self.docs[item[0]].get('date', '')))
+            return [(score, key, self.docs[key]) for key, score in best]
+
+@st.cache_resource
+def search_index():
+    return SearchIndex()
 
 # Firebase Database Operations Class
 class FirebaseDB:
+    @staticmethod
+    def _call(op, path, func, payload=None):
+        """Run one Firebase request, recording latency and payload size"""
+        started = time.perf_counter()
+        result = None
+        ok = False
+        try:
+            result = func()
+            ok = True
+            return result
+        finally:
+            # Metrics must never turn a finished request into a failure
+            try:
+                size = payload_size(result if op == "get" else payload)
+                record_call(op, path, (time.perf_counter() - started) * 1000, size, ok)
+            except Exception:
+                logger.warning("could not record Firebase call metrics", exc_info=True)
+
+    @staticmethod
+    def _get(path, **kwargs):
+        return FirebaseDB._call("get", path, lambda: root_ref().child(path).get(**kwargs))
+
+    @staticmethod
+    def _query(path, start=None, end=None, last=None):
+        """Key-ordered query; results come back already sorted by key"""
+        def run():
+            query = root_ref().child(path).order_by_key()
+            if start is not None:
+                query = query.start_at(start)
+            if end is not None:
+                query = query.end_at(end)
+            if last is not None:
+                query = query.limit_to_last(last)
+            return query.get()
+        return FirebaseDB._call("query", path, run)
+
+    @staticmethod
+    def _transaction(path, update):
+        """Compare-and-set update of one node; update(current) may run again on a conflict"""
+        return FirebaseDB._call("transaction", path, lambda: root_ref().child(path).transaction(update))
+
+    @staticmethod
+    def _set(path, value):
+        return FirebaseDB._call("set", path, lambda: root_ref().child(path).set(value), value)
+
+    @staticmethod
+    def _update(updates):
+        return FirebaseDB._call("update", "/", lambda: root_ref().update(stamp_changelog(updates)), updates)
+
+    @staticmethod
+    def _send(updates):
+        """Synchronous update with jittered retries, for batch jobs that bypass the write queue"""
+        for attempt_number in range(READ_RETRIES + 1):
+            try:
+                return FirebaseDB._update(updates)
+            except Exception as e:
+                if attempt_number == READ_RETRIES or not is_transient_error(e):
+                    raise
+                time.sleep(backoff_delay(attempt_number, cap=READ_MAX_BACKOFF))
+
+    @staticmethod
+    def _delete(path):
+        return FirebaseDB._call("delete", path, lambda: root_ref().child(path).delete())
+
+    @staticmethod
+    def _read(key, path, request):
+        """Deduplicated read with jittered retries; raises ReadError once retries are exhausted"""
+        def attempt():
+            for attempt_number in range(READ_RETRIES + 1):
+                try:
+                    return request()
+                except Exception as e:
+                    if attempt_number == READ_RETRIES or not is_transient_error(e):
+                        raise ReadError(f"{path}: {e}") from e
+                    time.sleep(backoff_delay(attempt_number, cap=READ_MAX_BACKOFF))
+
+        return read_flights().do(key, attempt)
+
+    @staticmethod
+    def _fetch(path, **kwargs):
+        # Whole party and transaction collections come from the warm snapshot when it is enabled
+        if not kwargs:
+            snapshot = warm_cache()
+            if snapshot is not None and path in snapshot.roots:
+                return snapshot.get(path)
+        return FirebaseDB._fetch_remote(path, **kwargs)
+
+    @staticmethod
+    def _fetch_remote(path, **kwargs):
+        return FirebaseDB._read(("get", path, tuple(sorted(kwargs.items()))), path, lambda: FirebaseDB._get(path, **kwargs))
+
+    @staticmethod
+    def _cached_get(path):
+        """Read through the session cache, serving subtrees of cached ancestors"""
+        cache = data_cache()
+        if cache is None:
+            return FirebaseDB._fetch(path)
+
+        now = time.time()
+        parts = split_path(path)
+        stale = None
+        for key, entry in list(cache.items()):
+            key_parts = split_path(key)
+            if parts[:len(key_parts)] != key_parts:
+                continue
+            # Entries fresh when this rerun started stay valid for the whole rerun;
+            # expired ones are kept as a fallback until a fresh read succeeds
+            if _script_started_at - entry["at"] > DATA_CACHE_TTL:
+                stale = stale or (key_parts, entry)
+                continue
+            record_cache_lookup(True)
+            return tree_get(entry["value"], parts[len(key_parts):])
+
+        record_cache_lookup(False)
+        try:
+            value = FirebaseDB._fetch(path)
+        except ReadError:
+            if stale is None:
+                raise
+            # Firebase is unreachable: keep serving the last copy and let the page say it is stale
+            key_parts, entry = stale
+            stale_reads()[path] = entry["at"]
+            return tree_get(entry["value"], parts[len(key_parts):])
+        for key in [k for k in cache if split_path(k)[:len(parts)] == parts]:
+            del cache[key]
+        cache[path] = {"value": value, "at": now}
+
+        # Writes still waiting in the queue are not in Firebase yet; lay them over the fresh copy
+        for updates in write_queue().pending_updates():
+            apply_local(updates, keys=[path])
+        return cache[path]["value"]
+
+    @staticmethod
+    def _write(updates):
+        """Apply a multi-path update to the local cache, then journal it for the write queue.
+
+        Every write bumps meta/data_version and logs the party trees it touches under
+        changelog for the warm snapshot. If the update cannot be journaled the local
+        changes are rolled back and the exception re-raised. Headless batch jobs send the
+        update directly and wait for Firebase to confirm it."""
+        updates = {**updates, "meta/data_version": increment(1)}
+        changed = changelog_paths(updates)
+        # An update that clears the whole change log cannot also add to it
+        if changed and "changelog" not in updates:
+            updates[f"changelog/~{push_ids().next_id()}"] = {"paths": changed}
+        if HEADLESS:
+            FirebaseDB._send(updates)
+            return
+        undo = apply_local(updates)
+        try:
+            write_queue().enqueue(updates)
+        except Exception:
+            rollback_local(undo)
+            raise
+        search_index().observe(updates)
+
     @staticmethod
     def load_settings():
         if using_firebase:
             try:
-                settings_ref = firebase_db.child("settings")
-                settings = settings_ref.get()
+                settings = FirebaseDB._fetch("settings")
                 if not settings:
                     # Default settings
                     default_settings = {
@@ -81,11 +1232,11 @@ class FirebaseDB:
                         "auto_calculate_balance": True,
                         "notification_enabled": True
                     }
-                    settings_ref.set(default_settings)
+                    FirebaseDB._set("settings", default_settings)
                     return default_settings
                 return settings
             except Exception as e:
-                st.error(f"Error loading settings: {e}")
+                report_error(f"Error loading settings: {e}")
         
         # Fallback default settings
         return {
@@ -99,129 +1250,643 @@ class FirebaseDB:
     def save_settings(settings_data):
         if using_firebase:
             try:
-                firebase_db.child("settings").set(settings_data)
+                FirebaseDB._write({"settings": settings_data})
                 return True
             except Exception as e:
-                st.error(f"Error saving settings: {e}")
+                report_error(f"Error saving settings: {e} — nothing was saved and the change was undone.")
                 return False
         return False
     
     @staticmethod
-    def load_customers():
-        if using_firebase:
-            try:
-                customers = firebase_db.child("customers").get()
-                return customers if customers else {}
-            except Exception as e:
-                st.error(f"Error loading customers: {e}")
-        return {}
+    def load_parties(entity_type):
+        """Load all customers or suppliers; raises ReadError if the read fails"""
+        parties = FirebaseDB._cached_get(f"{entity_type}s")
+        return parties if parties else {}
     
     @staticmethod
-    def save_customer(customer_id, customer_data):
+    def save_party(entity_type, party_id, party_data):
         if using_firebase:
             try:
-                firebase_db.child("customers").child(customer_id).set(customer_data)
+                FirebaseDB._write({f"{entity_type}s/{party_id}": party_data})
                 return True
             except Exception as e:
-                st.error(f"Error saving customer: {e}")
+                report_error(f"Error saving {entity_type}: {e} — nothing was saved and the change was undone.")
                 return False
         return False
     
     @staticmethod
-    def delete_customer(customer_id):
+    def create_party(entity_type, party_id, party_data):
+        """Add a party and bump its meta/counts entry in the same atomic update"""
         if using_firebase:
             try:
-                firebase_db.child("customers").child(customer_id).delete()
-                firebase_db.child("customer_transactions").child(customer_id).delete()
+                FirebaseDB._write({
+                    f"{entity_type}s/{party_id}": party_data,
+                    f"meta/counts/{entity_type}s": increment(1)
+                })
                 return True
             except Exception as e:
-                st.error(f"Error deleting customer: {e}")
+                report_error(f"Error saving {entity_type}: {e} — nothing was saved and the change was undone.")
                 return False
         return False
     
     @staticmethod
-    def load_suppliers():
+    def party_deletion_updates(entity_type, party_id, transactions=None):
+        """Multi-path update deleting a party with its transactions, checkpoints, hash index and counter.
+
+        Its live and archived transactions (live ones may be passed in) leave the daily rollups with it."""
+        if transactions is None:
+            transactions = FirebaseDB.load_transactions(entity_type, party_id)
+        if FirebaseDB.archive_boundary(entity_type):
+            archived = archive_to_transactions(read_archive(entity_type, entity_ids=[party_id])).get(party_id, {})
+            transactions = {**archived, **transactions}
+        return {
+            f"{entity_type}s/{party_id}": None,
+            f"{entity_type}_transactions/{party_id}": None,
+            f"checkpoints/{entity_type}/{party_id}": None,
+            f"txn_hashes/{entity_type}/{party_id}": None,
+            f"meta/counts/{entity_type}s": increment(-1),
+            **daily_total_updates(entity_type, [(t, None) for t in transactions.values() if isinstance(t, dict)])
+        }
+
+    @staticmethod
+    def delete_party(entity_type, party_id):
+        """Delete a party together with its transactions in one multi-path update.
+
+        Its rows are then dropped from this host's archive files as well."""
         if using_firebase:
             try:
-                suppliers = firebase_db.child("suppliers").get()
-                return suppliers if suppliers else {}
+                FirebaseDB._write(FirebaseDB.party_deletion_updates(entity_type, party_id))
             except Exception as e:
-                st.error(f"Error loading suppliers: {e}")
-        return {}
+                report_error(f"Error deleting {entity_type}: {e} — nothing was saved and the change was undone.")
+                return False
+            try:
+                purge_archive(entity_type, party_id)
+            except Exception as e:
+                # Reads already skip parties that no longer exist; the files are only tidied
+                logger.warning(json.dumps({"event": "archive_purge_failed", "entity_type": entity_type, "error": str(e)}))
+            return True
+        return False
     
     @staticmethod
-    def save_supplier(supplier_id, supplier_data):
-        if using_firebase:
+    def count_parties(entity_type):
+        """Count parties from shallow keys only, without downloading their records"""
+        keys = FirebaseDB._fetch(f"{entity_type}s", shallow=True)
+        return len(keys) if keys else 0
+    
+    @staticmethod
+    def load_counts():
+        """Party counts from meta/counts, seeding missing entries with a shallow count.
+
+        The seed is a Firebase transaction that only writes when the counter is still absent, so
+        an increment that lands first is never overwritten; Verify Data checks the counters."""
+        counts = dict(FirebaseDB._cached_get("meta/counts") or {})
+        for entity_type in ENTITY_TYPES:
+            collection = f"{entity_type}s"
+            if collection in counts:
+                continue
+            path = f"meta/counts/{collection}"
+            seed = FirebaseDB.count_parties(entity_type)
             try:
-                firebase_db.child("suppliers").child(supplier_id).set(supplier_data)
-                return True
+                # Increments still queued here land after the seed and are counted on top of it
+                counts[collection] = FirebaseDB._transaction(path, lambda current, seed=seed: seed if current is None else current)
+                apply_local({path: counts[collection]})
             except Exception as e:
-                st.error(f"Error saving supplier: {e}")
-                return False
-        return False
+                counts[collection] = seed
+                logger.warning(json.dumps({"event": "count_seed_failed", "path": path, "error": str(e)}))
+        return {entity_type: int(counts.get(f"{entity_type}s") or 0) for entity_type in ENTITY_TYPES}
     
     @staticmethod
-    def delete_supplier(supplier_id):
+    def rebuild_counts():
+        """Recount every party collection with shallow reads and overwrite meta/counts"""
         if using_firebase:
             try:
-                firebase_db.child("suppliers").child(supplier_id).delete()
-                firebase_db.child("supplier_transactions").child(supplier_id).delete()
+                FirebaseDB._write({"meta/counts": {
+                    f"{entity_type}s": FirebaseDB.count_parties(entity_type) for entity_type in ENTITY_TYPES
+                }})
                 return True
             except Exception as e:
-                st.error(f"Error deleting supplier: {e}")
+                report_error(f"Error rebuilding counts: {e}")
                 return False
         return False
     
     @staticmethod
-    def load_transactions(entity_type, entity_id):
-        if using_firebase:
-            try:
-                transactions = firebase_db.child(f"{entity_type}_transactions").child(entity_id).get()
-                return transactions if transactions else {}
-            except Exception as e:
-                st.error(f"Error loading transactions: {e}")
-        return {}
+    def shard_state(entity_type):
+        """None for flat parties, "migrating" while the shard migration runs, "done" once every party is sharded"""
+        return FirebaseDB._cached_get(f"meta/sharded/{entity_type}")
+
+    @staticmethod
+    def transaction_paths(entity_type, entity_id, transaction_id):
+        """Paths a transaction may live at; the last one is where it is written"""
+        base = f"{entity_type}_transactions/{entity_id}"
+        state = FirebaseDB.shard_state(entity_type)
+        sharded = f"{base}/{transaction_id[:4]}/{transaction_id}"
+        if not state or not is_dated_key(transaction_id):
+            return [f"{base}/{transaction_id}"]
+        if state == "migrating":
+            return [f"{base}/{transaction_id}", sharded]
+        return [sharded]
+
+    @staticmethod
+    def transaction_path(entity_type, entity_id, transaction_id):
+        return FirebaseDB.transaction_paths(entity_type, entity_id, transaction_id)[-1]
+
+    @staticmethod
+    def transaction_updates(entity_type, entity_id, transaction_id, transaction_data):
+        """Multi-path update writing (or with None, deleting) a transaction wherever it may live"""
+        paths = FirebaseDB.transaction_paths(entity_type, entity_id, transaction_id)
+        updates = dict.fromkeys(paths[:-1])
+        updates[paths[-1]] = transaction_data
+        return updates
+
+    @staticmethod
+    def load_transactions(entity_type, entity_id):
+        """Every transaction of one party, flattened across year shards"""
+        return flatten_party(FirebaseDB._cached_get(f"{entity_type}_transactions/{entity_id}"))
     
     @staticmethod
-    def save_transaction(entity_type, entity_id, transaction_id, transaction_data):
+    def load_transaction(entity_type, entity_id, transaction_id):
+        """One transaction, read from the path its key maps to (the year shard for sharded books)"""
+        for path in reversed(FirebaseDB.transaction_paths(entity_type, entity_id, transaction_id)):
+            transaction = FirebaseDB._cached_get(path)
+            if isinstance(transaction, dict):
+                return transaction
+        return None
+
+    @staticmethod
+    def load_all_transactions(entity_type):
+        """Load the transactions of every party of one entity type in a single read"""
+        transactions = FirebaseDB._cached_get(f"{entity_type}_transactions")
+        return {entity_id: flatten_party(node) for entity_id, node in transactions.items()} if transactions else {}
+
+    @staticmethod
+    def load_transaction_years(entity_type, entity_id):
+        """Years with a shard for one party, from a shallow read of the party node"""
+        path = f"{entity_type}_transactions/{entity_id}"
+        keys = FirebaseDB._read(("shallow", path), path, lambda: FirebaseDB._get(path, shallow=True)) or {}
+        return sorted((key for key in keys if is_year_shard(key)), reverse=True)
+
+    @staticmethod
+    def _query_range(path, start, end, last=None):
+        transactions = FirebaseDB._read(
+            ("range", path, start, end, last), path, lambda: FirebaseDB._query(path, start=start, end=end, last=last)
+        )
+        # Queued writes are not in Firebase yet; merge them in and keep the range
+        transactions = overlay_pending(path, transactions) or {}
+        return {
+            key: transaction for key, transaction in transactions.items()
+            if not is_year_shard(key) and (start is None or key >= start) and (end is None or key <= end)
+        }
+
+    @staticmethod
+    def load_transactions_range(entity_type, entity_id, start_date=None, end_date=None):
+        """Transactions dated between start_date and end_date (inclusive) via key range queries.
+
+        Sharded parties only query the year shards the range covers."""
+        start = start_date.strftime('%Y%m%d') if start_date else None
+        end = f"{end_date.strftime('%Y%m%d')}~" if end_date else None  # "~" sorts after every push id char
+        path = f"{entity_type}_transactions/{entity_id}"
+        state = FirebaseDB.shard_state(entity_type)
+
+        if not state:
+            return FirebaseDB._query_range(path, start, end)
+        if state == "migrating":
+            # Parties may be half moved; filter the whole party instead
+            return {
+                key: transaction for key, transaction in FirebaseDB.load_transactions(entity_type, entity_id).items()
+                if (start is None or key >= start) and (end is None or key <= end)
+            }
+
+        if start_date and end_date:
+            years = [str(year) for year in range(start_date.year, end_date.year + 1)]
+        else:
+            years = [
+                year for year in FirebaseDB.load_transaction_years(entity_type, entity_id)
+                if (not start_date or int(year) >= start_date.year) and (not end_date or int(year) <= end_date.year)
+            ]
+        transactions = {}
+        for year in years:
+            transactions.update(FirebaseDB._query_range(f"{path}/{year}", start, end))
+        return transactions
+
+    @staticmethod
+    def keys_in_date_order(entity_type):
+        """True once every key of the book is date-prefixed, so key order is date order.
+
+        Sharding rekeys legacy keys, and checkpoints are only marked ready with no undated keys left."""
+        return FirebaseDB.shard_state(entity_type) == "done" or FirebaseDB.checkpoints_ready(entity_type)
+
+    @staticmethod
+    def load_latest_transactions(entity_type, entity_id, limit):
+        """The newest transactions of a party via limit-to-last key queries, newest shard first"""
+        path = f"{entity_type}_transactions/{entity_id}"
+        state = FirebaseDB.shard_state(entity_type)
+        if state == "migrating":
+            return dict(sorted(FirebaseDB.load_transactions(entity_type, entity_id).items())[-limit:])
+        if not state:
+            return dict(sorted(FirebaseDB._query_range(path, None, None, last=limit).items())[-limit:])
+
+        transactions = {}
+        for year in FirebaseDB.load_transaction_years(entity_type, entity_id):
+            transactions.update(FirebaseDB._query_range(f"{path}/{year}", None, None, last=limit - len(transactions)))
+            if len(transactions) >= limit:
+                break
+        return dict(sorted(transactions.items())[-limit:])
+
+    @staticmethod
+    def load_checkpoints(entity_type, entity_id=None):
+        """Monthly checkpoints of one party, or of every party of the entity type"""
+        path = f"checkpoints/{entity_type}" + (f"/{entity_id}" if entity_id else "")
+        checkpoints = FirebaseDB._cached_get(path)
+        return checkpoints if checkpoints else {}
+
+    @staticmethod
+    def checkpoints_ready(entity_type):
+        """Checkpoints are only trusted once a full rebuild has seeded them"""
+        return bool(FirebaseDB._cached_get(f"meta/checkpoints/{entity_type}"))
+
+    @staticmethod
+    def prune_changelog():
+        """Drop change log entries past the retention window; snapshots older than the floor reload in full"""
+        floor = (datetime.datetime.now(datetime.timezone.utc) - CHANGELOG_RETENTION).strftime('%Y%m%d%H%M%S%f')
+        old = FirebaseDB._read(
+            ("range", "changelog", None, floor, None), "changelog", lambda: FirebaseDB._query("changelog", end=floor)
+        ) or {}
+        if old:
+            FirebaseDB._write({"meta/changelog_floor": floor, **{f"changelog/{key}": None for key in old}})
+        return len(old)
+
+    @staticmethod
+    def data_version():
+        """Counter bumped by every write, used to tell when derived data is out of date"""
+        return int(FirebaseDB._cached_get("meta/data_version") or 0)
+
+    @staticmethod
+    def archive_boundary(entity_type):
+        """Date (YYYY-MM-DD) before which transactions live in the local archive, or None"""
+        return FirebaseDB._cached_get(f"meta/archive/{entity_type}")
+
+    @staticmethod
+    def aggregate_updates(entity_type, entity_id, changes):
+        """Derived-data updates (monthly checkpoints, daily rollups) for (old, new) transaction pairs of one party"""
+        return {
+            **checkpoint_updates(entity_type, entity_id, changes),
+            **daily_total_updates(entity_type, changes)
+        }
+
+    @staticmethod
+    def fingerprints_ready():
+        return bool(FirebaseDB._cached_get("meta/txn_hashes"))
+
+    @staticmethod
+    def load_fingerprints(entity_type, entity_id):
+        """{fingerprint: {transaction_id: True}} of one party, including writes still queued.
+
+        Until the hash index has been built it is computed from the party's transactions instead."""
+        if not FirebaseDB.fingerprints_ready():
+            return scan_fingerprints(FirebaseDB.load_transactions(entity_type, entity_id))
+        path = f"txn_hashes/{entity_type}/{entity_id}"
+        return overlay_pending(path, FirebaseDB._fetch(path)) or {}
+
+    @staticmethod
+    def find_duplicates(entity_type, entity_id, transaction, exclude_id=None):
+        """Ids of the party's transactions with the same content as transaction, from one hash lookup
+        (or a scan of the party while the hash index is not built)"""
+        fingerprint = transaction_fingerprint(transaction)
+        if FirebaseDB.fingerprints_ready():
+            path = f"txn_hashes/{entity_type}/{entity_id}/{fingerprint}"
+            matches = overlay_pending(path, FirebaseDB._fetch(path)) or {}
+        else:
+            matches = scan_fingerprints(FirebaseDB.load_transactions(entity_type, entity_id)).get(fingerprint, {})
+        return sorted(transaction_id for transaction_id in matches if transaction_id != exclude_id)
+
+    @staticmethod
+    def rebuild_fingerprints():
+        """Rebuild the duplicate-detection hash index from the live and archived history"""
         if using_firebase:
             try:
-                firebase_db.child(f"{entity_type}_transactions").child(entity_id).child(transaction_id).set(transaction_data)
+                df = book_frame()
+                df = df.assign(fingerprint=frame_fingerprints(df))
+                tree = {}
+                for entity_type, entity_id, fingerprint, transaction_id in zip(
+                    df["entity_type"], df["entity_id"], df["fingerprint"], df["id"]
+                ):
+                    tree.setdefault(entity_type, {}).setdefault(entity_id, {}).setdefault(fingerprint, {})[transaction_id] = True
+
+                FirebaseDB._write({
+                    "txn_hashes": tree,
+                    "meta/txn_hashes": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                })
                 return True
             except Exception as e:
-                st.error(f"Error saving transaction: {e}")
+                report_error(f"Error rebuilding duplicate index: {e}")
                 return False
         return False
-    
+
+    @staticmethod
+    def daily_totals_ready():
+        return bool(FirebaseDB._cached_get("meta/daily_totals"))
+
+    @staticmethod
+    def load_daily_totals(start_date, end_date):
+        """{date: {entity_type: totals}} for the days between start_date and end_date via one key range query"""
+        return FirebaseDB._query_range("daily_totals", start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+
+    @staticmethod
+    def rebuild_daily_totals():
+        """Backfill every daily rollup from the full transaction history of both books"""
+        if using_firebase:
+            try:
+                df = book_frame()
+                df = df[df["date"].astype(str).str.match(DATE_PATTERN.pattern)]
+                df = df.assign(
+                    debit_cents=(df["debit"] * 100).round().astype("int64"),
+                    credit_cents=(df["credit"] * 100).round().astype("int64")
+                )
+                daily = df.groupby(["date", "entity_type"], sort=True).agg(
+                    debit_cents=("debit_cents", "sum"),
+                    credit_cents=("credit_cents", "sum"),
+                    count=("id", "size")
+                )
+
+                tree = {}
+                for (date, entity_type), debit, credit, count in zip(
+                    daily.index, daily["debit_cents"], daily["credit_cents"], daily["count"]
+                ):
+                    tree.setdefault(date, {})[entity_type] = {
+                        'debit_cents': int(debit),
+                        'credit_cents': int(credit),
+                        'count': int(count)
+                    }
+
+                FirebaseDB._write({
+                    "daily_totals": tree,
+                    "meta/daily_totals": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                })
+                return True
+            except Exception as e:
+                report_error(f"Error rebuilding daily totals: {e}")
+                return False
+        return False
+
+    @staticmethod
+    def rebuild_checkpoints(entity_type):
+        """Recompute every monthly checkpoint of one entity type from the full transaction history.
+
+        Period reads use key ranges, so checkpoints are only marked ready once every live key is dated."""
+        if using_firebase:
+            try:
+                # Live-only totals would drop every archived period's balance for good
+                missing = archive_unavailable(entity_type)
+                if missing:
+                    report_error(f"{missing} Checkpoints were not rebuilt; run the rebuild where the archive is.")
+                    return False
+
+                df = transactions_frame(FirebaseDB.load_all_transactions(entity_type))
+                legacy = int((~df["id"].str.match(DATED_KEY_PATTERN.pattern)).sum())
+                if FirebaseDB.archive_boundary(entity_type):
+                    # Live rows win over archived copies of the same transaction
+                    df = pd.concat([read_archive(entity_type), df], ignore_index=True)
+                    df = df.drop_duplicates(["entity_id", "id"], keep="last")
+                df["month"] = df["date"].str[:7]
+                df = df[df["month"].str.match(r'^\d{4}-\d{2}$')]
+                df["debit_cents"] = (df["debit"] * 100).round().astype("int64")
+                df["credit_cents"] = (df["credit"] * 100).round().astype("int64")
+
+                monthly = df.groupby(["entity_id", "month"], sort=True).agg(
+                    debit_cents=("debit_cents", "sum"),
+                    credit_cents=("credit_cents", "sum"),
+                    count=("id", "size")
+                )
+
+                tree = {}
+                for (entity_id, month), debit, credit, count in zip(
+                    monthly.index, monthly["debit_cents"], monthly["credit_cents"], monthly["count"]
+                ):
+                    tree.setdefault(entity_id, {})[month] = {
+                        'debit_cents': int(debit),
+                        'credit_cents': int(credit),
+                        'count': int(count)
+                    }
+
+                FirebaseDB._write({
+                    f"checkpoints/{entity_type}": tree,
+                    f"meta/checkpoints/{entity_type}": None if legacy else datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                })
+                if legacy:
+                    report_error(f"{legacy} {entity_type} transactions still have undated keys. Run the key migration, "
+                                 "then rebuild the checkpoints again.")
+                    return False
+                return True
+            except Exception as e:
+                report_error(f"Error rebuilding checkpoints: {e}")
+                return False
+        return False
+
+    @staticmethod
+    def save_transaction(entity_type, entity_id, transaction_id, transaction_data, previous_id=None, aggregates=True):
+        """Save a transaction; previous_id is removed in the same update when the key changed.
+
+        The party's checkpoints, rollups and hash index are adjusted in the same update unless aggregates is False."""
+        if using_firebase:
+            try:
+                updates = {}
+                if previous_id and previous_id != transaction_id:
+                    updates.update(FirebaseDB.transaction_updates(entity_type, entity_id, previous_id, None))
+                updates.update(FirebaseDB.transaction_updates(entity_type, entity_id, transaction_id, transaction_data))
+                if aggregates:
+                    previous_key = previous_id or transaction_id
+                    previous = FirebaseDB.load_transaction(entity_type, entity_id, previous_key)
+                    updates.update(FirebaseDB.aggregate_updates(entity_type, entity_id, [(previous, transaction_data)]))
+                    updates.update(fingerprint_updates(
+                        entity_type, entity_id, {previous_key: previous}, {transaction_id: transaction_data}
+                    ))
+                FirebaseDB._write(updates)
+                return True
+            except Exception as e:
+                report_error(f"Error saving transaction: {e} — nothing was saved and the change was undone.")
+                return False
+        return False
+
     @staticmethod
     def delete_transaction(entity_type, entity_id, transaction_id):
         if using_firebase:
             try:
-                firebase_db.child(f"{entity_type}_transactions").child(entity_id).child(transaction_id).delete()
+                previous = FirebaseDB.load_transaction(entity_type, entity_id, transaction_id)
+                updates = FirebaseDB.transaction_updates(entity_type, entity_id, transaction_id, None)
+                updates.update(FirebaseDB.aggregate_updates(entity_type, entity_id, [(previous, None)]))
+                updates.update(fingerprint_updates(entity_type, entity_id, {transaction_id: previous}))
+                FirebaseDB._write(updates)
+                return True
+            except Exception as e:
+                report_error(f"Error deleting transaction: {e} — nothing was saved and the change was undone.")
+                return False
+        return False
+
+    @staticmethod
+    def batch_update(updates):
+        """Apply a {path: value} multi-path update atomically in a single request"""
+        if using_firebase:
+            try:
+                FirebaseDB._write(updates)
                 return True
             except Exception as e:
-                st.error(f"Error deleting transaction: {e}")
+                report_error(f"Error writing batch: {e} — nothing was saved and the change was undone.")
                 return False
         return False
 
-# Initialize session state
-if 'settings' not in st.session_state:
-    st.session_state.settings = FirebaseDB.load_settings()
-
-if 'current_customer' not in st.session_state:
-    st.session_state.current_customer = None
-if 'current_supplier' not in st.session_state:
-    st.session_state.current_supplier = None
-if 'edit_customer' not in st.session_state:
-    st.session_state.edit_customer = None
-if 'edit_supplier' not in st.session_state:
-    st.session_state.edit_supplier = None
-if 'edit_transaction' not in st.session_state:
-    st.session_state.edit_transaction = None
-if 'confirm_delete_customer' not in st.session_state:
-    st.session_state.confirm_delete_customer = None
-if 'confirm_delete_supplier' not in st.session_state:
-    st.session_state.confirm_delete_supplier = None
+# Warm snapshot: an on-disk SQLite copy of the party and transaction trees that survives restarts.
+# A new process loads it, then re-reads only the subtrees the change log names since it was taken.
+# Opt in with LEDGER_WARM_CACHE=1
+WARM_CACHE_ENABLED = os.environ.get("LEDGER_WARM_CACHE") == "1"
+WARM_CACHE_PATH = os.path.join(LEDGER_DATA_DIR, "warm_cache.sqlite")
+WARM_CACHE_CHECK_INTERVAL = 1.0    # seconds between meta/data_version checks
+WARM_CACHE_MAX_PATHS = 500         # changed subtrees re-read one by one before whole roots are reloaded
+
+class WarmCache:
+    """Process-wide mirror of the warm roots, persisted to SQLite and caught up from the change log"""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.roots = warm_roots()
+        self.trees = {root: {} for root in self.roots}
+        self.version = None
+        self.cursor = ""
+        self.synced_at = None
+        self.checked_at = 0.0
+        self.loaded_rows = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS nodes (root TEXT, key TEXT, value TEXT, PRIMARY KEY (root, key))")
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self._load()
+
+    def _load(self):
+        meta = dict(self.db.execute("SELECT name, value FROM meta"))
+        # A snapshot of a different set of roots is ignored and replaced on first use
+        if meta.get("roots") != json.dumps(self.roots) or "version" not in meta:
+            return
+        for root, key, value in self.db.execute("SELECT root, key, value FROM nodes"):
+            if root in self.trees:
+                self.trees[root][key] = json.loads(value)
+                self.loaded_rows += 1
+        self.version = int(meta["version"])
+        self.cursor = meta.get("cursor") or ""
+        self.synced_at = meta.get("synced_at")
+
+    def get(self, root):
+        """A private copy of one root, caught up with Firebase first"""
+        with self.lock:
+            self._refresh()
+            return copy.deepcopy(self.trees[root]) or None
+
+    def invalidate(self):
+        with self.lock:
+            self.version = None
+
+    def status(self):
+        with self.lock:
+            return {
+                "version": self.version,
+                "cursor": self.cursor,
+                "synced_at": self.synced_at,
+                "loaded_rows": self.loaded_rows,
+                "rows": sum(len(tree) for tree in self.trees.values())
+            }
+
+    def _refresh(self):
+        if self.version is not None and time.time() - self.checked_at < WARM_CACHE_CHECK_INTERVAL:
+            return
+        version = int(FirebaseDB._fetch_remote("meta/data_version") or 0)
+        self.checked_at = time.time()
+        if version == self.version:
+            return
+
+        floor = FirebaseDB._fetch_remote("meta/changelog_floor") or ""
+        if self.version is None or self.cursor < floor:
+            self._reload(version)
+        else:
+            self._catch_up(version)
+
+    def _changelog(self, start=None, last=None):
+        return FirebaseDB._read(
+            ("range", "changelog", start, None, last), "changelog",
+            lambda: FirebaseDB._query("changelog", start=start, last=last)
+        ) or {}
+
+    def _reload(self, version):
+        # The cursor is read before the trees, so anything written during the reload is replayed later
+        now = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d%H%M%S%f')
+        cursor = max(self._changelog(last=1), default=now)
+        with ThreadPoolExecutor(max_workers=len(self.roots)) as pool:
+            trees = list(pool.map(FirebaseDB._fetch_remote, self.roots))
+        self.trees = {root: tree or {} for root, tree in zip(self.roots, trees)}
+        self._commit(version, cursor, replaced=self.roots)
+
+    def _catch_up(self, version):
+        # Start a little before the cursor: entries from servers with a slower clock may sort earlier
+        start = None
+        if self.cursor:
+            start = (changelog_moment(self.cursor) - CHANGELOG_SKEW).strftime('%Y%m%d%H%M%S%f')
+        entries = self._changelog(start=start)
+        paths = sorted({path for entry in entries.values() for path in (entry or {}).get("paths", [])})
+
+        if len(paths) > WARM_CACHE_MAX_PATHS or any(path in self.roots for path in paths):
+            self._reload(version)
+            return
+
+        with ThreadPoolExecutor(max_workers=STATEMENT_READ_WORKERS) as pool:
+            values = list(pool.map(FirebaseDB._fetch_remote, paths))
+        changed = []
+        for path, value in zip(paths, values):
+            root, key = path.split("/", 1)
+            if root not in self.trees:
+                continue
+            if value is None:
+                self.trees[root].pop(key, None)
+            else:
+                self.trees[root][key] = value
+            changed.append((root, key))
+        self._commit(version, max([self.cursor, *entries]), changed=changed)
+
+    def _commit(self, version, cursor, replaced=(), changed=()):
+        self.version = version
+        self.cursor = cursor
+        self.synced_at = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        # The snapshot only speeds up the next start; a failed save never fails a read
+        try:
+            with self.db:
+                for root in replaced:
+                    self.db.execute("DELETE FROM nodes WHERE root = ?", (root,))
+                    self.db.executemany(
+                        "INSERT INTO nodes VALUES (?, ?, ?)",
+                        ((root, key, json.dumps(value)) for key, value in self.trees[root].items())
+                    )
+                for root, key in changed:
+                    value = self.trees[root].get(key)
+                    if value is None:
+                        self.db.execute("DELETE FROM nodes WHERE root = ? AND key = ?", (root, key))
+                    else:
+                        self.db.execute("INSERT OR REPLACE INTO nodes VALUES (?, ?, ?)", (root, key, json.dumps(value)))
+                self.db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [
+                    ("roots", json.dumps(self.roots)),
+                    ("version", str(version)),
+                    ("cursor", cursor),
+                    ("synced_at", self.synced_at)
+                ])
+        except sqlite3.Error as e:
+            logger.warning(json.dumps({"event": "warm_cache_save_failed", "error": str(e)}))
+
+@st.cache_resource
+def warm_cache():
+    """The process-wide warm snapshot, or None unless LEDGER_WARM_CACHE=1"""
+    if not WARM_CACHE_ENABLED:
+        return None
+    try:
+        return WarmCache(WARM_CACHE_PATH)
+    except (sqlite3.Error, OSError) as e:
+        logger.warning(json.dumps({"event": "warm_cache_unavailable", "error": str(e)}))
+        return None
 
 # Apply dark theme
 def apply_theme():
@@ -411,89 +2076,2586 @@ def apply_theme():
     """, unsafe_allow_html=True)
 
 
-apply_theme()
+# Utility functions
+@st.cache_resource
+def headless_settings():
+    return FirebaseDB.load_settings()
+
+def current_settings():
+    """Display settings: the session's copy in the app, read once per process in batch jobs"""
+    if not in_script_run():
+        return headless_settings()
+    if 'settings' not in st.session_state:
+        st.session_state.settings = FirebaseDB.load_settings()
+    return st.session_state.settings
+
+def format_currency(amount):
+    currency_symbol = current_settings().get("currency_symbol", "₹")
+    return f"{currency_symbol}{amount:,.2f}"
+
+def format_date(date_str):
+    try:
+        date_format = current_settings().get("date_format", "%Y-%m-%d")
+        date_obj = datetime.datetime.strptime(date_str, '%Y-%m-%d')
+        return date_obj.strftime(date_format)
+    except:
+        return date_str
+
+def moment_date_format(date_format):
+    """The strftime date format from settings in the moment.js syntax column_config expects"""
+    for token, moment in (("%Y", "YYYY"), ("%m", "MM"), ("%d", "DD"), ("%b", "MMM")):
+        date_format = date_format.replace(token, moment)
+    return date_format
+
+def money_column(label, **kwargs):
+    currency_symbol = current_settings().get("currency_symbol", "₹").replace("%", "%%")
+    return st.column_config.NumberColumn(label, format=f"{currency_symbol}%.2f", **kwargs)
+
+def date_column(label, **kwargs):
+    date_format = current_settings().get("date_format", "%Y-%m-%d")
+    return st.column_config.DateColumn(label, format=moment_date_format(date_format), **kwargs)
+
+def ledger_column_config():
+    """Date and money columns shared by the ledger-style tables"""
+    return {
+        "Date": date_column("Date"),
+        "Debit": money_column("Debit"),
+        "Credit": money_column("Credit"),
+        "Balance": money_column("Balance")
+    }
+
+def transactions_display_frame(transactions, entities):
+    """Typed Date/Entity/Particulars/Debit/Credit frame; zero amounts become blanks"""
+    debit = pd.to_numeric(pd.Series([t.get('debit', 0) for t in transactions], dtype=object), errors='coerce')
+    credit = pd.to_numeric(pd.Series([t.get('credit', 0) for t in transactions], dtype=object), errors='coerce')
+    return pd.DataFrame({
+        "Date": pd.to_datetime([t.get('date', '') for t in transactions], format='%Y-%m-%d', errors='coerce'),
+        "Entity": entities,
+        "Particulars": [t.get('particular', '') for t in transactions],
+        "Debit": debit.where(debit > 0),
+        "Credit": credit.where(credit > 0)
+    })
+
+def calculate_balance(transactions_list):
+    balance = 0
+    for transaction in transactions_list:
+        debit = float(transaction.get('debit', 0))
+        credit = float(transaction.get('credit', 0))
+        balance += credit - debit
+    return balance
+
+def save_excel_file(dataframe, default_filename="ledger_export.xlsx"):
+    """Save dataframe as Excel file using Streamlit's download button"""
+    timed_import("openpyxl")
+    buffer = io.BytesIO()
+    
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        dataframe.to_excel(writer, index=False)
+    
+    excel_data = buffer.getvalue()
+    
+    st.download_button(
+        label="📥 Download Excel File",
+        data=excel_data,
+        file_name=default_filename,
+        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+    
+    return True
+
+def transactions_frame(all_transactions):
+    """Flatten {entity_id: {transaction_id: transaction}} into one numeric DataFrame"""
+    records = [
+        (entity_id, trans_id, t.get('date', ''), t.get('particular', ''), t.get('debit', 0), t.get('credit', 0))
+        for entity_id, transactions in all_transactions.items() if transactions
+        for trans_id, t in transactions.items()
+    ]
+    df = pd.DataFrame.from_records(
+        records, columns=["entity_id", "id", "date", "particular", "debit", "credit"]
+    )
+    df["debit"] = pd.to_numeric(df["debit"], errors="coerce").fillna(0.0)
+    df["credit"] = pd.to_numeric(df["credit"], errors="coerce").fillna(0.0)
+    return df
+
+def build_party_statements(all_transactions, party_ids, start_date, end_date, base_openings=None):
+    """Yield (party_id, opening_balance, period_lines) for each party from one sorted pass.
+
+    base_openings are balances carried in from before the earliest transaction supplied."""
+    base_openings = base_openings or {}
+    start = start_date.strftime('%Y-%m-%d')
+    end = end_date.strftime('%Y-%m-%d')
+
+    df = transactions_frame(all_transactions)
+    df = df[df["date"] <= end].sort_values(["entity_id", "date"], kind="mergesort")
+    df["net"] = df["credit"] - df["debit"]
+
+    # Everything before the period collapses into the opening balance
+    before = df["date"] < start
+    openings = df.loc[before].groupby("entity_id")["net"].sum()
+    period = df.loc[~before]
+    period_lines = dict(tuple(period.groupby("entity_id", sort=False)))
+
+    for party_id in party_ids:
+        opening = base_openings.get(party_id, 0.0) + float(openings.get(party_id, 0.0))
+        lines = period_lines.get(party_id, period.iloc[0:0])
+        lines = lines.assign(balance=opening + lines["net"].cumsum())
+        yield party_id, opening, lines
+
+STATEMENT_READ_WORKERS = 8  # concurrent per-party range reads
+
+def load_party_statements(entity_type, party_ids, start_date, end_date, checkpoints=None):
+    """Statements from checkpoints and period range reads, or from the full history until checkpoints exist.
+
+    Callers working through parties in chunks pass the book's checkpoints to read them once."""
+    if not FirebaseDB.checkpoints_ready(entity_type):
+        all_transactions = FirebaseDB.load_all_transactions(entity_type)
+        return build_party_statements(all_transactions, party_ids, start_date, end_date)
+
+    # Openings come from the checkpoint before the start month; lines from the start of that month
+    if checkpoints is None:
+        checkpoints = FirebaseDB.load_checkpoints(entity_type)
+    first_month = start_date.strftime('%Y-%m')
+    last_month = end_date.strftime('%Y-%m')
+    month_start = start_date.replace(day=1)
+
+    openings = {}
+    active = []
+    for party_id in party_ids:
+        party_checkpoints = checkpoints.get(party_id) or {}
+        openings[party_id] = opening_balance_cents(party_checkpoints, first_month) / 100
+        if any(first_month <= month <= last_month and (record or {}).get('count') for month, record in party_checkpoints.items()):
+            active.append(party_id)
+
+    # Only parties with lines in the period are read at all
+    with ThreadPoolExecutor(max_workers=STATEMENT_READ_WORKERS) as pool:
+        period_transactions = dict(zip(active, pool.map(
+            lambda party_id: FirebaseDB.load_transactions_range(entity_type, party_id, month_start, end_date), active
+        )))
+
+    # Archived periods come from the local archive instead
+    boundary = FirebaseDB.archive_boundary(entity_type)
+    if boundary and month_start.strftime('%Y-%m-%d') < boundary and active:
+        archived = archive_to_transactions(read_archive(entity_type, month_start, end_date, active))
+        for party_id, transactions in archived.items():
+            period_transactions[party_id] = {**transactions, **(period_transactions.get(party_id) or {})}
+
+    return build_party_statements(period_transactions, party_ids, start_date, end_date, base_openings=openings)
+
+def statement_rows(party, opening, lines, start_date, end_date):
+    """Rows of a single party statement: header, opening balance, period lines, totals"""
+    yield [f"Statement: {party.get('name', 'Unknown')} ({party.get('phone', '')})"]
+    yield [f"Period: {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}"]
+    yield ["Date", "Particulars", "Debit", "Credit", "Balance"]
+    yield ["", "Opening Balance", None, None, round(opening, 2)]
+
+    for line in lines.itertuples(index=False):
+        yield [line.date, line.particular, line.debit, line.credit, round(line.balance, 2)]
+
+    closing = opening + float(lines["net"].sum())
+    yield ["", "📊 TOTAL", float(lines["debit"].sum()), float(lines["credit"].sum()), round(closing, 2)]
+
+def _sheet_title(name, used_titles):
+    # Excel sheet names: max 31 chars, no []:*?/\ and unique within the workbook
+    base = re.sub(r'[\[\]:*?/\\]', '', name).strip()[:28] or "Sheet"
+    title = base
+    suffix = 2
+    while title.lower() in used_titles:
+        title = f"{base[:28 - len(str(suffix))]}~{suffix}"
+        suffix += 1
+    used_titles.add(title.lower())
+    return title
+
+def write_statements_workbook(statements, parties, start_date, end_date, on_progress=None, output=None):
+    """Stream statements into a write-only workbook, one sheet per party.
+
+    Saves to output (a path or binary file) when given, otherwise returns the bytes."""
+    openpyxl = timed_import("openpyxl")
+
+    workbook = openpyxl.Workbook(write_only=True)
+    used_titles = set()
+    written = 0
+
+    for index, (party_id, opening, lines) in enumerate(statements):
+        party = parties.get(party_id, {})
+        sheet = workbook.create_sheet(_sheet_title(party.get('name', party_id), used_titles))
+        for row in statement_rows(party, opening, lines, start_date, end_date):
+            sheet.append(row)
+        written += 1
+        if on_progress:
+            on_progress(index + 1, party)
+
+    if not written:
+        workbook.create_sheet("Empty").append(["No statements in the selected period"])
+
+    if output is not None:
+        workbook.save(output)
+        return None, written
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue(), written
+
+def write_statements_zip(statements, parties, start_date, end_date, on_progress=None, output=None):
+    """Stream statements into a zip archive holding one CSV file per party.
+
+    Writes to output (a path or binary file) when given, otherwise returns the bytes."""
+    written = 0
+
+    with tempfile.SpooledTemporaryFile(max_size=32 * 1024 * 1024) as spool:
+        with zipfile.ZipFile(output if output is not None else spool, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            used_names = set()
+            for index, (party_id, opening, lines) in enumerate(statements):
+                party = parties.get(party_id, {})
+                text = io.StringIO()
+                csv.writer(text).writerows(statement_rows(party, opening, lines, start_date, end_date))
+
+                filename = f"{_sheet_title(party.get('name', party_id), used_names)}.csv"
+                archive.writestr(filename, text.getvalue().encode("utf-8-sig"))
+                written += 1
+                if on_progress:
+                    on_progress(index + 1, party)
+
+        if output is not None:
+            return None, written
+        spool.seek(0)
+        return spool.read(), written
+
+def render_statement_generator(entity_type, parties):
+    """Batch period statements for every party of one entity type"""
+    entity_label = entity_type.capitalize()
+
+    with st.expander(f"📑 Batch {entity_label} Statements", expanded=False):
+        with st.form(f"{entity_type}_statements_form"):
+            col1, col2, col3 = st.columns(3)
+            today = datetime.datetime.now().date()
+
+            with col1:
+                start_date = st.date_input("📅 From", value=today.replace(day=1), key=f"{entity_type}_statement_from")
+
+            with col2:
+                end_date = st.date_input("📅 To", value=today, key=f"{entity_type}_statement_to")
+
+            with col3:
+                output_format = st.radio(
+                    "📦 Output",
+                    options=["workbook", "zip"],
+                    format_func=lambda x: "Excel workbook (sheet per party)" if x == "workbook" else "ZIP (CSV per party)",
+                    key=f"{entity_type}_statement_format"
+                )
+
+            skip_inactive = st.checkbox(
+                "Skip parties with a zero opening balance and no transactions in the period",
+                value=True,
+                key=f"{entity_type}_statement_skip"
+            )
+
+            generate = st.form_submit_button("📑 Generate Statements")
+
+        if generate:
+            if start_date > end_date:
+                st.error("❌ The start date must be on or before the end date!")
+                return
+
+            progress = st.progress(0.0, text="Loading transactions...")
+
+            # Order sheets by party name so statements are easy to find
+            party_ids = sorted(parties, key=lambda x: parties[x].get('name', '').lower())
+            statements = load_party_statements(entity_type, party_ids, start_date, end_date)
+            if skip_inactive:
+                statements = (s for s in statements if s[1] != 0 or not s[2].empty)
+
+            def on_progress(done, party):
+                progress.progress(
+                    min(done / max(len(party_ids), 1), 1.0),
+                    text=f"Writing statement {done}: {party.get('name', 'Unknown')}"
+                )
+
+            period = f"{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}"
+            if output_format == "workbook":
+                data, written = write_statements_workbook(statements, parties, start_date, end_date, on_progress)
+                filename = f"{entity_type}_statements_{period}.xlsx"
+                mime = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            else:
+                data, written = write_statements_zip(statements, parties, start_date, end_date, on_progress)
+                filename = f"{entity_type}_statements_{period}.zip"
+                mime = "application/zip"
+
+            progress.progress(1.0, text=f"✅ {written} statements ready")
+            st.download_button(
+                label=f"📥 Download {written} Statements",
+                data=data,
+                file_name=filename,
+                mime=mime,
+                key=f"{entity_type}_statements_download"
+            )
+
+IMPORT_BATCH_SIZE = 500
+IMPORT_NONE = "(none)"
+IMPORT_DATE_FORMATS = {
+    "auto": "Auto-detect (day first)",
+    "%Y-%m-%d": "YYYY-MM-DD",
+    "%d/%m/%Y": "DD/MM/YYYY",
+    "%m/%d/%Y": "MM/DD/YYYY",
+    "%d-%m-%Y": "DD-MM-YYYY"
+}
+
+def normalize_phone(phone):
+    return re.sub(r'\D', '', str(phone or ''))
+
+def build_phone_index(parties):
+    """Map normalized phone numbers to party ids"""
+    return {
+        normalize_phone(party.get('phone')): party_id
+        for party_id, party in parties.items()
+        if normalize_phone(party.get('phone'))
+    }
+
+def read_import_file(uploaded_file):
+    """Read an uploaded CSV or XLSX file with every column as text"""
+    if uploaded_file.name.lower().endswith(".xlsx"):
+        timed_import("openpyxl")
+        return pd.read_excel(uploaded_file, dtype=str, engine="openpyxl")
+    return pd.read_csv(uploaded_file, dtype=str, skipinitialspace=True)
+
+CURRENCY_TOKENS = r'(?i)^(?:₹|rs\.?|inr)\s*|\s*(?:₹|rs\.?|inr)$'
+# Western (1,234,567) and Indian (12,34,567) thousands grouping; anything else with a comma is rejected
+GROUPED_AMOUNT = r'^-?\d{1,3}(?:,\d{3})+(?:\.\d+)?$|^-?\d{1,2}(?:,\d{2})*,\d{3}(?:\.\d+)?$'
+PLAIN_AMOUNT = r'^-?\d+(?:\.\d+)?$'
+
+def _parse_amounts(column):
+    """Parse amounts strictly; blanks are zero and anything unrecognised is NaN ("invalid amount")"""
+    text = column.fillna("").astype(str).str.strip()
+    text = text.str.replace(CURRENCY_TOKENS, '', regex=True).str.strip()
+    grouped = text.str.match(GROUPED_AMOUNT)
+    text = text.where(~grouped, text.str.replace(',', '', regex=False))
+    valid = (text == "") | text.str.match(PLAIN_AMOUNT)
+    return pd.to_numeric(text.replace("", "0").where(valid), errors="coerce")
+
+def validate_import(raw_df, mapping, date_format, phone_index):
+    """Validate mapped import rows; returns (valid, rejects) DataFrames"""
+    df = pd.DataFrame(index=raw_df.index)
+    df["row"] = raw_df.index + 2  # header is line 1 of the file
+
+    df["phone"] = raw_df[mapping["phone"]].fillna("").astype(str).str.replace(r'\D', '', regex=True)
+    df["entity_id"] = df["phone"].map(phone_index)
+
+    raw_dates = raw_df[mapping["date"]]
+    if date_format == "auto":
+        dates = pd.to_datetime(raw_dates, format="mixed", dayfirst=True, errors="coerce")
+    else:
+        dates = pd.to_datetime(raw_dates, format=date_format, errors="coerce")
+    df["date"] = dates.dt.strftime('%Y-%m-%d')
+
+    df["particular"] = raw_df[mapping["particular"]].fillna("").astype(str).str.strip()
+
+    for field in ("debit", "credit"):
+        if mapping[field] == IMPORT_NONE:
+            df[field] = 0.0
+        else:
+            df[field] = _parse_amounts(raw_df[mapping[field]])
+
+    # Every failed check appends its reason to the row
+    checks = [
+        (df["entity_id"].isna(), "unknown phone"),
+        (dates.isna(), "invalid date"),
+        (df["particular"] == "", "missing particulars"),
+        (df["debit"].isna() | df["credit"].isna(), "invalid amount"),
+        ((df["debit"] < 0) | (df["credit"] < 0), "negative amount"),
+        ((df["debit"].fillna(0) == 0) & (df["credit"].fillna(0) == 0), "zero amount"),
+    ]
+    reasons = pd.Series("", index=df.index)
+    for failed, reason in checks:
+        reasons = reasons.where(~failed, reasons + reason + "; ")
+    df["reason"] = reasons.str.rstrip("; ")
+
+    rejected = df["reason"] != ""
+    rejects = raw_df.loc[rejected].assign(**{"Line": df.loc[rejected, "row"], "Reason": df.loc[rejected, "reason"]})
+    return df.loc[~rejected], rejects
+
+def import_duplicates(entity_type, valid_df):
+    """Boolean Series of rows that repeat an existing transaction or an earlier row of the file"""
+    fingerprints = frame_fingerprints(valid_df)
+    party_ids = list(valid_df["entity_id"].unique())
+    # One hash-index read per party in the file, fetched in parallel
+    with ThreadPoolExecutor(max_workers=STATEMENT_READ_WORKERS) as pool:
+        existing = dict(zip(party_ids, pool.map(lambda entity_id: FirebaseDB.load_fingerprints(entity_type, entity_id), party_ids)))
+
+    in_book = pd.Series(
+        [fingerprint in existing[entity_id] for entity_id, fingerprint in zip(valid_df["entity_id"], fingerprints)],
+        index=valid_df.index, dtype=bool
+    )
+    in_file = pd.DataFrame({"entity_id": valid_df["entity_id"], "fingerprint": fingerprints}).duplicated()
+    return in_book | in_file
+
+def transaction_change_updates(entity_type, entity_id, transaction_id, old, new):
+    """One transaction's write (or delete, with new None) with its checkpoint, rollup and hash index adjustments"""
+    changes = [(old, new)]
+    return {
+        **FirebaseDB.transaction_updates(entity_type, entity_id, transaction_id, new),
+        **checkpoint_updates(entity_type, entity_id, changes),
+        **daily_total_updates(entity_type, changes),
+        **fingerprint_updates(entity_type, entity_id, {transaction_id: old}, {transaction_id: new})
+    }
+
+def build_import_updates(entity_type, valid_df):
+    """One multi-path update per validated row: the transaction with its derived entries"""
+    row_updates = []
+    for entity_id, date, particular, debit, credit in zip(
+        valid_df["entity_id"], valid_df["date"], valid_df["particular"], valid_df["debit"], valid_df["credit"]
+    ):
+        transaction = {
+            'date': date,
+            'particular': particular,
+            'debit': str(float(debit)),
+            'credit': str(float(credit))
+        }
+        row_updates.append(transaction_change_updates(entity_type, entity_id, transaction_key(date), None, transaction))
+    return row_updates
+
+def commit_import(row_updates, on_progress=None):
+    """Write per-row updates in batched multi-path requests; returns rows committed.
+
+    A row's derived paths always travel in the same request as the row, and increments of
+    the same checkpoint or rollup within a batch are summed into one path."""
+    committed = 0
+    start = 0
+    while start < len(row_updates):
+        end = start + 1
+        paths = set(row_updates[start])
+        while end < len(row_updates) and len(paths.union(row_updates[end])) <= IMPORT_BATCH_SIZE:
+            paths.update(row_updates[end])
+            end += 1
+        if not FirebaseDB.batch_update(coalesce_updates(row_updates[start:end])):
+            break
+        committed = end
+        start = end
+        if on_progress:
+            on_progress(committed, len(row_updates))
+    return committed
+
+def _guess_column(columns, *candidates):
+    for column in columns:
+        if column.strip().lower() in candidates:
+            return column
+    return IMPORT_NONE
+
+def render_bulk_import(entity_type, parties):
+    """Upload, map, validate and commit a CSV/XLSX file of transactions"""
+    entity_label = entity_type.capitalize()
+
+    with st.expander(f"📤 Bulk Import {entity_label} Transactions", expanded=False):
+        st.write(f"Upload a CSV or Excel file with one transaction per row. Rows are matched to {entity_type}s by phone number.")
+        uploaded_file = st.file_uploader("📁 Transactions file", type=["csv", "xlsx"], key=f"{entity_type}_import_file")
+
+        if uploaded_file is None:
+            return
+
+        try:
+            raw_df = read_import_file(uploaded_file)
+        except Exception as e:
+            st.error(f"❌ Could not read file: {e}")
+            return
+
+        if raw_df.empty:
+            st.warning("⚠️ The uploaded file has no rows.")
+            return
+
+        # Column mapping
+        columns = list(raw_df.columns)
+        options = [IMPORT_NONE] + columns
+        defaults = {
+            "phone": _guess_column(columns, "phone", "phone number", "mobile"),
+            "date": _guess_column(columns, "date", "txn date", "transaction date"),
+            "particular": _guess_column(columns, "particular", "particulars", "description", "narration"),
+            "debit": _guess_column(columns, "debit", "dr"),
+            "credit": _guess_column(columns, "credit", "cr")
+        }
+        labels = {
+            "phone": "📞 Phone column*",
+            "date": "📅 Date column*",
+            "particular": "📝 Particulars column*",
+            "debit": "💰 Debit column",
+            "credit": "💸 Credit column"
+        }
+
+        mapping = {}
+        col1, col2, col3 = st.columns(3)
+        for index, field in enumerate(labels):
+            with (col1, col2, col3)[index % 3]:
+                mapping[field] = st.selectbox(
+                    labels[field],
+                    options=options,
+                    index=options.index(defaults[field]),
+                    key=f"{entity_type}_import_map_{field}"
+                )
+
+        with (col1, col2, col3)[len(labels) % 3]:
+            date_format = st.selectbox(
+                "🗓️ Date format in file",
+                options=list(IMPORT_DATE_FORMATS.keys()),
+                format_func=lambda x: IMPORT_DATE_FORMATS[x],
+                key=f"{entity_type}_import_date_format"
+            )
+
+        if IMPORT_NONE in (mapping["phone"], mapping["date"], mapping["particular"]):
+            st.info("Map the phone, date and particulars columns to continue.")
+            return
+        if mapping["debit"] == IMPORT_NONE and mapping["credit"] == IMPORT_NONE:
+            st.info("Map at least one of the debit or credit columns to continue.")
+            return
+
+        valid_df, rejects = validate_import(raw_df, mapping, date_format, build_phone_index(parties))
+
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Rows in file", len(raw_df))
+        col2.metric("✅ Ready to import", len(valid_df))
+        col3.metric("❌ Rejected", len(rejects))
+
+        if not rejects.empty:
+            st.write("#### ❌ Rejected rows")
+            st.dataframe(rejects.head(200), use_container_width=True)
+            st.download_button(
+                label="📥 Download Rejected Rows",
+                data=rejects.to_csv(index=False).encode("utf-8-sig"),
+                file_name=f"{entity_type}_import_rejects.csv",
+                mime="text/csv",
+                key=f"{entity_type}_import_rejects"
+            )
+
+        if valid_df.empty:
+            return
+
+        st.write("#### ✅ Preview")
+        st.dataframe(valid_df.head(50).drop(columns=["reason"]), use_container_width=True)
+
+        duplicates = import_duplicates(entity_type, valid_df)
+        if duplicates.any():
+            st.warning(f"⚠️ {int(duplicates.sum())} rows look like duplicates of existing transactions or of earlier rows in the file.")
+            st.dataframe(valid_df.loc[duplicates].head(200).drop(columns=["reason"]), use_container_width=True)
+            if st.checkbox("Skip likely duplicates", value=True, key=f"{entity_type}_import_skip_duplicates"):
+                valid_df = valid_df.loc[~duplicates]
+                if valid_df.empty:
+                    return
+
+        # Guard against committing the same upload twice in one session
+        file_key = f"{entity_type}:{uploaded_file.name}:{uploaded_file.size}"
+        if 'imported_files' not in st.session_state:
+            st.session_state.imported_files = set()
+        if file_key in st.session_state.imported_files:
+            st.warning("⚠️ This file has already been imported in this session.")
+
+        if st.button(f"💾 Import {len(valid_df)} Transactions", key=f"{entity_type}_import_commit"):
+            progress = st.progress(0.0, text="Writing transactions...")
+            row_updates = build_import_updates(entity_type, valid_df)
+            committed = commit_import(
+                row_updates,
+                lambda done, total: progress.progress(done / total, text=f"Written {done} of {total} transactions")
+            )
+
+            if committed == len(row_updates):
+                st.session_state.imported_files.add(file_key)
+                st.success(f"✅ Imported {committed} transactions!")
+            else:
+                st.error(f"❌ Import stopped after {committed} of {len(row_updates)} transactions. Committed batches were kept.")
+
+# Entity types share one code path; only labels and the meaning of the balance sign differ.
+# Debit is what the party gives us, credit is what the party takes, and the balance is
+# credit - debit for both. A positive balance is a receivable, a negative one a payable.
+ENTITY_TYPES = {
+    "customer": {
+        "label": "Customer",
+        "plural": "Customers",
+        "collection": "customers",
+        "icon": "👥",
+        "profile_icon": "👤",
+        "due_sign": 1,  # customer owes us when the balance is positive
+        "debit_help": "Amount customer gives (payment received)",
+        "credit_help": "Amount customer takes (goods/services provided)"
+    },
+    "supplier": {
+        "label": "Supplier",
+        "plural": "Suppliers",
+        "collection": "suppliers",
+        "icon": "🏢",
+        "profile_icon": "🏢",
+        "due_sign": -1,  # we owe the supplier when the balance is negative
+        "debit_help": "Amount supplier gives (goods/services received)",
+        "credit_help": "Amount supplier takes (payment made)"
+    }
+}
+
+def balance_status(entity_type, balance):
+    """Status label and colour for a party balance"""
+    due = balance * ENTITY_TYPES[entity_type]["due_sign"]
+    if due > 0:
+        return "🔴 Due", "#DC2626"
+    if due < 0:
+        return "🟢 Advance", "#059669"
+    return "⚪ Settled", "#F59E0B"
+
+def load_party_balances(entity_type):
+    """Balance of every party of one entity type from its checkpoints, or from one transactions read plus the archive"""
+    if FirebaseDB.checkpoints_ready(entity_type):
+        return {
+            entity_id: closing_balance(checkpoints)
+            for entity_id, checkpoints in FirebaseDB.load_checkpoints(entity_type).items()
+        }
+    live = FirebaseDB.load_all_transactions(entity_type)
+    balances = {
+        entity_id: calculate_balance(list(transactions.values()))
+        for entity_id, transactions in live.items()
+        if transactions
+    }
+    # Archived rows carry the rest of each history; live copies of the same transaction win
+    if FirebaseDB.archive_boundary(entity_type):
+        archived = read_archive(entity_type)
+        archived = archived.loc[[
+            trans_id not in (live.get(entity_id) or {}) for entity_id, trans_id in zip(archived["entity_id"], archived["id"])
+        ]]
+        for entity_id, net in (archived["credit"] - archived["debit"]).groupby(archived["entity_id"]).sum().items():
+            balances[entity_id] = balances.get(entity_id, 0.0) + float(net)
+    return balances
+
+def load_party_checkpoints(entity_type, party_id):
+    """A party's checkpoints, or None while checkpoints are not built for its entity type"""
+    if FirebaseDB.checkpoints_ready(entity_type):
+        return FirebaseDB.load_checkpoints(entity_type, party_id)
+    return None
+
+def recently_active_parties(checkpoints, party_ids, limit):
+    """Parties with lines in the newest months that hold at least limit lines between them"""
+    activity = sorted((
+        (month, record['count'], party_id)
+        for party_id in party_ids
+        for month, record in (checkpoints.get(party_id) or {}).items()
+        if (record or {}).get('count', 0) > 0
+    ), reverse=True)
+    chosen = set()
+    lines = 0
+    cutoff = None
+    for month, count, party_id in activity:
+        # Every party active in the cutoff month is kept; same-month order is only known from the keys
+        if cutoff is not None and month < cutoff:
+            break
+        chosen.add(party_id)
+        lines += count
+        if cutoff is None and lines >= limit:
+            cutoff = month
+    return [party_id for party_id in party_ids if party_id in chosen]
+
+def load_recent_transactions(all_parties, limit):
+    """The newest transactions of the book, tagged with party name and type.
+
+    Books whose keys sort by date take each party's last few keys with limit-to-last queries,
+    only for parties the checkpoints show as recently active; others fall back to one read of
+    every transaction."""
+    candidates = []
+    for entity_type, parties in all_parties.items():
+        entity_label = ENTITY_TYPES[entity_type]["label"]
+        if FirebaseDB.keys_in_date_order(entity_type):
+            party_ids = list(parties)
+            if FirebaseDB.checkpoints_ready(entity_type):
+                party_ids = recently_active_parties(FirebaseDB.load_checkpoints(entity_type), party_ids, limit)
+            with ThreadPoolExecutor(max_workers=STATEMENT_READ_WORKERS) as pool:
+                book = dict(zip(party_ids, pool.map(
+                    lambda party_id: FirebaseDB.load_latest_transactions(entity_type, party_id, limit), party_ids
+                )))
+        else:
+            book = FirebaseDB.load_all_transactions(entity_type)
+
+        for entity_id, transactions in book.items():
+            party = parties.get(entity_id)
+            if not party or not transactions:
+                continue
+            for trans_id, transaction in transactions.items():
+                # Copy so the tags never leak into the cached trees
+                candidates.append({
+                    **transaction,
+                    'entity_name': party.get('name', 'Unknown'),
+                    'entity_type': entity_label,
+                    'id': trans_id,
+                    'entity_id': entity_id
+                })
+
+    return latest_transactions(candidates, limit)
+
+def render_party_form(entity_type, parties):
+    """Add-party form shared by customers and suppliers"""
+    config = ENTITY_TYPES[entity_type]
+    label = config["label"]
+
+    with st.expander(f"➕ Add New {label}", expanded=False):
+        with st.form(f"add_{entity_type}_form"):
+            col1, col2 = st.columns(2)
+
+            with col1:
+                new_name = st.text_input(f"{label} Name*", key=f"{entity_type}_name")
+                new_phone = st.text_input("Phone Number*", key=f"{entity_type}_phone")
+
+            with col2:
+                new_email = st.text_input("Email (Optional)", key=f"{entity_type}_email")
+                new_address = st.text_area("Address (Optional)", key=f"{entity_type}_address")
+
+            submitted = st.form_submit_button(f"➕ Add {label}")
+            if submitted:
+                if not new_name or not new_phone:
+                    st.error("❌ Name and Phone Number are required!")
+                elif normalize_phone(new_phone) in build_phone_index(parties):
+                    st.error(f"❌ {label} with phone number {new_phone} already exists!")
+                else:
+                    party_id = str(uuid.uuid4())
+                    party_data = {
+                        'name': new_name,
+                        'phone': new_phone,
+                        'email': new_email,
+                        'address': new_address,
+                        'created_on': datetime.datetime.now().strftime('%Y-%m-%d')
+                    }
+
+                    if FirebaseDB.create_party(entity_type, party_id, party_data):
+                        st.success(f"✅ {label} {new_name} added successfully!")
+                        st.rerun()
+
+def render_party_profile(entity_type, party_id, party, parties, balance):
+    """Profile card with balance plus the edit and delete flows"""
+    config = ENTITY_TYPES[entity_type]
+    label = config["label"]
+
+    st.subheader(f"{config['profile_icon']} {label} Profile: {party.get('name', 'Unknown')}")
+
+    col1, col2, col3 = st.columns([2, 2, 1])
+
+    with col1:
+        st.write(f"**📞 Phone:** {party.get('phone', 'N/A')}")
+        st.write(f"**📧 Email:** {party.get('email', 'N/A')}")
+        st.write(f"**📍 Address:** {party.get('address', 'N/A')}")
+        st.write(f"**📅 {label} since:** {format_date(party.get('created_on', 'N/A'))}")
+
+    with col2:
+        status_text, balance_color = balance_status(entity_type, balance)
+
+        st.markdown(f"""
+        <div style="background-color: {balance_color}; color: white; padding: 15px; border-radius: 8px; text-align: center;">
+            <h3 style="margin: 0;">💰 Balance: {format_currency(balance)}</h3>
+            <p style="margin: 5px 0 0 0; font-size: 16px;">Status: {status_text}</p>
+        </div>
+        """, unsafe_allow_html=True)
+
+    with col3:
+        # Action buttons
+        if st.button("✏️ Edit", key=f"edit_{entity_type}_{party_id}"):
+            st.session_state[f"edit_{entity_type}"] = party_id
+
+        if st.button("🗑️ Delete", key=f"delete_{entity_type}_{party_id}"):
+            st.session_state[f"confirm_delete_{entity_type}"] = party_id
+
+    # Edit party form
+    if st.session_state[f"edit_{entity_type}"] == party_id:
+        with st.form(f"edit_{entity_type}_form_{party_id}"):
+            st.subheader(f"✏️ Edit {label}")
+
+            col1, col2 = st.columns(2)
+
+            with col1:
+                edit_name = st.text_input(f"{label} Name*", value=party.get('name', ''), key=f"edit_{entity_type}_name_{party_id}")
+                edit_phone = st.text_input("Phone Number*", value=party.get('phone', ''), key=f"edit_{entity_type}_phone_{party_id}")
+
+            with col2:
+                edit_email = st.text_input("Email", value=party.get('email', ''), key=f"edit_{entity_type}_email_{party_id}")
+                edit_address = st.text_area("Address", value=party.get('address', ''), key=f"edit_{entity_type}_address_{party_id}")
+
+            col1, col2 = st.columns(2)
+
+            with col1:
+                update_submitted = st.form_submit_button(f"💾 Update {label}")
+
+            with col2:
+                cancel = st.form_submit_button("❌ Cancel")
+
+            if update_submitted:
+                if not edit_name or not edit_phone:
+                    st.error("❌ Name and Phone Number are required!")
+                elif build_phone_index(parties).get(normalize_phone(edit_phone), party_id) != party_id:
+                    st.error(f"❌ Phone number {edit_phone} is already used by another {entity_type}!")
+                else:
+                    updated_party = {
+                        'name': edit_name,
+                        'phone': edit_phone,
+                        'email': edit_email,
+                        'address': edit_address,
+                        'created_on': party.get('created_on', datetime.datetime.now().strftime('%Y-%m-%d'))
+                    }
+
+                    if FirebaseDB.save_party(entity_type, party_id, updated_party):
+                        st.success(f"✅ {label} updated successfully!")
+                        st.session_state[f"edit_{entity_type}"] = None
+                        st.rerun()
+
+            if cancel:
+                st.session_state[f"edit_{entity_type}"] = None
+                st.rerun()
+
+    # Confirm delete dialog
+    if st.session_state[f"confirm_delete_{entity_type}"] == party_id:
+        st.warning(f"⚠️ Are you sure you want to delete {entity_type} '{party.get('name', 'Unknown')}'? This will also delete all transactions.")
+
+        col1, col2 = st.columns(2)
+
+        with col1:
+            if st.button("🗑️ Yes, Delete", key=f"confirm_delete_{entity_type}_{party_id}"):
+                if FirebaseDB.delete_party(entity_type, party_id):
+                    st.success(f"✅ {label} deleted successfully!")
+                    st.session_state[f"confirm_delete_{entity_type}"] = None
+                    st.session_state[f"current_{entity_type}"] = None
+                    st.rerun()
+
+        with col2:
+            if st.button("❌ Cancel", key=f"cancel_delete_{entity_type}_{party_id}"):
+                st.session_state[f"confirm_delete_{entity_type}"] = None
+                st.rerun()
+
+def render_transaction_form(entity_type, party_id, transaction_id=None, transaction=None):
+    """Add form when transaction is None, otherwise the edit form for that transaction"""
+    config = ENTITY_TYPES[entity_type]
+    editing = transaction is not None
+    transaction = transaction or {}
+    prefix = f"edit_{entity_type}" if editing else entity_type
+    suffix = transaction_id if editing else party_id
+
+    form_key = f"edit_{entity_type}_transaction_form_{transaction_id}" if editing else f"add_{entity_type}_transaction_form_{party_id}"
+    with st.form(form_key):
+        if editing:
+            st.subheader("✏️ Edit Transaction")
+
+        col1, col2 = st.columns(2)
+
+        with col1:
+            date_value = datetime.datetime.now().date()
+            if editing:
+                date_value = datetime.datetime.strptime(transaction.get('date', ''), '%Y-%m-%d').date()
+
+            date_input = st.date_input(
+                "📅 Date",
+                value=date_value,
+                key=f"{prefix}_date_{suffix}" if editing else f"{entity_type}_date_input_{party_id}"
+            )
+
+            particular = st.text_area(
+                "📝 Particulars*",
+                value=transaction.get('particular', ''),
+                help="Description of the transaction",
+                key=f"{prefix}_particular_{suffix}"
+            )
+
+        with col2:
+            debit = st.number_input(
+                "💰 Debit Amount",
+                min_value=0.0,
+                value=float(transaction.get('debit', 0)),
+                format="%.2f",
+                help=config["debit_help"],
+                key=f"{prefix}_debit_{suffix}"
+            )
+
+            credit = st.number_input(
+                "💸 Credit Amount",
+                min_value=0.0,
+                value=float(transaction.get('credit', 0)),
+                format="%.2f",
+                help=config["credit_help"],
+                key=f"{prefix}_credit_{suffix}"
+            )
+
+        if editing:
+            col1, col2 = st.columns(2)
+            with col1:
+                submitted = st.form_submit_button("💾 Update Transaction")
+            with col2:
+                cancelled = st.form_submit_button("❌ Cancel")
+        else:
+            submitted = st.form_submit_button("➕ Add Transaction")
+            cancelled = False
+
+        if submitted:
+            if not particular:
+                st.error("❌ Particulars are required!")
+            elif debit == 0 and credit == 0:
+                st.error("❌ Either Debit or Credit amount must be greater than zero!")
+            else:
+                transaction_data = {
+                    'date': date_input.strftime('%Y-%m-%d'),
+                    'particular': particular,
+                    'debit': str(debit),
+                    'credit': str(credit)
+                }
+
+                # Keys carry the date, so a new date means a new key
+                new_id = transaction_id
+                if not new_id or not key_matches_date(new_id, transaction_data['date']):
+                    new_id = transaction_key(transaction_data['date'])
+
+                # Likely double-posting warns once; pressing again with the same content saves it
+                confirm_key = f"duplicate_ok_{form_key}"
+                fingerprint = transaction_fingerprint(transaction_data)
+                duplicates = FirebaseDB.find_duplicates(entity_type, party_id, transaction_data, exclude_id=transaction_id)
+                if duplicates and st.session_state.get(confirm_key) != fingerprint:
+                    st.session_state[confirm_key] = fingerprint
+                    st.warning(
+                        f"⚠️ Possible duplicate: {len(duplicates)} {entity_type} transaction(s) on {transaction_data['date']} "
+                        f"already have the same amounts and particulars. Press the button again to save anyway."
+                    )
+                elif FirebaseDB.save_transaction(entity_type, party_id, new_id, transaction_data, previous_id=transaction_id):
+                    st.session_state.pop(confirm_key, None)
+                    st.success("✅ Transaction updated successfully!" if editing else "✅ Transaction added successfully!")
+                    st.session_state.edit_transaction = None
+                    st.rerun()
+
+        if cancelled:
+            st.session_state.edit_transaction = None
+            st.rerun()
+
+def month_bounds(month):
+    """First and last date of a YYYY-MM month"""
+    start = datetime.datetime.strptime(month, '%Y-%m').date()
+    end = (start + datetime.timedelta(days=31)).replace(day=1) - datetime.timedelta(days=1)
+    return start, end
+
+def render_monthly_summary(checkpoints):
+    """Month-by-month totals from the checkpoints, with closing balances as their running sum"""
+    with st.expander("📆 Monthly Summary", expanded=False):
+        closings = closing_balances_cents(checkpoints)
+        summary_df = pd.DataFrame([
+            {
+                "Month": month,
+                "Transactions": record.get('count', 0),
+                "Debit": record.get('debit_cents', 0),
+                "Credit": record.get('credit_cents', 0),
+                "Closing Balance": closings[month]
+            }
+            for month, record in sorted(checkpoints.items(), reverse=True) if (record or {}).get('count')
+        ], columns=["Month", "Transactions", "Debit", "Credit", "Closing Balance"])
+        summary_df[["Debit", "Credit", "Closing Balance"]] /= 100
+        st.dataframe(
+            summary_df,
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                "Debit": money_column("Debit"),
+                "Credit": money_column("Credit"),
+                "Closing Balance": money_column("Closing Balance")
+            }
+        )
+
+def render_party_ledger(entity_type, party_id, party, checkpoints=None):
+    """Ledger book with running balance, export and transaction actions.
+
+    With checkpoints a single month can be shown: its opening balance is the previous
+    checkpoints' summed nets and only that month's lines are read."""
+    st.subheader("📖 Ledger Book")
+
+    # Add new transaction
+    with st.expander("➕ Add New Transaction", expanded=False):
+        render_transaction_form(entity_type, party_id)
+
+    months = sorted((m for m, record in (checkpoints or {}).items() if (record or {}).get('count')), reverse=True)
+    if checkpoints:
+        render_monthly_summary(checkpoints)
+
+    # Sharded books open on the newest year; other years and whole history load on request.
+    # Year views use key ranges, so books that may still hold undated keys only offer whole history
+    sharded = FirebaseDB.shard_state(entity_type) == "done"
+    years = []
+    if FirebaseDB.keys_in_date_order(entity_type):
+        years = {month[:4] for month in months}
+        if sharded:
+            years.update(FirebaseDB.load_transaction_years(entity_type, party_id))
+        years = sorted(years | {str(datetime.datetime.now().year)}, reverse=True)
+    default_year = years[0] if sharded and years else None
+
+    periods = ([default_year] if default_year else []) + [None] + [y for y in years if y != default_year] + months
+    month = st.selectbox(
+        "📅 Period",
+        options=periods,
+        format_func=lambda x: "All history" if x is None else x,
+        key=f"{entity_type}_ledger_period_{party_id}"
+    )
+
+    if month:
+        if len(month) == 4:
+            start_date = datetime.date(int(month), 1, 1)
+            end_date = datetime.date(int(month), 12, 31)
+            first_month = f"{month}-01"
+        else:
+            start_date, end_date = month_bounds(month)
+            first_month = month
+        transactions, archived_ids = load_ledger_transactions(entity_type, party_id, start_date, end_date)
+        if checkpoints is not None:
+            opening = opening_balance_cents(checkpoints, first_month) / 100
+        else:
+            # No checkpoints yet: the opening balance needs the full history, archive included
+            start = start_date.strftime('%Y-%m-%d')
+            history, _ = load_ledger_transactions(entity_type, party_id)
+            opening = calculate_balance([t for t in history.values() if t.get('date', '') < start])
+    else:
+        transactions, archived_ids = load_ledger_transactions(entity_type, party_id)
+        opening = 0.0
+
+    if not transactions:
+        st.info("No transactions in this period." if month else "No transactions recorded yet.")
+    else:
+        # Date-prefixed keys give ledger order directly
+        transactions_list = [{**t, 'id': trans_id} for trans_id, t in ordered_transactions(transactions)]
+
+        # Typed columns; formatting is declared once through column_config
+        ledger_df = pd.DataFrame({
+            "ID": [t['id'] for t in transactions_list],
+            "Date": pd.to_datetime([t.get('date', '') for t in transactions_list], format='%Y-%m-%d', errors='coerce'),
+            "Particulars": [t.get('particular', '') for t in transactions_list],
+            "Debit": pd.to_numeric(pd.Series([t.get('debit', 0) for t in transactions_list]), errors='coerce').fillna(0.0),
+            "Credit": pd.to_numeric(pd.Series([t.get('credit', 0) for t in transactions_list]), errors='coerce').fillna(0.0)
+        })
+        ledger_df["Balance"] = opening + (ledger_df["Credit"] - ledger_df["Debit"]).cumsum()
+
+        # Zero amounts show as blanks
+        display_df = ledger_df.assign(
+            Debit=ledger_df["Debit"].where(ledger_df["Debit"] > 0),
+            Credit=ledger_df["Credit"].where(ledger_df["Credit"] > 0)
+        )
+        totals_row = pd.DataFrame([{
+            "ID": "",
+            "Particulars": "📊 TOTAL",
+            "Debit": ledger_df["Debit"].sum(),
+            "Credit": ledger_df["Credit"].sum(),
+            "Balance": opening + (ledger_df["Credit"] - ledger_df["Debit"]).sum()
+        }])
+        frames = [display_df, totals_row]
+        if month:
+            frames.insert(0, pd.DataFrame([{"ID": "", "Particulars": "Opening Balance", "Balance": opening}]))
+
+        st.dataframe(
+            pd.concat(frames, ignore_index=True).set_index("ID"),
+            use_container_width=True,
+            column_config=ledger_column_config()
+        )
+
+        # Export to Excel
+        if st.button("📥 Export Ledger to Excel", key=f"export_{entity_type}_{party_id}"):
+            export_df = ledger_df.drop(columns=["ID"]).assign(Date=ledger_df["Date"].dt.date)
+
+            period = f"_{month}" if month else ""
+            filename = f"{entity_type}_ledger_{party.get('name', 'unknown').replace(' ', '_')}{period}.xlsx"
+            save_excel_file(export_df, filename)
+
+        # Transaction actions
+        st.subheader("⚙️ Transaction Actions")
+
+        # Archived periods are closed and read-only
+        transaction_labels = {
+            t['id']: f"{t.get('date', '')} - {t.get('particular', '')}"
+            for t in transactions_list if t['id'] not in archived_ids
+        }
+        if not transaction_labels:
+            st.info("🧊 These transactions are archived and read-only.")
+
+        selected_transaction_id = st.selectbox(
+            "Select transaction to edit/delete",
+            options=list(transaction_labels.keys()),
+            format_func=lambda x: transaction_labels.get(x, ""),
+            key=f"{entity_type}_transaction_select"
+        )
+
+        if selected_transaction_id:
+            col1, col2 = st.columns(2)
+
+            with col1:
+                if st.button("✏️ Edit Transaction", key=f"edit_{entity_type}_trans_{selected_transaction_id}"):
+                    st.session_state.edit_transaction = {
+                        'id': selected_transaction_id,
+                        'entity_type': entity_type,
+                        'entity_id': party_id
+                    }
+
+            with col2:
+                if st.button("🗑️ Delete Transaction", key=f"delete_{entity_type}_trans_{selected_transaction_id}"):
+                    if FirebaseDB.delete_transaction(entity_type, party_id, selected_transaction_id):
+                        st.success("✅ Transaction deleted successfully!")
+                        st.rerun()
+
+    # Edit transaction form
+    edit_transaction = st.session_state.edit_transaction
+    if (edit_transaction and
+        edit_transaction['entity_type'] == entity_type and
+        edit_transaction['entity_id'] == party_id):
+
+        transaction_id = edit_transaction['id']
+        transaction = transactions.get(transaction_id, {})
+
+        if transaction:
+            render_transaction_form(entity_type, party_id, transaction_id, transaction)
+
+def render_party_tab(entity_type):
+    """Customers and Suppliers tabs: add form, batch tools, list, profile and ledger"""
+    config = ENTITY_TYPES[entity_type]
+
+    st.header(f"{config['icon']} {config['plural']}")
+
+    all_parties = FirebaseDB.load_parties(entity_type)
+
+    # Add new party form
+    render_party_form(entity_type, all_parties)
+
+    # Period statements for every party
+    render_statement_generator(entity_type, all_parties)
+
+    # Bulk transaction import
+    render_bulk_import(entity_type, all_parties)
+
+    # Search and filter parties
+    if not all_parties:
+        st.info(f"No {entity_type}s found. Add your first {entity_type} using the form above.")
+    else:
+        # Search box
+        search_query = st.text_input(f"🔍 Search {entity_type}s by name or phone", "", key=f"{entity_type}_search")
+
+        # Filter parties based on search query
+        filtered_parties = {}
+        for party_id, party in all_parties.items():
+            if (search_query.lower() in party.get('name', '').lower() or
+                search_query in party.get('phone', '')):
+                filtered_parties[party_id] = party
+
+        # Display parties in a table
+        if filtered_parties:
+            balances = load_party_balances(entity_type)
+            df = pd.DataFrame({
+                "ID": list(filtered_parties.keys()),
+                "Name": [party.get('name', '') for party in filtered_parties.values()],
+                "Phone": [party.get('phone', '') for party in filtered_parties.values()],
+                "Balance": [balances.get(party_id, 0.0) for party_id in filtered_parties]
+            })
+
+            # Status from the sign of the balance, one vectorized pass
+            due = df["Balance"] * ENTITY_TYPES[entity_type]["due_sign"]
+            df["Status"] = np.select([due > 0, due < 0], ["🔴 Due", "🟢 Advance"], default="⚪ Settled")
+
+            st.dataframe(
+                df.set_index("ID"),
+                use_container_width=True,
+                column_config={"Balance": money_column("Balance")}
+            )
+
+            # Party selection for detailed view
+            selected_party_id = st.selectbox(
+                f"Select {entity_type} to view details",
+                options=list(filtered_parties.keys()),
+                format_func=lambda x: filtered_parties[x].get('name', 'Unknown'),
+                key=f"{entity_type}_select"
+            )
+
+            if selected_party_id:
+                st.session_state[f"current_{entity_type}"] = selected_party_id
+        else:
+            st.info(f"No {entity_type}s match your search criteria.")
+
+    # Display party profile and ledger
+    party_id = st.session_state[f"current_{entity_type}"]
+    if party_id:
+        party = all_parties.get(party_id, {})
+
+        if party:
+            checkpoints = load_party_checkpoints(entity_type, party_id)
+            if checkpoints is not None:
+                balance = closing_balance(checkpoints)
+            else:
+                missing = archive_unavailable(entity_type)
+                if missing:
+                    st.warning(f"⚠️ {missing} Balances here leave out archived periods until checkpoints are rebuilt where the archive is.")
+                history, _ = load_ledger_transactions(entity_type, party_id)
+                balance = calculate_balance(list(history.values()))
+            render_party_profile(entity_type, party_id, party, all_parties, balance)
+            render_party_ledger(entity_type, party_id, party, checkpoints)
+
+def record_script_run():
+    """Store this run's duration; the first run of a process is logged against the startup budget"""
+    profile = startup_profile()
+    elapsed_ms = (time.perf_counter() - _script_started) * 1000
+    profile["last_run_ms"] = elapsed_ms
+
+    if profile["first_run_ms"] is None:
+        profile["first_run_ms"] = elapsed_ms
+
+    if not profile["logged"]:
+        profile["logged"] = True
+        report = {
+            "event": "startup_profile",
+            "first_run_ms": round(profile["first_run_ms"], 1),
+            "budget_ms": STARTUP_BUDGET_MS,
+            "imports_ms": {name: round(ms, 1) for name, ms in profile["imports"].items()}
+        }
+        if profile["first_run_ms"] > STARTUP_BUDGET_MS:
+            logger.warning(json.dumps(report))
+        else:
+            logger.info(json.dumps(report))
+
+def render_startup_profile():
+    """Cold import timings and script run times for this process"""
+    profile = startup_profile()
+
+    with st.expander("⏱️ Startup Profile", expanded=False):
+        first_run_ms = profile["first_run_ms"]
+        col1, col2, col3 = st.columns(3)
+        col1.metric("First run", f"{first_run_ms:,.0f} ms" if first_run_ms is not None else "—")
+        col2.metric("Last run", f"{profile['last_run_ms']:,.0f} ms" if profile["last_run_ms"] is not None else "—")
+        col3.metric("Budget", f"{STARTUP_BUDGET_MS:,} ms")
+
+        if first_run_ms is not None and first_run_ms > STARTUP_BUDGET_MS:
+            st.warning(f"⚠️ Cold start exceeded the budget by {first_run_ms - STARTUP_BUDGET_MS:,.0f} ms")
+
+        if profile["imports"]:
+            imports_df = pd.DataFrame(
+                sorted(profile["imports"].items(), key=lambda x: x[1], reverse=True),
+                columns=["Module", "Import (ms)"]
+            )
+            st.dataframe(imports_df.round(1), use_container_width=True, hide_index=True)
+        else:
+            st.info("No module imports recorded in this process.")
+
+# On-demand profiling: one rerun under cProfile, for sessions opened with ?profile=<key>
+PROFILE_TOP_FUNCTIONS = 40
+
+def profiler_allowed():
+    """The profiler needs ?profile= in the URL matching [diagnostics] profile_key in secrets; it stays off without a key"""
+    requested = st.query_params.get("profile")
+    if not requested:
+        return False
+    try:
+        key = st.secrets.get("diagnostics", {}).get("profile_key")
+    except Exception:
+        key = None
+    return key is not None and requested == str(key)
+
+def run_profiled(page):
+    """Run one rerun of the page under cProfile and keep the stats in the session"""
+    profile = cProfile.Profile()
+    started = time.perf_counter()
+    profile.enable()
+    try:
+        page()
+    finally:
+        profile.disable()
+        profile.create_stats()
+        st.session_state.last_profile = {
+            "at": datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            "ms": (time.perf_counter() - started) * 1000,
+            "rows": [
+                {
+                    "Function": function,
+                    "Location": f"{os.path.basename(filename)}:{line}",
+                    "Calls": calls,
+                    "Own (ms)": own * 1000,
+                    "Total (ms)": total * 1000
+                }
+                for (filename, line, function), (_, calls, own, total, _) in profile.stats.items()
+            ],
+            # Same format as Profile.dump_stats, readable by pstats, snakeviz and flameprof
+            "raw": marshal.dumps(profile.stats)
+        }
+    # Show the results straight away
+    st.rerun()
+
+def render_profiler():
+    """Profile the next rerun and show where its time went"""
+    if not profiler_allowed():
+        return
+
+    with st.expander("🔬 Profile a Rerun", expanded="last_profile" in st.session_state):
+        st.write("Runs the next rerun of this page under cProfile and lists the functions it spent time in.")
+        if st.button("🔬 Profile Next Rerun", key="profile_rerun"):
+            st.session_state.profile_next_run = True
+            st.rerun()
+
+        result = st.session_state.get("last_profile")
+        if not result:
+            return
+
+        st.caption(f"Rerun at {result['at']} took {result['ms']:,.0f} ms under the profiler")
+        sort = st.radio("Sort by", ["Total (ms)", "Own (ms)", "Calls"], horizontal=True, key="profile_sort")
+        profile_df = pd.DataFrame(result["rows"]).sort_values(sort, ascending=False).head(PROFILE_TOP_FUNCTIONS)
+        st.dataframe(profile_df.round(2), use_container_width=True, hide_index=True)
+        st.download_button(
+            label="📥 Download Profile (.prof)",
+            data=result["raw"],
+            file_name=f"rerun_{result['at'].replace(' ', '_').replace(':', '')}.prof",
+            mime="application/octet-stream",
+            key="profile_download"
+        )
+        st.caption("Open it with `python -m pstats`, or snakeviz / flameprof for a flame graph.")
+
+def render_warm_cache():
+    """Warm snapshot status for this process"""
+    snapshot = warm_cache()
+
+    with st.expander("🧊 Warm Snapshot", expanded=False):
+        if snapshot is None:
+            st.info("The on-disk warm snapshot is off. Start the app with `LEDGER_WARM_CACHE=1` so a restarted "
+                    "process loads parties and transactions from disk and only fetches what changed since.")
+            return
+
+        status = snapshot.status()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Loaded from disk", f"{status['loaded_rows']:,} subtrees")
+        col2.metric("Mirrored now", f"{status['rows']:,} subtrees")
+        col3.metric("Data version", status["version"] if status["version"] is not None else "—")
+        st.caption(f"Snapshot file: `{WARM_CACHE_PATH}` · last synced {status['synced_at'] or 'never'}")
+
+        if st.button("🔄 Reload Snapshot", key="warm_cache_reload"):
+            snapshot.invalidate()
+            clear_data_cache()
+            st.success("✅ The snapshot will be reloaded from Firebase on the next read")
+
+MIGRATION_BATCH_SIZE = 250  # transactions per multi-path update
+
+def rekey_updates(entity_type, all_transactions):
+    """Per-transaction updates moving legacy random keys (and their hash index entries) to date-prefixed keys, oldest first"""
+    legacy = [
+        (entity_id, trans_id, transaction)
+        for entity_id, transactions in all_transactions.items() if transactions
+        for trans_id, transaction in transactions.items()
+        if not is_dated_key(trans_id) and transaction.get('date')
+    ]
+    # Keys minted in date order keep same-day entries in their original relative order
+    legacy.sort(key=lambda item: item[2].get('date', ''))
+
+    for entity_id, trans_id, transaction in legacy:
+        new_id = transaction_key(transaction['date'])
+        yield {
+            FirebaseDB.transaction_path(entity_type, entity_id, new_id): transaction,
+            f"{entity_type}_transactions/{entity_id}/{trans_id}": None,
+            # The hash index follows the transaction to its new key
+            **fingerprint_updates(entity_type, entity_id, {trans_id: transaction}, {new_id: transaction})
+        }
+
+def shard_updates(entity_type, raw_transactions):
+    """Per-transaction updates moving flat transactions into year shards, rekeying legacy keys on the way"""
+    # Snapshot the keys first; each applied batch reshapes the cached tree
+    for entity_id, node in list(raw_transactions.items()):
+        base = f"{entity_type}_transactions/{entity_id}"
+        for trans_id, transaction in list((node or {}).items()):
+            if is_year_shard(trans_id) or not isinstance(transaction, dict):
+                continue
+            new_id = trans_id
+            if not is_dated_key(trans_id):
+                if not transaction.get('date'):
+                    continue
+                new_id = transaction_key(transaction['date'])
+            updates = {
+                f"{base}/{new_id[:4]}/{new_id}": transaction,
+                f"{base}/{trans_id}": None
+            }
+            if new_id != trans_id:
+                updates.update(fingerprint_updates(entity_type, entity_id, {trans_id: transaction}, {new_id: transaction}))
+            yield updates
+
+def count_unsharded(raw_transactions):
+    return sum(
+        1 for node in raw_transactions.values() if node
+        for key in node if not is_year_shard(key)
+    )
+
+def render_shard_migration():
+    """Move every party's transactions into year shards"""
+    with st.expander("🗂️ Year-Sharded Transactions", expanded=False):
+        st.write("Sharding stores each party's transactions under one node per year, so ledgers read only "
+                 "the years they show and no single read grows with the whole history.")
+
+        # Status comes from meta/sharded and the party counters; the trees are only read to migrate
+        states = {entity_type: FirebaseDB.shard_state(entity_type) for entity_type in ENTITY_TYPES}
+        if all(state == "done" for state in states.values()):
+            # Verify Data reports stragglers; running the migration again moves them
+            st.success("✅ All transactions are sharded by year.")
+        else:
+            counts = FirebaseDB.load_counts()
+            for entity_type, config in ENTITY_TYPES.items():
+                state = states[entity_type]
+                if state == "done":
+                    st.write(f"{config['plural']}: sharded by year.")
+                elif state == "migrating":
+                    st.write(f"{config['plural']}: the migration was interrupted; run it again to finish.")
+                else:
+                    st.write(f"{config['plural']}: {counts.get(entity_type, 0)} parties store transactions flat.")
+
+        if st.button("🗂️ Shard Transactions", key="shard_transactions"):
+            raw = {entity_type: FirebaseDB._cached_get(f"{entity_type}_transactions") or {} for entity_type in ENTITY_TYPES}
+            total = sum(count_unsharded(tree) for tree in raw.values())
+            progress = st.progress(0.0, text="Sharding...")
+            done = 0
+            for entity_type in ENTITY_TYPES:
+                # New writes go to shards while the existing ones are moved
+                if not FirebaseDB.batch_update({f"meta/sharded/{entity_type}": "migrating"}):
+                    return
+                batch = {}
+                for pair in shard_updates(entity_type, raw[entity_type]):
+                    batch.update(pair)
+                    done += 1
+                    if len(batch) >= MIGRATION_BATCH_SIZE * 2:
+                        if not FirebaseDB.batch_update(batch):
+                            return
+                        batch = {}
+                        progress.progress(min(done / max(total, 1), 1.0), text=f"Sharded {done} of {total}")
+                if batch and not FirebaseDB.batch_update(batch):
+                    return
+                if not FirebaseDB.batch_update({f"meta/sharded/{entity_type}": "done"}):
+                    return
+            progress.progress(1.0, text=f"✅ Sharded {done} transactions")
+
+def render_key_migration():
+    """One-off rekeying of legacy transaction keys"""
+    with st.expander("🔑 Date-Sortable Transaction Keys", expanded=False):
+        if all(FirebaseDB.keys_in_date_order(entity_type) for entity_type in ENTITY_TYPES):
+            st.success("✅ All transactions use date-sortable keys.")
+            return
+
+        legacy_counts = {
+            entity_type: sum(
+                1 for transactions in FirebaseDB.load_all_transactions(entity_type).values() if transactions
+                for trans_id in transactions if not is_dated_key(trans_id)
+            )
+            for entity_type in ENTITY_TYPES
+        }
+        total = sum(legacy_counts.values())
+
+        if not total:
+            st.success("✅ All transactions use date-sortable keys.")
+            return
+
+        st.write(f"{total} transactions still use random keys and are sorted by date on every render.")
+        if st.button("🔑 Rekey Transactions", key="rekey_transactions"):
+            progress = st.progress(0.0, text="Rekeying...")
+            done = 0
+            for entity_type in ENTITY_TYPES:
+                batch = {}
+                for pair in rekey_updates(entity_type, FirebaseDB.load_all_transactions(entity_type)):
+                    batch.update(pair)
+                    done += 1
+                    if len(batch) >= MIGRATION_BATCH_SIZE * 2:
+                        if not FirebaseDB.batch_update(batch):
+                            return
+                        batch = {}
+                        progress.progress(min(done / total, 1.0), text=f"Rekeyed {done} of {total}")
+                if batch and not FirebaseDB.batch_update(batch):
+                    return
+            progress.progress(1.0, text=f"✅ Rekeyed {done} transactions")
+
+def render_checkpoints():
+    """Checkpoint status per entity type with a full rebuild"""
+    with st.expander("📆 Monthly Balance Checkpoints", expanded=False):
+        st.write("Checkpoints keep each party's monthly totals so balances, "
+                 "statements and period ledgers do not have to replay the whole history.")
+
+        for entity_type, config in ENTITY_TYPES.items():
+            built_at = FirebaseDB._cached_get(f"meta/checkpoints/{entity_type}")
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                if built_at:
+                    st.success(f"✅ {config['plural']}: maintained since {built_at}")
+                else:
+                    st.warning(f"⚠️ {config['plural']}: not built yet, balances are computed from full history")
+            with col2:
+                if st.button("🔄 Rebuild", key=f"rebuild_checkpoints_{entity_type}"):
+                    if FirebaseDB.rebuild_checkpoints(entity_type):
+                        st.success(f"✅ {config['plural']} checkpoints rebuilt")
+
+def render_daily_totals():
+    """Daily rollup status with a backfill over the full history"""
+    with st.expander("📈 Daily Totals", expanded=False):
+        st.write("Daily totals keep each day's debit and credit sums per book so dashboard trends "
+                 "and period figures read a few hundred rows instead of every transaction.")
+
+        built_at = FirebaseDB._cached_get("meta/daily_totals")
+        if built_at:
+            st.success(f"✅ Maintained since {built_at}")
+        else:
+            st.warning("⚠️ Not built yet, dashboard trends are hidden until the backfill runs")
+
+        if st.button("🔄 Backfill Daily Totals", key="rebuild_daily_totals"):
+            with st.spinner("Summing transaction history..."):
+                if FirebaseDB.rebuild_daily_totals():
+                    st.success("✅ Daily totals rebuilt")
+
+# Cold archive: closed periods move out of Firebase into local Parquet files,
+# one file per entity type and year; checkpoints keep the balances in the live tree
+ARCHIVE_DIR = os.path.join(LEDGER_DATA_DIR, "archive")
+ARCHIVE_COLUMNS = ["entity_id", "id", "date", "particular", "debit", "credit"]
+ARCHIVE_COMPRESSION = "zstd"
+
+def archive_path(entity_type, year):
+    return os.path.join(ARCHIVE_DIR, entity_type, f"{year}.parquet")
+
+def archive_years(entity_type):
+    folder = os.path.join(ARCHIVE_DIR, entity_type)
+    if not os.path.isdir(folder):
+        return []
+    return sorted(int(name[:4]) for name in os.listdir(folder) if re.match(r'^\d{4}\.parquet$', name))
+
+@st.cache_data(show_spinner=False)
+def _read_archive_file(path, mtime):
+    # mtime is part of the cache key so a rewritten partition is read again
+    timed_import("pyarrow")
+    return pd.read_parquet(path, engine="pyarrow")
+
+def archive_unavailable(entity_type):
+    """Why this host cannot see the book's archived periods, or None when it can (or there are none).
+
+    The boundary lives in Firebase but the partitions are local files, so a fresh host or
+    container may know periods are archived without holding any of them."""
+    boundary = FirebaseDB.archive_boundary(entity_type)
+    if boundary and not archive_years(entity_type):
+        return (f"{ENTITY_TYPES[entity_type]['label']} transactions before {boundary} are archived, but "
+                f"{os.path.join(ARCHIVE_DIR, entity_type)} holds no archive files on this host.")
+    return None
+
+def read_archive(entity_type, start_date=None, end_date=None, entity_ids=None):
+    """Archived transactions in transactions_frame layout, reading only the years in range.
+
+    Without entity_ids the rows are limited to parties that still exist, so a party deleted
+    from another host does not come back through this host's files."""
+    if entity_ids is None:
+        entity_ids = FirebaseDB.load_parties(entity_type)
+    frames = []
+    for year in archive_years(entity_type):
+        if (start_date and year < start_date.year) or (end_date and year > end_date.year):
+            continue
+        path = archive_path(entity_type, year)
+        frames.append(_read_archive_file(path, os.path.getmtime(path)))
+
+    if not frames:
+        return pd.DataFrame(columns=ARCHIVE_COLUMNS)
+
+    df = pd.concat(frames, ignore_index=True)
+    mask = pd.Series(True, index=df.index)
+    if start_date:
+        mask &= df["date"] >= start_date.strftime('%Y-%m-%d')
+    if end_date:
+        mask &= df["date"] <= end_date.strftime('%Y-%m-%d')
+    mask &= df["entity_id"].isin(list(entity_ids))
+    return df.loc[mask]
+
+def archive_to_transactions(df):
+    """{entity_id: {transaction_id: transaction}} from archive rows"""
+    result = {}
+    for entity_id, trans_id, date, particular, debit, credit in zip(
+        df["entity_id"], df["id"], df["date"], df["particular"], df["debit"], df["credit"]
+    ):
+        result.setdefault(entity_id, {})[trans_id] = {
+            'date': date,
+            'particular': particular,
+            'debit': str(float(debit)),
+            'credit': str(float(credit))
+        }
+    return result
+
+def write_archive(entity_type, df):
+    """Merge rows into their yearly partitions, replacing each file atomically"""
+    timed_import("pyarrow")
+    os.makedirs(os.path.join(ARCHIVE_DIR, entity_type), exist_ok=True)
+
+    for year, rows in df.groupby(df["date"].str[:4].astype(int)):
+        path = archive_path(entity_type, year)
+        if os.path.exists(path):
+            rows = pd.concat([pd.read_parquet(path, engine="pyarrow"), rows], ignore_index=True)
+        rows = rows[ARCHIVE_COLUMNS].drop_duplicates(["entity_id", "id"], keep="last")
+        rows = rows.sort_values(["entity_id", "date", "id"], kind="mergesort")
+        _replace_archive_file(path, rows)
+
+def _replace_archive_file(path, rows):
+    temp_path = f"{path}.tmp"
+    rows.to_parquet(temp_path, engine="pyarrow", compression=ARCHIVE_COMPRESSION, index=False)
+    with open(temp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+def purge_archive(entity_type, entity_id):
+    """Drop a deleted party's rows from every yearly partition; returns the rows removed"""
+    removed = 0
+    for year in archive_years(entity_type):
+        path = archive_path(entity_type, year)
+        rows = pd.read_parquet(path, engine="pyarrow")
+        keep = rows["entity_id"] != entity_id
+        if keep.all():
+            continue
+        removed += int((~keep).sum())
+        if keep.any():
+            _replace_archive_file(path, rows.loc[keep])
+        else:
+            os.remove(path)
+    return removed
+
+def archive_transactions(entity_type, cutoff, on_progress=None):
+    """Move transactions dated before cutoff into the archive; returns (paths removed, paths to remove).
+
+    Rows are deleted from Firebase only after the archive files are on disk, so a run that
+    stops short leaves the rest live and can simply be repeated."""
+    cutoff_str = cutoff.strftime('%Y-%m-%d')
+    df = transactions_frame(FirebaseDB.load_all_transactions(entity_type))
+    old = df[(df["date"] < cutoff_str) & df["date"].str.match(r'^\d{4}-\d{2}-\d{2}$')]
+    if old.empty:
+        return 0, 0
+
+    write_archive(entity_type, old)
+    paths = [
+        path
+        for entity_id, trans_id in zip(old["entity_id"], old["id"])
+        for path in FirebaseDB.transaction_paths(entity_type, entity_id, trans_id)
+    ]
+
+    # Readers must know about the archive before the rows leave the live tree
+    boundary = max(FirebaseDB.archive_boundary(entity_type) or "", cutoff_str)
+    if not FirebaseDB.batch_update({f"meta/archive/{entity_type}": boundary}):
+        return 0, len(paths)
+
+    moved = 0
+    for start in range(0, len(paths), MIGRATION_BATCH_SIZE):
+        batch = paths[start:start + MIGRATION_BATCH_SIZE]
+        if not FirebaseDB.batch_update(dict.fromkeys(batch)):
+            break
+        moved += len(batch)
+        if on_progress:
+            on_progress(moved, len(paths))
+    return moved, len(paths)
+
+def load_ledger_transactions(entity_type, party_id, start_date=None, end_date=None):
+    """Live and archived transactions of one party; returns (transactions, archived ids)"""
+    boundary = FirebaseDB.archive_boundary(entity_type)
+
+    # Back-dated entries can land live in an archived month, so the live range is always read
+    if start_date or end_date:
+        live = FirebaseDB.load_transactions_range(entity_type, party_id, start_date, end_date)
+    else:
+        live = FirebaseDB.load_transactions(entity_type, party_id)
+
+    archived = {}
+    if boundary and (start_date is None or start_date.strftime('%Y-%m-%d') < boundary):
+        archived = archive_to_transactions(read_archive(entity_type, start_date, end_date, [party_id])).get(party_id, {})
+
+    return {**archived, **live}, set(archived)
+
+def render_archive():
+    """Archive closed periods to local Parquet files"""
+    with st.expander("🧊 Archive Closed Periods", expanded=False):
+        st.write("Transactions before the chosen month move from Firebase into compressed Parquet files under "
+                 f"`{ARCHIVE_DIR}`. Balances stay exact through the monthly checkpoints, and ledgers and "
+                 "statements read archived periods from disk.")
+
+        for entity_type, config in ENTITY_TYPES.items():
+            boundary = FirebaseDB.archive_boundary(entity_type)
+            years = archive_years(entity_type)
+            if boundary:
+                st.info(f"🧊 {config['plural']}: archived before {boundary} ({', '.join(map(str, years)) or 'no files on this host'})")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            entity_type = st.selectbox(
+                "Book",
+                options=list(ENTITY_TYPES.keys()),
+                format_func=lambda x: ENTITY_TYPES[x]["plural"],
+                key="archive_entity_type"
+            )
+        with col2:
+            today = datetime.datetime.now().date()
+            cutoff = st.date_input(
+                "📅 Archive transactions before",
+                value=today.replace(year=today.year - 1, month=1, day=1),
+                key="archive_cutoff"
+            ).replace(day=1)
+
+        if st.button(f"🧊 Archive before {cutoff.strftime('%Y-%m-%d')}", key="archive_run"):
+            if not FirebaseDB.checkpoints_ready(entity_type):
+                st.error("❌ Build the monthly checkpoints for this book first; archived balances are carried by them.")
+                return
+            try:
+                timed_import("pyarrow")
+            except ImportError:
+                st.error("❌ Archiving needs the pyarrow package. Install it with `pip install pyarrow`.")
+                return
+
+            progress = st.progress(0.0, text="Writing archive...")
+            moved, total = archive_transactions(
+                entity_type, cutoff,
+                on_progress=lambda done, total: progress.progress(done / total, text=f"Archived {done} of {total}")
+            )
+            if moved < total:
+                st.error(f"❌ Archived {moved} of {total} transaction paths; the rest are still live. Run the archive again.")
+            else:
+                progress.progress(1.0, text=f"✅ Archived {moved} transaction paths")
+            # Archived rows left the live tree; the next search rebuilds from live and archive
+            search_index().invalidate()
+
+# Analytics export: the whole book as typed Parquet for pandas/Arrow notebooks
+ANALYTICS_BATCH_ROWS = 50000
+
+def analytics_schemas(pa):
+    names = pa.dictionary(pa.int32(), pa.string())
+    parties = pa.schema([
+        ("entity_type", names),
+        ("entity_id", pa.string()),
+        ("name", names),
+        ("phone", pa.string()),
+        ("email", pa.string()),
+        ("created_on", pa.date32())
+    ])
+    transactions = pa.schema([
+        ("entity_type", names),
+        ("entity_id", pa.string()),
+        ("party_name", names),
+        ("transaction_id", pa.string()),
+        ("date", pa.date32()),
+        ("particular", pa.string()),
+        ("debit_cents", pa.int64()),
+        ("credit_cents", pa.int64()),
+        ("archived", pa.bool_())
+    ])
+    return parties, transactions
+
+def _parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+def _record_batch(pa, schema, columns):
+    arrays = []
+    for field in schema:
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(columns[field.name], pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(columns[field.name], field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def analytics_transaction_rows():
+    """Every live and archived transaction of the book, one snapshot read per entity type"""
+    for entity_type in ENTITY_TYPES:
+        parties = FirebaseDB.load_parties(entity_type)
+        live = FirebaseDB.load_all_transactions(entity_type)
+        archived = archive_to_transactions(read_archive(entity_type)) if FirebaseDB.archive_boundary(entity_type) else {}
+
+        for entity_id in set(live) | set(archived):
+            party_name = (parties.get(entity_id) or {}).get('name', 'Unknown')
+            live_transactions = live.get(entity_id) or {}
+            for trans_id, transaction in (archived.get(entity_id) or {}).items():
+                if trans_id not in live_transactions:
+                    yield entity_type, entity_id, party_name, trans_id, transaction, True
+            for trans_id, transaction in live_transactions.items():
+                yield entity_type, entity_id, party_name, trans_id, transaction, False
+
+def write_analytics_export(on_progress=None):
+    """Zip of parties.parquet and transactions.parquet, written in record batches; returns (bytes, rows)"""
+    pa = timed_import("pyarrow")
+    pq = timed_import("pyarrow.parquet")
+    party_schema, transaction_schema = analytics_schemas(pa)
+
+    party_columns = {field.name: [] for field in party_schema}
+    for entity_type in ENTITY_TYPES:
+        for entity_id, party in FirebaseDB.load_parties(entity_type).items():
+            party_columns["entity_type"].append(entity_type)
+            party_columns["entity_id"].append(entity_id)
+            party_columns["name"].append(party.get('name', ''))
+            party_columns["phone"].append(party.get('phone', ''))
+            party_columns["email"].append(party.get('email', ''))
+            party_columns["created_on"].append(_parse_date(party.get('created_on')))
+
+    parties_buffer = io.BytesIO()
+    pq.write_table(pa.Table.from_batches([_record_batch(pa, party_schema, party_columns)]), parties_buffer, compression=ARCHIVE_COMPRESSION)
+
+    transactions_buffer = io.BytesIO()
+    rows = 0
+    with pq.ParquetWriter(transactions_buffer, transaction_schema, compression=ARCHIVE_COMPRESSION) as writer:
+        columns = {field.name: [] for field in transaction_schema}
+        for entity_type, entity_id, party_name, trans_id, transaction, archived in analytics_transaction_rows():
+            columns["entity_type"].append(entity_type)
+            columns["entity_id"].append(entity_id)
+            columns["party_name"].append(party_name)
+            columns["transaction_id"].append(trans_id)
+            columns["date"].append(_parse_date(transaction.get('date')))
+            columns["particular"].append(transaction.get('particular', ''))
+            columns["debit_cents"].append(to_cents(transaction.get('debit')))
+            columns["credit_cents"].append(to_cents(transaction.get('credit')))
+            columns["archived"].append(archived)
+            rows += 1
+
+            if len(columns["transaction_id"]) >= ANALYTICS_BATCH_ROWS:
+                writer.write_batch(_record_batch(pa, transaction_schema, columns))
+                columns = {field.name: [] for field in transaction_schema}
+                if on_progress:
+                    on_progress(rows)
+
+        if columns["transaction_id"]:
+            writer.write_batch(_record_batch(pa, transaction_schema, columns))
+
+    # Parquet is already compressed; the zip only bundles the two files
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_STORED) as bundle:
+        bundle.writestr("parties.parquet", parties_buffer.getvalue())
+        bundle.writestr("transactions.parquet", transactions_buffer.getvalue())
+    return archive.getvalue(), rows
+
+def search_documents():
+    """(key, transaction) pairs for every live and archived transaction"""
+    for entity_type in ENTITY_TYPES:
+        live = FirebaseDB.load_all_transactions(entity_type)
+        for entity_id, transactions in live.items():
+            for trans_id, transaction in (transactions or {}).items():
+                yield (entity_type, entity_id, trans_id), transaction
+
+        if FirebaseDB.archive_boundary(entity_type):
+            for entity_id, transactions in archive_to_transactions(read_archive(entity_type)).items():
+                live_transactions = live.get(entity_id) or {}
+                for trans_id, transaction in transactions.items():
+                    if trans_id not in live_transactions:
+                        yield (entity_type, entity_id, trans_id), transaction
+
+def current_search_index():
+    """The search index, rebuilt once whenever the data version has moved past it"""
+    index = search_index()
+    version = FirebaseDB.data_version()
+    if index.version is None or index.version < version:
+        index.rebuild(version, search_documents())
+    return index
+
+def render_transaction_search(all_parties):
+    """Global search over transaction particulars across every party"""
+    st.subheader("🔎 Search Transactions")
+    query = st.text_input("Search particulars (invoice numbers, items...)", "", key="transaction_search")
+    if not query.strip():
+        return
+
+    index = current_search_index()
+    started = time.perf_counter()
+    hits = index.search(query)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    if not hits:
+        st.info(f"No transactions match '{query}'.")
+        return
+
+    entities = [
+        f"{all_parties.get(entity_type, {}).get(entity_id, {}).get('name', 'Unknown')} ({ENTITY_TYPES[entity_type]['label']})"
+        for _, (entity_type, entity_id, _), _ in hits
+    ]
+    df = transactions_display_frame([transaction for _, _, transaction in hits], entities)
+    df["Score"] = [score for score, _, _ in hits]
+
+    st.dataframe(
+        df,
+        use_container_width=True,
+        hide_index=True,
+        column_config={**ledger_column_config(), "Score": st.column_config.NumberColumn("Score", format="%.2f")}
+    )
+    st.caption(f"{len(hits)} best matches in {elapsed_ms:.1f} ms")
+
+# Cross-ledger queries over an in-memory column table with sorted range indexes
+QUERY_PAGE_SIZE = 100
+QUERY_SORT_COLUMNS = {
+    "date": "Date",
+    "amount": "Amount",
+    "debit": "Debit",
+    "credit": "Credit",
+    "party": "Party",
+    "particular": "Particulars"
+}
+
+def book_frame():
+    """Every live and archived transaction of the book as one DataFrame"""
+    frames = []
+    for entity_type in ENTITY_TYPES:
+        df = transactions_frame(FirebaseDB.load_all_transactions(entity_type))
+        if FirebaseDB.archive_boundary(entity_type):
+            df = pd.concat([read_archive(entity_type), df], ignore_index=True)
+            df = df.drop_duplicates(["entity_id", "id"], keep="last")
+        names = {party_id: party.get('name', 'Unknown') for party_id, party in FirebaseDB.load_parties(entity_type).items()}
+        frames.append(df.assign(entity_type=entity_type, party=df["entity_id"].map(names).fillna("Unknown")))
+    return pd.concat(frames, ignore_index=True)
+
+class TransactionTable:
+    """Column arrays of the whole book plus argsort indexes for date and amount ranges"""
+
+    def __init__(self, version, frame):
+        self.version = version
+        self.frame = frame.reset_index(drop=True)
+        self.frame["entity_type"] = self.frame["entity_type"].astype("category")
+        self.frame["entity_id"] = self.frame["entity_id"].astype("category")
+        self.frame["party"] = self.frame["party"].astype("category")
+        self.entity_types = self.frame["entity_type"].astype(str).to_numpy()
+
+        self.columns = {
+            "date": pd.to_numeric(self.frame["date"].str.replace("-", ""), errors="coerce").fillna(0).astype("int64").to_numpy(),
+            "debit": (self.frame["debit"] * 100).round().astype("int64").to_numpy(),
+            "credit": (self.frame["credit"] * 100).round().astype("int64").to_numpy()
+        }
+        self.columns["amount"] = self.columns["debit"] + self.columns["credit"]
+
+        # Each index is (row order, values in that order) so a range is two binary searches
+        self.indexes = {}
+        for name, values in self.columns.items():
+            order = np.argsort(values, kind="stable")
+            self.indexes[name] = (order, values[order])
+
+    def _range_rows(self, name, low, high):
+        order, ordered = self.indexes[name]
+        start = np.searchsorted(ordered, low, side="left") if low is not None else 0
+        end = np.searchsorted(ordered, high, side="right") if high is not None else len(ordered)
+        return order[start:end]
+
+    def query(self, start_date=None, end_date=None, side="amount", min_cents=None, max_cents=None,
+              entity_type=None, entity_ids=None):
+        """Row positions matching every filter; the narrowest range index picks the candidates"""
+        ranges = []
+        if start_date or end_date:
+            low = int(start_date.strftime('%Y%m%d')) if start_date else None
+            high = int(end_date.strftime('%Y%m%d')) if end_date else None
+            ranges.append(("date", low, high))
+        if min_cents is not None or max_cents is not None:
+            ranges.append((side, min_cents, max_cents))
+
+        if ranges:
+            candidates = [self._range_rows(*bounds) for bounds in ranges]
+            rows = min(candidates, key=len)
+        else:
+            rows = np.arange(len(self.frame))
+
+        # Remaining filters only touch the candidate rows
+        mask = np.ones(len(rows), dtype=bool)
+        for name, low, high in ranges:
+            values = self.columns[name][rows]
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+        if side in ("debit", "credit"):
+            mask &= self.columns[side][rows] > 0
+        if entity_type:
+            mask &= self.entity_types[rows] == entity_type
+        if entity_ids:
+            mask &= self.frame["entity_id"].iloc[rows].isin(list(entity_ids)).to_numpy()
+        return np.sort(rows[mask])
+
+@st.cache_resource
+def transaction_table_holder():
+    return {"table": None, "lock": threading.Lock()}
+
+def current_transaction_table():
+    """The shared query table, rebuilt once per data version"""
+    holder = transaction_table_holder()
+    version = FirebaseDB.data_version()
+    with holder["lock"]:
+        table = holder["table"]
+        if table is None or table.version < version:
+            table = holder["table"] = TransactionTable(version, book_frame())
+    return table
+
+def render_query_view():
+    """Query tab: filter, sort, page and export transactions across every ledger"""
+    st.header("🔍 Query Transactions")
+
+    all_parties = {entity_type: FirebaseDB.load_parties(entity_type) for entity_type in ENTITY_TYPES}
+    party_names = {
+        (entity_type, party_id): f"{party.get('name', 'Unknown')} ({ENTITY_TYPES[entity_type]['label']})"
+        for entity_type, parties in all_parties.items()
+        for party_id, party in parties.items()
+    }
+
+    with st.form("query_form"):
+        col1, col2, col3 = st.columns(3)
+
+        with col1:
+            start_date = st.date_input("📅 From", value=None, key="query_from")
+            end_date = st.date_input("📅 To", value=None, key="query_to")
+
+        with col2:
+            side = st.selectbox(
+                "💰 Amount",
+                options=["amount", "debit", "credit"],
+                format_func=lambda x: {"amount": "Debit or credit", "debit": "Debits only", "credit": "Credits only"}[x],
+                key="query_side"
+            )
+            min_amount = st.number_input("Minimum amount", min_value=0.0, value=0.0, format="%.2f", key="query_min")
+            max_amount = st.number_input("Maximum amount (0 = no limit)", min_value=0.0, value=0.0, format="%.2f", key="query_max")
+
+        with col3:
+            entity_type = st.selectbox(
+                "📒 Book",
+                options=[None] + list(ENTITY_TYPES.keys()),
+                format_func=lambda x: "All books" if x is None else ENTITY_TYPES[x]["plural"],
+                key="query_entity_type"
+            )
+            parties = st.multiselect(
+                "👥 Parties",
+                options=sorted(party_names, key=lambda key: party_names[key].lower()),
+                format_func=lambda key: party_names[key],
+                key="query_parties"
+            )
+            sort_by = st.selectbox(
+                "↕️ Sort by",
+                options=list(QUERY_SORT_COLUMNS.keys()),
+                format_func=lambda x: QUERY_SORT_COLUMNS[x],
+                key="query_sort"
+            )
+            descending = st.checkbox("Descending", value=True, key="query_descending")
+
+        if st.form_submit_button("🔍 Run Query"):
+            st.session_state.query_params = {
+                "start_date": start_date,
+                "end_date": end_date,
+                "side": side,
+                "min_cents": to_cents(min_amount) if min_amount > 0 else None,
+                "max_cents": to_cents(max_amount) if max_amount > 0 else None,
+                "entity_type": entity_type,
+                "entity_ids": [party_id for _, party_id in parties],
+                "sort_by": sort_by,
+                "descending": descending
+            }
+            st.session_state.query_page = 1
+
+    # The table is only built once a query has been run in this session
+    params = st.session_state.get("query_params")
+    if not params:
+        st.info("Set filters and run a query to search every ledger at once.")
+        return
+
+    table = current_transaction_table()
+    started = time.perf_counter()
+    rows = table.query(
+        params["start_date"], params["end_date"], params["side"], params["min_cents"], params["max_cents"],
+        params["entity_type"], params["entity_ids"]
+    )
+
+    # Sort the matching rows only, by column array or by label
+    sort_by = params["sort_by"]
+    if sort_by in table.columns:
+        keys = table.columns[sort_by][rows]
+    else:
+        keys = table.frame[sort_by].iloc[rows].astype(str).str.lower().to_numpy(dtype=str)
+    order = np.argsort(keys, kind="stable")
+    rows = rows[order[::-1]] if params["descending"] else rows[order]
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    total = len(rows)
+    pages = max((total + QUERY_PAGE_SIZE - 1) // QUERY_PAGE_SIZE, 1)
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.caption(f"{total:,} matching transactions of {len(table.frame):,} in {elapsed_ms:.1f} ms")
+    with col2:
+        if st.session_state.get("query_page", 1) > pages:
+            st.session_state.query_page = pages
+        page = st.number_input("Page", min_value=1, max_value=pages, key="query_page")
+
+    def result_frame(selected):
+        result = table.frame.iloc[selected]
+        return pd.DataFrame({
+            "Date": result["date"].to_numpy(),
+            "Party": result["party"].astype(str).to_numpy(),
+            "Book": result["entity_type"].map(lambda x: ENTITY_TYPES[x]["label"]).astype(str).to_numpy(),
+            "Particulars": result["particular"].to_numpy(),
+            "Debit": result["debit"].to_numpy(),
+            "Credit": result["credit"].to_numpy()
+        })
+
+    page_rows = rows[(page - 1) * QUERY_PAGE_SIZE:page * QUERY_PAGE_SIZE]
+    page_df = result_frame(page_rows)
+    page_df["Date"] = pd.to_datetime(page_df["Date"], format='%Y-%m-%d', errors='coerce')
+    st.dataframe(page_df, use_container_width=True, hide_index=True, column_config=ledger_column_config())
+
+    if total and st.button(f"📥 Export {total:,} rows to CSV", key="query_export"):
+        st.download_button(
+            label="📥 Download CSV File",
+            data=result_frame(rows).to_csv(index=False).encode("utf-8-sig"),
+            file_name=f"transactions_query_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+            mime="text/csv",
+            key="query_export_download"
+        )
+
+# Integrity checks: recompute derived data from fresh reads and diff it against what is stored
+VERIFY_WORKERS = 8
+VERIFY_CHUNK_PARTIES = 200
+
+def expected_checkpoints(df):
+    """{entity_id: {month: checkpoint}} recomputed from a transactions frame with valid dates"""
+    if df.empty:
+        return {}
+    df = df.assign(
+        month=df["date"].str[:7],
+        debit_cents=(df["debit"] * 100).round().astype("int64"),
+        credit_cents=(df["credit"] * 100).round().astype("int64")
+    )
+    monthly = df.groupby(["entity_id", "month"], sort=True).agg(
+        debit_cents=("debit_cents", "sum"),
+        credit_cents=("credit_cents", "sum"),
+        count=("id", "size")
+    )
+
+    expected = {}
+    for (entity_id, month), debit, credit, count in zip(
+        monthly.index, monthly["debit_cents"], monthly["credit_cents"], monthly["count"]
+    ):
+        expected.setdefault(entity_id, {})[month] = {
+            'debit_cents': int(debit),
+            'credit_cents': int(credit),
+            'count': int(count)
+        }
+    return expected
+
+def checkpoint_differences(expected, actual):
+    """(month, expected, found) for every month whose stored checkpoint is wrong"""
+    differences = []
+    for month in sorted(set(expected) | set(actual or {})):
+        want = expected.get(month)
+        have = (actual or {}).get(month) or {}
+        if want is None and not have.get('count') and not have.get('debit_cents') and not have.get('credit_cents'):
+            # Months emptied by deletions linger as zero increments, which is harmless
+            want = {'debit_cents': 0, 'credit_cents': 0, 'count': 0}
+
+        fields = ('debit_cents', 'credit_cents', 'count')
+        if want is None or any(int(have.get(field) or 0) != want[field] for field in fields):
+            differences.append((month, want, have or None))
+    return differences
+
+def verify_book(entity_type, on_progress=None):
+    """Verify one book from fresh Firebase reads; returns (issues, repair updates)"""
+    config = ENTITY_TYPES[entity_type]
+    collection = config["collection"]
+    issues = []
+    repairs = {}
+
+    def issue(check, party_id, detail, expected=None, found=None):
+        issues.append({
+            "Check": check,
+            "Book": config["plural"],
+            "Party": party_id,
+            "Detail": detail,
+            "Expected": "" if expected is None else str(expected),
+            "Found": "" if found is None else str(found)
+        })
+
+    parties = FirebaseDB._fetch_remote(collection) or {}
+
+    # Party count
+    stored_count = FirebaseDB._fetch_remote(f"meta/counts/{collection}")
+    if stored_count is None or int(stored_count) != len(parties):
+        issue("count", "", f"meta/counts/{collection}", len(parties), stored_count)
+        repairs[f"meta/counts/{collection}"] = len(parties)
+
+    # Duplicate phone numbers break the phone index used by imports
+    phones = {}
+    for party_id, party in parties.items():
+        phone = normalize_phone(party.get('phone'))
+        if phone:
+            phones.setdefault(phone, []).append(party_id)
+    for phone, party_ids in phones.items():
+        if len(party_ids) > 1:
+            issue("duplicate phone", ", ".join(party_ids), f"{len(party_ids)} parties share phone {phone}")
+
+    # Transaction subtrees without a party
+    transaction_keys = FirebaseDB._fetch_remote(f"{entity_type}_transactions", shallow=True) or {}
+    orphan_updates = []
+    for party_id in transaction_keys:
+        if party_id not in parties:
+            issue("orphaned transactions", party_id, f"{entity_type}_transactions/{party_id} has no party")
+            # Each transaction leaves its rollups and hash entries; the subtree deletes after them absorb the rest
+            orphaned = flatten_party(FirebaseDB._fetch_remote(f"{entity_type}_transactions/{party_id}"))
+            orphan_updates.extend(
+                transaction_change_updates(entity_type, party_id, trans_id, transaction, None)
+                for trans_id, transaction in orphaned.items() if isinstance(transaction, dict)
+            )
+            orphan_updates.append({
+                f"{entity_type}_transactions/{party_id}": None,
+                f"checkpoints/{entity_type}/{party_id}": None,
+                f"txn_hashes/{entity_type}/{party_id}": None
+            })
+    # Rollup decrements of different parties share paths, so they are summed rather than overwritten
+    repairs.update(coalesce_updates(orphan_updates))
+
+    checkpoints_ready = bool(FirebaseDB._fetch_remote(f"meta/checkpoints/{entity_type}"))
+    checkpoints = (FirebaseDB._fetch_remote(f"checkpoints/{entity_type}") or {}) if checkpoints_ready else {}
+    for party_id in checkpoints:
+        if party_id not in parties:
+            issue("orphaned checkpoints", party_id, f"checkpoints/{entity_type}/{party_id} has no party")
+            repairs[f"checkpoints/{entity_type}/{party_id}"] = None
+
+    # Without the archive partitions the expected checkpoints would be live-only; compare nothing rather than repair wrongly
+    missing = archive_unavailable(entity_type)
+    if missing and checkpoints_ready:
+        issue("archive unavailable", "", f"{missing} Checkpoints were not checked.")
+        checkpoints_ready = False
+    archived = read_archive(entity_type) if FirebaseDB.archive_boundary(entity_type) else None
+
+    # Stream the parties' transactions in parallel chunks; only per-chunk aggregates are kept
+    party_ids = [party_id for party_id in parties if party_id in transaction_keys or party_id in checkpoints]
+    fully_sharded = FirebaseDB._fetch_remote(f"meta/sharded/{entity_type}") == "done"
+    read = lambda party_id: FirebaseDB._fetch_remote(f"{entity_type}_transactions/{party_id}") or {}
+    with ThreadPoolExecutor(max_workers=VERIFY_WORKERS) as pool:
+        for start in range(0, len(party_ids), VERIFY_CHUNK_PARTIES):
+            chunk = party_ids[start:start + VERIFY_CHUNK_PARTIES]
+            records = []
+            for party_id, node in zip(chunk, pool.map(read, chunk)):
+                unsharded = [key for key in node if not is_year_shard(key)]
+                if fully_sharded and unsharded:
+                    issue("unsharded transactions", party_id, f"{len(unsharded)} transactions outside year shards; run the shard migration again")
+                records.extend(
+                    (party_id, trans_id, t.get('date'), t.get('particular', ''), t.get('debit'), t.get('credit'))
+                    for trans_id, t in flatten_party(node).items() if isinstance(t, dict)
+                )
+            raw = pd.DataFrame.from_records(records, columns=ARCHIVE_COLUMNS)
+
+            debit = pd.to_numeric(raw["debit"].fillna(0), errors="coerce")
+            credit = pd.to_numeric(raw["credit"].fillna(0), errors="coerce")
+            dates = pd.to_datetime(raw["date"], format="%Y-%m-%d", errors="coerce")
+            bad_amount = debit.isna() | credit.isna()
+            bad_date = dates.isna()
+            dated_keys = raw["id"].str.match(DATED_KEY_PATTERN.pattern)
+            key_mismatch = dated_keys & ~bad_date & (raw["id"].str[:8] != raw["date"].str.replace("-", ""))
+
+            for row in raw.loc[bad_amount].itertuples(index=False):
+                issue("unparsable amount", row.entity_id, f"{row.id}: debit={row.debit!r} credit={row.credit!r}")
+            for row in raw.loc[bad_date].itertuples(index=False):
+                issue("unparsable date", row.entity_id, f"{row.id}: date={row.date!r}")
+            for row in raw.loc[key_mismatch].itertuples(index=False):
+                issue("key date mismatch", row.entity_id, f"{row.id} is dated {row.date}")
+
+            if not checkpoints_ready:
+                if on_progress:
+                    on_progress(min(start + VERIFY_CHUNK_PARTIES, len(party_ids)), len(party_ids))
+                continue
+
+            valid = raw.loc[~bad_date].assign(debit=debit.fillna(0.0), credit=credit.fillna(0.0))
+            if archived is not None:
+                valid = pd.concat([archived[archived["entity_id"].isin(chunk)], valid], ignore_index=True)
+                valid = valid.drop_duplicates(["entity_id", "id"], keep="last")
+            expected = expected_checkpoints(valid)
+
+            for party_id in chunk:
+                party_expected = expected.get(party_id, {})
+                differences = checkpoint_differences(party_expected, checkpoints.get(party_id))
+                for month, want, have in differences:
+                    issue("checkpoint", party_id, month, want, have)
+                if differences:
+                    repairs[f"checkpoints/{entity_type}/{party_id}"] = party_expected or None
+                    stored = closing_balance(checkpoints.get(party_id))
+                    actual = closing_balance(party_expected)
+                    if round(stored - actual, 2):
+                        issue("balance", party_id, parties[party_id].get('name', ''), f"{actual:.2f}", f"{stored:.2f}")
+
+            if on_progress:
+                on_progress(min(start + VERIFY_CHUNK_PARTIES, len(party_ids)), len(party_ids))
+
+    return issues, repairs
+
+def render_verify_data():
+    """Verify derived data against the transactions and offer a repair batch"""
+    with st.expander("🩺 Verify Data", expanded="verify_result" in st.session_state):
+        st.write("Re-reads every party's transactions from Firebase and checks counts, checkpoints and balances, "
+                 "orphaned transaction subtrees, duplicate phone numbers, and unparsable amounts or dates.")
+
+        if st.button("🩺 Verify Data", key="verify_run"):
+            queue = write_queue()
+            queue.flush_now()
+            if queue.status()["pending"]:
+                st.warning("⚠️ Changes are still waiting to sync; they may show up as differences.")
+
+            issues = []
+            repairs = {}
+            progress = st.progress(0.0, text="Verifying...")
+            started = time.perf_counter()
+            for entity_type, config in ENTITY_TYPES.items():
+                book_issues, book_repairs = verify_book(
+                    entity_type,
+                    on_progress=lambda done, total, label=config["plural"]: progress.progress(
+                        done / max(total, 1), text=f"{label}: checked {done} of {total} parties"
+                    )
+                )
+                issues.extend(book_issues)
+                repairs.update(book_repairs)
+            progress.progress(1.0, text=f"✅ Verified in {time.perf_counter() - started:.1f}s")
+            st.session_state.verify_result = {"issues": issues, "repairs": repairs}
+
+        result = st.session_state.get("verify_result")
+        if not result:
+            return
+
+        if not result["issues"]:
+            st.success("✅ No differences found.")
+            return
+
+        report = pd.DataFrame(result["issues"])
+        st.error(f"❌ {len(report)} differences found")
+        st.dataframe(report.head(1000), use_container_width=True, hide_index=True)
+        st.download_button(
+            label="📥 Download Report",
+            data=report.to_csv(index=False).encode("utf-8-sig"),
+            file_name=f"verify_report_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+            mime="text/csv",
+            key="verify_report_download"
+        )
+
+        if result["repairs"]:
+            st.write(f"{len(result['repairs'])} paths can be repaired automatically. Unparsable values, key mismatches "
+                     "and duplicate phones need a manual fix.")
+            if st.button(f"🛠️ Apply {len(result['repairs'])} Repairs", key="verify_repair"):
+                if FirebaseDB.batch_update(result["repairs"]):
+                    del st.session_state.verify_result
+                    st.success("✅ Repairs applied. Verify again to confirm.")
 
-# Utility functions
-def format_currency(amount):
-    currency_symbol = st.session_state.settings.get("currency_symbol", "₹")
-    return f"{currency_symbol}{amount:,.2f}"
+def scan_duplicates():
+    """Every group of two or more transactions of one party sharing a fingerprint, from one pass over the book"""
+    df = book_frame()
+    df = df.assign(fingerprint=frame_fingerprints(df))
+    repeated = df[df.duplicated(["entity_type", "entity_id", "fingerprint"], keep=False)]
+    repeated = repeated.sort_values(["entity_type", "party", "date", "fingerprint", "id"], kind="mergesort")
+    groups = repeated.groupby(["entity_type", "entity_id", "fingerprint"], sort=False).ngroup() + 1
+    return pd.DataFrame({
+        "Group": groups,
+        "Type": repeated["entity_type"].map(lambda entity_type: ENTITY_TYPES[entity_type]["label"]),
+        "Party": repeated["party"],
+        "Date": repeated["date"],
+        "Particulars": repeated["particular"],
+        "Debit": repeated["debit"],
+        "Credit": repeated["credit"],
+        "Transaction ID": repeated["id"]
+    })
 
-def format_date(date_str):
-    try:
-        date_format = st.session_state.settings.get("date_format", "%Y-%m-%d")
-        date_obj = datetime.datetime.strptime(date_str, '%Y-%m-%d')
-        return date_obj.strftime(date_format)
-    except:
-        return date_str
+def render_duplicate_scan():
+    """Hash index status, rebuild and a whole-book duplicate report"""
+    with st.expander("🧬 Duplicate Detection", expanded="duplicate_scan" in st.session_state):
+        st.write("Each transaction is fingerprinted from its party, date, amounts and particulars so the add form, "
+                 "edit form and bulk import can warn about double-posting with one lookup.")
 
-def calculate_balance(transactions_list):
-    balance = 0
-    for transaction in transactions_list:
-        debit = float(transaction.get('debit', 0))
-        credit = float(transaction.get('credit', 0))
-        balance += credit - debit
-    return balance
+        built_at = FirebaseDB._cached_get("meta/txn_hashes")
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            if built_at:
+                st.success(f"✅ Hash index maintained since {built_at}")
+            else:
+                st.warning("⚠️ Hash index not built yet; duplicate checks scan each party's transactions until it is")
+        with col2:
+            if st.button("🔄 Rebuild", key="rebuild_fingerprints"):
+                with st.spinner("Fingerprinting transactions..."):
+                    if FirebaseDB.rebuild_fingerprints():
+                        st.success("✅ Hash index rebuilt")
 
-def save_excel_file(dataframe, default_filename="ledger_export.xlsx"):
-    """Save dataframe as Excel file using Streamlit's download button"""
-    buffer = io.BytesIO()
-    
-    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
-        dataframe.to_excel(writer, index=False)
-    
-    excel_data = buffer.getvalue()
-    
-    st.download_button(
-        label="📥 Download Excel File",
-        data=excel_data,
-        file_name=default_filename,
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    
-    return True
+        if st.button("🔎 Scan for Duplicates", key="duplicate_scan_run"):
+            with st.spinner("Scanning the whole book..."):
+                st.session_state.duplicate_scan = scan_duplicates()
+
+        report = st.session_state.get("duplicate_scan")
+        if report is None:
+            return
+        if report.empty:
+            st.success("✅ No duplicate transactions found.")
+            return
+
+        st.warning(f"⚠️ {report['Group'].max()} groups, {len(report)} transactions share a fingerprint")
+        st.dataframe(
+            report.head(1000),
+            use_container_width=True,
+            hide_index=True,
+            column_config={"Debit": money_column("Debit"), "Credit": money_column("Credit")}
+        )
+        st.download_button(
+            label="📥 Download Duplicates",
+            data=report.to_csv(index=False).encode("utf-8-sig"),
+            file_name=f"duplicates_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+            mime="text/csv",
+            key="duplicate_scan_download"
+        )
+
+def render_sync_status():
+    """Pending/synced indicator for the write queue"""
+    status = write_queue().status()
+
+    if status["failed"]:
+        st.error(f"🔴 {status['failed']} changes failed to sync. See Settings → Write Queue.")
+    elif status["pending"]:
+        retry = f" · retrying in {status['retry_in']:.0f}s" if status["retry_in"] > 1 else ""
+        st.warning(f"🟡 {status['pending']} changes pending sync{retry}")
+    else:
+        st.success("🟢 All changes synced")
+
+def render_write_queue():
+    """Write queue status with flush, retry and discard controls"""
+    queue = write_queue()
+    status = queue.status()
+
+    with st.expander("📮 Write Queue", expanded=bool(status["failed"])):
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Pending", status["pending"])
+        col2.metric("Failed", status["failed"])
+        last_synced = status["last_synced_at"]
+        col3.metric("Last sync", datetime.datetime.fromtimestamp(last_synced).strftime('%H:%M:%S') if last_synced else "—")
+
+        if status["last_error"]:
+            st.warning(f"⚠️ Last error: {status['last_error']}")
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            if st.button("⚡ Flush Now", key="write_queue_flush", disabled=not status["pending"]):
+                queue.flush_now()
+                st.rerun()
+
+        if queue.failed:
+            st.dataframe(pd.DataFrame([
+                {
+                    "Seq": entry["seq"],
+                    "Paths": ", ".join(list(entry["updates"])[:3]) + (" …" if len(entry["updates"]) > 3 else ""),
+                    "Error": entry["error"]
+                } for entry in queue.failed
+            ]), use_container_width=True, hide_index=True)
+
+            with col2:
+                if st.button("🔁 Retry Failed", key="write_queue_retry"):
+                    queue.retry_failed()
+                    st.rerun()
+
+            with col3:
+                if st.button("🗑️ Discard Failed", key="write_queue_discard"):
+                    queue.discard_failed()
+                    # The session cache still shows the discarded changes
+                    clear_data_cache()
+                    st.rerun()
+
+def render_diagnostics():
+    """Firebase call latency, counts, payload sizes and cache hit rate for this session"""
+    state = metrics_state()
+    session = state["session"]
+    runs = state["runs"]
+
+    with st.expander("🩺 Diagnostics", expanded=False):
+        last_run = runs[-1] if runs else None
+        lookups = session["cache_hits"] + session["cache_misses"]
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Calls (last rerun)", last_run["calls"] if last_run else "—")
+        col2.metric("Firebase time (last rerun)", f"{last_run['ms']:,.0f} ms" if last_run else "—")
+        col3.metric("Payload (last rerun)", f"{last_run['bytes'] / 1024:,.1f} KB" if last_run else "—")
+        col4.metric("Cache hit rate", f"{session['cache_hits'] / lookups:.0%}" if lookups else "n/a")
+
+        if runs:
+            st.write("#### Calls per rerun")
+            runs_df = pd.DataFrame(runs)[["at", "calls", "ms", "bytes", "errors", "cache_hits", "cache_misses"]]
+            st.bar_chart(runs_df.set_index("at")["calls"])
+            st.dataframe(runs_df.iloc[::-1], use_container_width=True, hide_index=True)
+
+            repeated = {path: count for path, count in last_run["per_path"].items() if count >= N_PLUS_ONE_THRESHOLD}
+            if repeated:
+                st.warning(f"⚠️ Possible N+1 reads in the last rerun: {repeated}")
+
+        if session["by_op"]:
+            st.write("#### Session totals by operation")
+            ops_df = pd.DataFrame([
+                {
+                    "Operation": op,
+                    "Calls": stats["count"],
+                    "Total (ms)": round(stats["ms"], 1),
+                    "Avg (ms)": round(stats["ms"] / stats["count"], 1),
+                    "Max (ms)": round(stats["max_ms"], 1),
+                    "KB": round(stats["bytes"] / 1024, 1),
+                    "Errors": stats["errors"]
+                } for op, stats in session["by_op"].items()
+            ])
+            st.dataframe(ops_df, use_container_width=True, hide_index=True)
+
+            st.write("#### Slowest calls this session")
+            st.dataframe(pd.DataFrame(session["slowest"]), use_container_width=True, hide_index=True)
+        else:
+            st.info("No Firebase calls recorded yet.")
+
+# Trend charts and period KPIs read a few hundred daily rollups instead of every transaction
+TREND_PERIODS = {"Last 30 days": 30, "Last 90 days": 90, "Last 365 days": 365}
+TREND_FIELDS = ["debit", "credit", "count"]
+
+def daily_totals_frame(daily, start, end):
+    """One row per day from start to end with (field, entity_type) columns of rollup totals"""
+    records = [
+        {
+            "date": date,
+            "entity_type": entity_type,
+            "debit": totals.get('debit_cents', 0) / 100,
+            "credit": totals.get('credit_cents', 0) / 100,
+            "count": totals.get('count', 0)
+        }
+        for date, books in (daily or {}).items() if isinstance(books, dict)
+        for entity_type, totals in books.items() if entity_type in ENTITY_TYPES and isinstance(totals, dict)
+    ]
+    days = pd.date_range(start, end, freq="D")
+    columns = pd.MultiIndex.from_product([TREND_FIELDS, list(ENTITY_TYPES)])
+    if not records:
+        return pd.DataFrame(0.0, index=days, columns=columns)
+
+    df = pd.DataFrame(records)
+    df["date"] = pd.to_datetime(df["date"], errors="coerce")
+    df = df.dropna(subset=["date"])
+    frame = df.pivot_table(index="date", columns="entity_type", values=TREND_FIELDS, aggfunc="sum")
+    return frame.reindex(index=days, columns=columns, fill_value=0).fillna(0)
 
-# Main app title
-st.title("🔥 Firebase Ledger Management System")
+def render_trends(net_balance):
+    """Period KPIs and daily trend charts from the daily rollups"""
+    st.subheader("📈 Trends")
 
-# Firebase status indicator
-if using_firebase:
-    st.success("🔥 **Connected to Firebase** | ☁️ **Real-time Database Active**")
-else:
-    st.error("❌ **Firebase Connection Failed** | Please check your configuration")
-    st.stop()
+    if not FirebaseDB.daily_totals_ready():
+        st.info("ℹ️ Build the daily totals under Settings → Daily Totals to see trends.")
+        return
 
-# Create tabs
-tab1, tab2, tab3, tab4 = st.tabs(["📊 Dashboard", "👥 Customers", "🏢 Suppliers", "⚙️ Settings"])
+    period = st.selectbox("Period", list(TREND_PERIODS), key="trend_period")
+    end = datetime.date.today()
+    start = end - datetime.timedelta(days=TREND_PERIODS[period] - 1)
+    frame = daily_totals_frame(FirebaseDB.load_daily_totals(start, end), start, end)
 
-# Dashboard Tab
-with tab1:
+    sales = frame[("credit", "customer")]
+    collections = frame[("debit", "customer")]
+    purchases = frame[("debit", "supplier")]
+    payments = frame[("credit", "supplier")]
+
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("🧾 Sales", format_currency(sales.sum()))
+    col2.metric("💵 Collections", format_currency(collections.sum()))
+    col3.metric("📦 Purchases", format_currency(purchases.sum()))
+    col4.metric("💸 Payments", format_currency(payments.sum()))
+    col5.metric("🔢 Transactions", int(frame["count"].sum().sum()))
+
+    # Net position walks back from today's figure through each day's movement
+    movement = (frame["credit"] - frame["debit"]).sum(axis=1)
+    net_position = net_balance - movement[::-1].cumsum()[::-1].shift(-1, fill_value=0)
+
+    go = timed_import("plotly.graph_objects")
+    activity = go.Figure()
+    for series, name, color in (
+        (sales, "Sales", "#22C55E"),
+        (collections, "Collections", "#3B82F6"),
+        (purchases, "Purchases", "#F59E0B"),
+        (payments, "Payments", "#EF4444")
+    ):
+        activity.add_trace(go.Bar(x=frame.index, y=series, name=name, marker_color=color))
+    activity.update_layout(barmode="group", height=350, margin=dict(l=10, r=10, t=30, b=10), title="Daily activity")
+    st.plotly_chart(activity, use_container_width=True)
+
+    position = go.Figure(go.Scatter(x=frame.index, y=net_position, mode="lines", name="Net Position", line=dict(color="#8B5CF6")))
+    position.update_layout(height=300, margin=dict(l=10, r=10, t=30, b=10), title="Net position")
+    st.plotly_chart(position, use_container_width=True)
+
+def render_dashboard():
+    """Dashboard tab: balances, counts and recent transactions"""
     st.header("📊 Dashboard")
     
     # Load all data for dashboard
-    all_customers = FirebaseDB.load_customers()
-    all_suppliers = FirebaseDB.load_suppliers()
+    all_parties = {entity_type: FirebaseDB.load_parties(entity_type) for entity_type in ENTITY_TYPES}
+    party_counts = FirebaseDB.load_counts()
     
-    # Calculate total receivables and payables
+    # Calculate total receivables and payables; positive balances are owed to us
     total_receivable = 0
     total_payable = 0
     
-    for customer_id, customer in all_customers.items():
-        customer_transactions = FirebaseDB.load_transactions("customer", customer_id)
-        if customer_transactions:
-            customer_balance = calculate_balance(list(customer_transactions.values()))
-            if customer_balance > 0:  # Positive balance means customer owes money
-                total_receivable += customer_balance
-            else:  # Negative balance means we owe customer
-                total_payable -= customer_balance
-    
-    for supplier_id, supplier in all_suppliers.items():
-        supplier_transactions = FirebaseDB.load_transactions("supplier", supplier_id)
-        if supplier_transactions:
-            supplier_balance = calculate_balance(list(supplier_transactions.values()))
-            if supplier_balance < 0:  # Negative balance means we owe supplier
-                total_payable -= supplier_balance
-            else:  # Positive balance means supplier owes us
-                total_receivable += supplier_balance
+    for entity_type in ENTITY_TYPES:
+        for balance in load_party_balances(entity_type).values():
+            if balance > 0:
+                total_receivable += balance
+            else:
+                total_payable -= balance
     
     # Display metrics
     col1, col2, col3 = st.columns(3)
@@ -530,7 +4692,7 @@ with tab1:
     with col1:
         st.markdown(f"""
         <div class="metric-card" style="background: linear-gradient(135deg, #1E293B 0%, #0F172A 100%); border-left: 4px solid #64748B;">
-            <div class="metric-value">{len(all_customers)}</div>
+            <div class="metric-value">{party_counts["customer"]}</div>
             <div class="metric-label">👥 Total Customers</div>
         </div>
         """, unsafe_allow_html=True)
@@ -540,674 +4702,158 @@ with tab1:
 # REPLACE with:
         st.markdown(f"""
         <div class="metric-card" style="background: linear-gradient(135deg, #1E293B 0%, #0F172A 100%); border-left: 4px solid #F59E0B;">
-            <div class="metric-value">{len(all_suppliers)}</div>
+            <div class="metric-value">{party_counts["supplier"]}</div>
             <div class="metric-label">🏢 Total Suppliers</div>
         </div>
         """, unsafe_allow_html=True)
 
     
+    render_trends(net_balance)
+
+    # Global search
+    render_transaction_search(all_parties)
+    
     # Recent transactions
     st.subheader("📋 Recent Transactions")
     
-    # Combine all transactions
-    all_transactions = []
-    
-    for customer_id, customer in all_customers.items():
-        customer_transactions = FirebaseDB.load_transactions("customer", customer_id)
-        if customer_transactions:
-            for trans_id, transaction in customer_transactions.items():
-                transaction['entity_name'] = customer.get('name', 'Unknown')
-                transaction['entity_type'] = 'Customer'
-                transaction['id'] = trans_id
-                transaction['entity_id'] = customer_id
-                all_transactions.append(transaction)
-    
-    for supplier_id, supplier in all_suppliers.items():
-        supplier_transactions = FirebaseDB.load_transactions("supplier", supplier_id)
-        if supplier_transactions:
-            for trans_id, transaction in supplier_transactions.items():
-                transaction['entity_name'] = supplier.get('name', 'Unknown')
-                transaction['entity_type'] = 'Supplier'
-                transaction['id'] = trans_id
-                transaction['entity_id'] = supplier_id
-                all_transactions.append(transaction)
-    
-    # Sort by date (most recent first)
-    all_transactions.sort(key=lambda x: x.get('date', ''), reverse=True)
-    
-    # Display recent transactions (top 10)
-    if all_transactions:
-        recent_transactions = all_transactions[:10]
-        
-        # Create DataFrame for display
-        df_transactions = []
-        
-        for transaction in recent_transactions:
-            debit = float(transaction.get('debit', 0))
-            credit = float(transaction.get('credit', 0))
-            
-            df_transactions.append({
-                "Date": format_date(transaction.get('date', '')),
-                "Entity": f"{transaction.get('entity_name', '')} ({transaction.get('entity_type', '')})",
-                "Particulars": transaction.get('particular', ''),
-                "Debit": format_currency(debit) if debit > 0 else "",
-                "Credit": format_currency(credit) if credit > 0 else ""
-            })
-        
-        df = pd.DataFrame(df_transactions)
-        st.dataframe(df, use_container_width=True)
+    # Display recent transactions (top 10, most recent first)
+    recent_transactions = load_recent_transactions(all_parties, 10)
+    if recent_transactions:
+        # Typed columns, formatted by column_config
+        df = transactions_display_frame(
+            recent_transactions,
+            [f"{t.get('entity_name', '')} ({t.get('entity_type', '')})" for t in recent_transactions]
+        )
+        st.dataframe(df, use_container_width=True, column_config=ledger_column_config())
     else:
         st.info("No transactions found. Add your first transaction in the Customers or Suppliers tab.")
 
-# Customers Tab
-with tab2:
-    st.header("👥 Customers")
-    
-    # Add new customer form
-    with st.expander("➕ Add New Customer", expanded=False):
-        with st.form("add_customer_form"):
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                new_name = st.text_input("Customer Name*")
-                new_phone = st.text_input("Phone Number*")
-            
-            with col2:
-                new_email = st.text_input("Email (Optional)")
-                new_address = st.text_area("Address (Optional)")
-            
-            submitted = st.form_submit_button("➕ Add Customer")
-            if submitted:
-                if not new_name or not new_phone:
-                    st.error("❌ Name and Phone Number are required!")
-                else:
-                    # Check if customer with same phone already exists
-                    all_customers = FirebaseDB.load_customers()
-                    exists = False
-                    for customer in all_customers.values():
-                        if customer.get('phone') == new_phone:
-                            exists = True
-                            break
-                    
-                    if exists:
-                        st.error(f"❌ Customer with phone number {new_phone} already exists!")
-                    else:
-                        customer_id = str(uuid.uuid4())
-                        customer_data = {
-                            'name': new_name,
-                            'phone': new_phone,
-                            'email': new_email,
-                            'address': new_address,
-                            'created_on': datetime.datetime.now().strftime('%Y-%m-%d')
-                        }
-                        
-                        if FirebaseDB.save_customer(customer_id, customer_data):
-                            st.success(f"✅ Customer {new_name} added successfully!")
-                            st.rerun()
-    
-    # Search and filter customers
-    all_customers = FirebaseDB.load_customers()
-    
-    if not all_customers:
-        st.info("No customers found. Add your first customer using the form above.")
-    else:
-        # Search box
-        search_query = st.text_input("🔍 Search customers by name or phone", "")
-        
-        # Filter customers based on search query
-        filtered_customers = {}
-        for customer_id, customer in all_customers.items():
-            if (search_query.lower() in customer.get('name', '').lower() or 
-                search_query in customer.get('phone', '')):
-                filtered_customers[customer_id] = customer
-        
-        # Display customers in a table
-        if filtered_customers:
-            # Prepare data for display
-            customer_data = []
-            
-            for customer_id, customer in filtered_customers.items():
-                # Load transactions for this customer
-                transactions = FirebaseDB.load_transactions("customer", customer_id)
-                # Calculate balance
-                balance = 0
-                if transactions:
-                    balance = calculate_balance(list(transactions.values()))
-                
-                # Add to display data
-                customer_data.append({
-                    "ID": customer_id,
-                    "Name": customer.get('name', ''),
-                    "Phone": customer.get('phone', ''),
-                    "Balance": format_currency(balance),
-                    "Status": "🔴 Due" if balance > 0 else "🟢 Advance" if balance < 0 else "⚪ Settled"
-                })
-            
-            # Create DataFrame
-            df = pd.DataFrame(customer_data)
-            
-            # Display table
-            st.dataframe(df.set_index("ID"), use_container_width=True)
-            
-            # Customer selection for detailed view
-            selected_customer_id = st.selectbox(
-                "Select customer to view details",
-                options=list(filtered_customers.keys()),
-                format_func=lambda x: filtered_customers[x].get('name', 'Unknown'),
-                key="customer_select"
-            )
-            
-            if selected_customer_id:
-                st.session_state.current_customer = selected_customer_id
-        else:
-            st.info("No customers match your search criteria.")
-    
-    # Display customer profile and ledger
-    if st.session_state.current_customer:
-        customer_id = st.session_state.current_customer
-        customer = all_customers.get(customer_id, {})
-        
-        if customer:
-            # Customer profile section
-            st.subheader(f"👤 Customer Profile: {customer.get('name', 'Unknown')}")
-            
-            col1, col2, col3 = st.columns([2, 2, 1])
-            
-            with col1:
-                st.write(f"**📞 Phone:** {customer.get('phone', 'N/A')}")
-                st.write(f"**📧 Email:** {customer.get('email', 'N/A')}")
-                st.write(f"**📍 Address:** {customer.get('address', 'N/A')}")
-                st.write(f"**📅 Customer since:** {format_date(customer.get('created_on', 'N/A'))}")
-            
-            with col2:
-                # Load transactions
-                transactions = FirebaseDB.load_transactions("customer", customer_id)
-                
-                # Calculate balance
-                balance = 0
-                if transactions:
-                    balance = calculate_balance(list(transactions.values()))
-                
-                # Display balance
-                balance_color = "#DC2626" if balance > 0 else "#059669" if balance < 0 else "#F59E0B"
-                status_text = "🔴 Due" if balance > 0 else "🟢 Advance" if balance < 0 else "⚪ Settled"
-                
-                st.markdown(f"""
-                <div style="background-color: {balance_color}; color: white; padding: 15px; border-radius: 8px; text-align: center;">
-                    <h3 style="margin: 0;">💰 Balance: {format_currency(balance)}</h3>
-                    <p style="margin: 5px 0 0 0; font-size: 16px;">Status: {status_text}</p>
-                </div>
-                """, unsafe_allow_html=True)
-            
-            with col3:
-                # Action buttons
-                if st.button("✏️ Edit", key=f"edit_customer_{customer_id}"):
-                    st.session_state.edit_customer = customer_id
-                
-                if st.button("🗑️ Delete", key=f"delete_customer_{customer_id}"):
-                    st.session_state.confirm_delete_customer = customer_id
-            
-            # Edit customer form
-            if st.session_state.edit_customer == customer_id:
-                with st.form(f"edit_customer_form_{customer_id}"):
-                    st.subheader("✏️ Edit Customer")
-                    
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        edit_name = st.text_input("Customer Name*", value=customer.get('name', ''))
-                        edit_phone = st.text_input("Phone Number*", value=customer.get('phone', ''))
-                    
-                    with col2:
-                        edit_email = st.text_input("Email", value=customer.get('email', ''))
-                        edit_address = st.text_area("Address", value=customer.get('address', ''))
-                    
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        update_submitted = st.form_submit_button("💾 Update Customer")
-                    
-                    with col2:
-                        cancel = st.form_submit_button("❌ Cancel")
-                    
-                    if update_submitted:
-                        if not edit_name or not edit_phone:
-                            st.error("❌ Name and Phone Number are required!")
-                        else:
-                            # Check if phone number is already used by another customer
-                            phone_exists = False
-                            for cid, cust in all_customers.items():
-                                if cid != customer_id and cust.get('phone') == edit_phone:
-                                    phone_exists = True
-                                    break
-                            
-                            if phone_exists:
-                                st.error(f"❌ Phone number {edit_phone} is already used by another customer!")
-                            else:
-                                # Update customer data
-                                updated_customer = {
-                                    'name': edit_name,
-                                    'phone': edit_phone,
-                                    'email': edit_email,
-                                    'address': edit_address,
-                                    'created_on': customer.get('created_on', datetime.datetime.now().strftime('%Y-%m-%d'))
-                                }
-                                
-                                if FirebaseDB.save_customer(customer_id, updated_customer):
-                                    st.success("✅ Customer updated successfully!")
-                                    st.session_state.edit_customer = None
-                                    st.rerun()
-                    
-                    if cancel:
-                        st.session_state.edit_customer = None
-                        st.rerun()
-            
-            # Confirm delete dialog
-            if st.session_state.confirm_delete_customer == customer_id:
-                st.warning(f"⚠️ Are you sure you want to delete customer '{customer.get('name', 'Unknown')}'? This will also delete all transactions.")
-                
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    if st.button("🗑️ Yes, Delete", key=f"confirm_delete_customer_{customer_id}"):
-                        if FirebaseDB.delete_customer(customer_id):
-                            st.success("✅ Customer deleted successfully!")
-                            st.session_state.confirm_delete_customer = None
-                            st.session_state.current_customer = None
-                            st.rerun()
-                
-                with col2:
-                    if st.button("❌ Cancel", key=f"cancel_delete_customer_{customer_id}"):
-                        st.session_state.confirm_delete_customer = None
-                        st.rerun()
-            
-            # Customer ledger section
-            st.subheader("📖 Ledger Book")
-            
-            # Add new transaction
-            with st.expander("➕ Add New Transaction", expanded=False):
-                with st.form(f"add_customer_transaction_form_{customer_id}"):
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        date_input = st.date_input(
-                            "📅 Date",
-                            value=datetime.datetime.now().date(),
-                            key=f"customer_date_input_{customer_id}"
-                        )
-                        
-                        particular = st.text_area(
-                            "📝 Particulars*", 
-                            help="Description of the transaction",
-                            key=f"customer_particular_{customer_id}"
-                        )
-                    
-                    with col2:
-                        debit = st.number_input(
-                            "💰 Debit Amount", 
-                            min_value=0.0, 
-                            format="%.2f",
-                            help="Amount customer gives (payment received)",
-                            key=f"customer_debit_{customer_id}"
-                        )
-                        
-                        credit = st.number_input(
-                            "💸 Credit Amount", 
-                            min_value=0.0, 
-                            format="%.2f",
-                            help="Amount customer takes (goods/services provided)",
-                            key=f"customer_credit_{customer_id}"
-                        )
-                    
-                    transaction_submitted = st.form_submit_button("➕ Add Transaction")
-                    
-                    if transaction_submitted:
-                        if not particular:
-                            st.error("❌ Particulars are required!")
-                        elif debit == 0 and credit == 0:
-                            st.error("❌ Either Debit or Credit amount must be greater than zero!")
-                        else:
-                            transaction_id = str(uuid.uuid4())
-                            transaction_data = {
-                                'date': date_input.strftime('%Y-%m-%d'),
-                                'particular': particular,
-                                'debit': str(debit),
-                                'credit': str(credit)
-                            }
-                            
-                            if FirebaseDB.save_transaction("customer", customer_id, transaction_id, transaction_data):
-                                st.success("✅ Transaction added successfully!")
-                                st.rerun()
-            
-            # Display transactions
-            transactions = FirebaseDB.load_transactions("customer", customer_id)
-            
-            if not transactions:
-                st.info("No transactions recorded yet.")
-            else:
-                # Convert to list and sort by date
-                transactions_list = list(transactions.values())
-                for t in transactions_list:
-                    t['id'] = next((k for k, v in transactions.items() if v == t), None)
-                
-                transactions_list.sort(key=lambda x: x.get('date', ''))
-                
-                # Create DataFrame for display
-                df_transactions = []
-                running_balance = 0
-                total_debit = 0
-                total_credit = 0
-                
-                for transaction in transactions_list:
-                    debit = float(transaction.get('debit', 0))
-                    credit = float(transaction.get('credit', 0))
-                    running_balance += debit - credit
-                    total_debit += debit
-                    total_credit += credit
-                    
-                    df_transactions.append({
-                        "ID": transaction.get('id', ''),
-                        "Date": format_date(transaction.get('date', '')),
-                        "Particulars": transaction.get('particular', ''),
-                        "Debit": format_currency(debit) if debit > 0 else "",
-                        "Credit": format_currency(credit) if credit > 0 else "",
-                        "Balance": format_currency(running_balance)
-                    })
-                
-                # Add totals row
-                df_transactions.append({
-                    "ID": "",
-                    "Date": "",
-                    "Particulars": "📊 TOTAL",
-                    "Debit": format_currency(total_debit),
-                    "Credit": format_currency(total_credit),
-                    "Balance": format_currency(running_balance)
-                })
-                
-                df = pd.DataFrame(df_transactions)
-                st.dataframe(df.set_index("ID"), use_container_width=True)
-                
-                # Export to Excel
-                if st.button("📥 Export Ledger to Excel", key=f"export_customer_{customer_id}"):
-                    export_df = pd.DataFrame([
-                        {
-                            "Date": t.get('date', ''),
-                            "Particulars": t.get('particular', ''),
-                            "Debit": float(t.get('debit', 0)),
-                            "Credit": float(t.get('credit', 0))
-                        } for t in transactions_list
-                    ])
-                    
-                    # Calculate running balance
-                    balance = 0
-                    balances = []
-                    for _, row in export_df.iterrows():
-                        balance += row['Debit'] - row['Credit']
-                        balances.append(balance)
-                    
-                    export_df['Balance'] = balances
-                    
-                    filename = f"customer_ledger_{customer.get('name', 'unknown').replace(' ', '_')}.xlsx"
-                    save_excel_file(export_df, filename)
-                
-                # Transaction actions
-                st.subheader("⚙️ Transaction Actions")
-                
-                selected_transaction_id = st.selectbox(
-                    "Select transaction to edit/delete",
-                    options=[t.get('id', '') for t in transactions_list if t.get('id', '')],
-                    format_func=lambda x: next((f"{t.get('date', '')} - {t.get('particular', '')}" for t in transactions_list if t.get('id', '') == x), ""),
-                    key="customer_transaction_select"
-                )
-                
-                if selected_transaction_id:
-                    col1, col2 = st.columns(2)
-                    
-                    with col1:
-                        if st.button("✏️ Edit Transaction", key=f"edit_customer_trans_{selected_transaction_id}"):
-                            st.session_state.edit_transaction = {
-                                'id': selected_transaction_id,
-                                'entity_type': 'customer',
-                                'entity_id': customer_id
-                            }
-                    
-                    with col2:
-                        if st.button("🗑️ Delete Transaction", key=f"delete_customer_trans_{selected_transaction_id}"):
-                            if FirebaseDB.delete_transaction("customer", customer_id, selected_transaction_id):
-                                st.success("✅ Transaction deleted successfully!")
-                                st.rerun()
-            
-            # Edit transaction form
-            if (st.session_state.edit_transaction and 
-                st.session_state.edit_transaction['entity_type'] == 'customer' and 
-                st.session_state.edit_transaction['entity_id'] == customer_id):
-                
-                transaction_id = st.session_state.edit_transaction['id']
-                transaction = transactions.get(transaction_id, {})
-                
-                if transaction:
-                    with st.form(f"edit_customer_transaction_form_{transaction_id}"):
-                        st.subheader("✏️ Edit Transaction")
-                        
-                        col1, col2 = st.columns(2)
-                        
-                        with col1:
-                            edit_date = st.date_input(
-                                "📅 Date",
-                                value=datetime.datetime.strptime(transaction.get('date', ''), '%Y-%m-%d').date(),
-                                key=f"edit_customer_date_{transaction_id}"
-                            )
-                            
-                            edit_particular = st.text_area(
-                                "📝 Particulars*", 
-                                value=transaction.get('particular', ''),
-                                help="Description of the transaction",
-                                key=f"edit_customer_particular_{transaction_id}"
-                            )
-                        
-                        with col2:
-                            edit_debit = st.number_input(
-                                "💰 Debit Amount", 
-                                min_value=0.0, 
-                                value=float(transaction.get('debit', 0)),
-                                format="%.2f",
-                                help="Amount customer gives (payment received)",
-                                key=f"edit_customer_debit_{transaction_id}"
-                            )
-                            
-                            edit_credit = st.number_input(
-                                "💸 Credit Amount", 
-                                min_value=0.0, 
-                                value=float(transaction.get('credit', 0)),
-                                format="%.2f",
-                                help="Amount customer takes (goods/services provided)",
-                                key=f"edit_customer_credit_{transaction_id}"
-                            )
-                        
-                        col1, col2 = st.columns(2)
-                        
-                        with col1:
-                            update_trans_submitted = st.form_submit_button("💾 Update Transaction")
-                        
-                        with col2:
-                            cancel_trans = st.form_submit_button("❌ Cancel")
-                        
-                        if update_trans_submitted:
-                            if not edit_particular:
-                                st.error("❌ Particulars are required!")
-                            elif edit_debit == 0 and edit_credit == 0:
-                                st.error("❌ Either Debit or Credit amount must be greater than zero!")
-                            else:
-                                updated_transaction = {
-                                    'date': edit_date.strftime('%Y-%m-%d'),
-                                    'particular': edit_particular,
-                                    'debit': str(edit_debit),
-                                    'credit': str(edit_credit)
-                                }
-                                
-                                if FirebaseDB.save_transaction("customer", customer_id, transaction_id, updated_transaction):
-                                    st.success("✅ Transaction updated successfully!")
-                                    st.session_state.edit_transaction = None
-                                    st.rerun()
-                        
-                        if cancel_trans:
-                            st.session_state.edit_transaction = None
-                            st.rerun()
-
-# Suppliers Tab
-with tab3:
-    st.header("🏢 Suppliers")
-    
-    # Add new supplier form
-    with st.expander("➕ Add New Supplier", expanded=False):
-        with st.form("add_supplier_form"):
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                new_name = st.text_input("Supplier Name*", key="supplier_name")
-                new_phone = st.text_input("Phone Number*", key="supplier_phone")
-            
-            with col2:
-                new_email = st.text_input("Email (Optional)", key="supplier_email")
-                new_address = st.text_area("Address (Optional)", key="supplier_address")
-            
-            submitted = st.form_submit_button("➕ Add Supplier")
-            if submitted:
-                if not new_name or not new_phone:
-                    st.error("❌ Name and Phone Number are required!")
-                else:
-                    # Check if supplier with same phone already exists
-                    all_suppliers = FirebaseDB.load_suppliers()
-                    exists = False
-                    for supplier in all_suppliers.values():
-                        if supplier.get('phone') == new_phone:
-                            exists = True
-                            break
-                    
-                    if exists:
-                        st.error(f"❌ Supplier with phone number {new_phone} already exists!")
-                    else:
-                        supplier_id = str(uuid.uuid4())
-                        supplier_data = {
-                            'name': new_name,
-                            'phone': new_phone,
-                            'email': new_email,
-                            'address': new_address,
-                            'created_on': datetime.datetime.now().strftime('%Y-%m-%d')
-                        }
-                        
-                        if FirebaseDB.save_supplier(supplier_id, supplier_data):
-                            st.success(f"✅ Supplier {new_name} added successfully!")
-                            st.rerun()
-    
-    # Search and filter suppliers
-    all_suppliers = FirebaseDB.load_suppliers()
-    
-    if not all_suppliers:
-        st.info("No suppliers found. Add your first supplier using the form above.")
-    else:
-        # Search box
-        search_query = st.text_input("🔍 Search suppliers by name or phone", "", key="supplier_search")
-        
-        # Filter suppliers based on search query
-        filtered_suppliers = {}
-        for supplier_id, supplier in all_suppliers.items():
-            if (search_query.lower() in supplier.get('name', '').lower() or 
-                search_query in supplier.get('phone', '')):
-                filtered_suppliers[supplier_id] = supplier
-        
-        # Display suppliers in a table
-        if filtered_suppliers:
-            # Prepare data for display
-            supplier_data = []
-            
-            for supplier_id, supplier in filtered_suppliers.items():
-                # Load transactions for this supplier
-                transactions = FirebaseDB.load_transactions("supplier", supplier_id)
-                
-                # Calculate balance
-                balance = 0
-                if transactions:
-                    balance = calculate_balance(list(transactions.values()))
-                
-                # Add to display data
-                supplier_data.append({
-                    "ID": supplier_id,
-                    "Name": supplier.get('name', ''),
-                    "Phone": supplier.get('phone', ''),
-                    "Balance": format_currency(balance),
-                    "Status": "🔴 Due" if balance < 0 else "🟢 Advance" if balance > 0 else "⚪ Settled"
-                })
-            
-            # Create DataFrame
-            df = pd.DataFrame(supplier_data)
-            
-            # Display table
-            st.dataframe(df.set_index("ID"), use_container_width=True)
-            
-            # Supplier selection for detailed view
-            selected_supplier_id = st.selectbox(
-                "Select supplier to view details",
-                options=list(filtered_suppliers.keys()),
-                format_func=lambda x: filtered_suppliers[x].get('name', 'Unknown'),
-                key="supplier_select"
-            )
-            
-            if selected_supplier_id:
-                st.session_state.current_supplier = selected_supplier_id
-        else:
-            st.info("No suppliers match your search criteria.")
-    
-    # Display supplier profile and ledger (similar structure to customers)
-    if st.session_state.current_supplier:
-        supplier_id = st.session_state.current_supplier
-        supplier = all_suppliers.get(supplier_id, {})
-        
-        if supplier:
-            # Supplier profile section
-            st.subheader(f"🏢 Supplier Profile: {supplier.get('name', 'Unknown')}")
-            
-            col1, col2, col3 = st.columns([2, 2, 1])
-            
-            with col1:
-                st.write(f"**📞 Phone:** {supplier.get('phone', 'N/A')}")
-                st.write(f"**📧 Email:** {supplier.get('email', 'N/A')}")
-                st.write(f"**📍 Address:** {supplier.get('address', 'N/A')}")
-                st.write(f"**📅 Supplier since:** {format_date(supplier.get('created_on', 'N/A'))}")
-            
-            with col2:
-                # Load transactions
-                transactions = FirebaseDB.load_transactions("supplier", supplier_id)
-                
-                # Calculate balance
-                balance = 0
-                if transactions:
-                    balance = calculate_balance(list(transactions.values()))
-                
-                # Display balance
-                balance_color = "#DC2626" if balance < 0 else "#059669" if balance > 0 else "#F59E0B"
-                status_text = "🔴 Due" if balance < 0 else "🟢 Advance" if balance > 0 else "⚪ Settled"
-                
-                st.markdown(f"""
-                <div style="background-color: {balance_color}; color: white; padding: 15px; border-radius: 8px; text-align: center;">
-                    <h3 style="margin: 0;">💰 Balance: {format_currency(balance)}</h3>
-                    <p style="margin: 5px 0 0 0; font-size: 16px;">Status: {status_text}</p>
-                </div>
-                """, unsafe_allow_html=True)
-            
-            with col3:
-                # Action buttons
-                if st.button("✏️ Edit", key=f"edit_supplier_{supplier_id}"):
-                    st.session_state.edit_supplier = supplier_id
-                
-                if st.button("🗑️ Delete", key=f"delete_supplier_{supplier_id}"):
-                    st.session_state.confirm_delete_supplier = supplier_id
-            
-            # Similar edit/delete forms and transaction management as customers
-            # (Implementation follows same pattern as customer section)
+# Backup and restore, shared by the Settings tab and ledger_cli.py
+BACKUP_CHUNK_PARTIES = 200
+BACKUP_REQUIRED_KEYS = ["customers", "suppliers", "settings", "customer_transactions", "supplier_transactions"]
+
+def backup_transactions(entity_type, party_ids):
+    """(party_id, live and archived transactions) pairs, read a chunk of parties at a time in parallel"""
+    boundary = FirebaseDB.archive_boundary(entity_type)
+    with ThreadPoolExecutor(max_workers=STATEMENT_READ_WORKERS) as pool:
+        for start in range(0, len(party_ids), BACKUP_CHUNK_PARTIES):
+            chunk = party_ids[start:start + BACKUP_CHUNK_PARTIES]
+            live = pool.map(lambda party_id: FirebaseDB.load_transactions(entity_type, party_id), chunk)
+            # Archived periods are part of the book, so they go into the backup too
+            archived = archive_to_transactions(read_archive(entity_type, entity_ids=chunk)) if boundary else {}
+            for party_id, transactions in zip(chunk, live):
+                yield party_id, {**archived.get(party_id, {}), **(transactions or {})}
+
+def write_backup(output, on_progress=None):
+    """Stream the backup document to a text file, holding one chunk of parties in memory at a time"""
+    output.write('{"settings": ' + json.dumps(current_settings()))
+    for entity_type, config in ENTITY_TYPES.items():
+        parties = FirebaseDB.load_parties(entity_type)
+        output.write(f', "{config["collection"]}": {json.dumps(parties)}')
+        output.write(f', "{entity_type}_transactions": {{')
+        for index, (party_id, transactions) in enumerate(backup_transactions(entity_type, list(parties))):
+            output.write(f'{", " if index else ""}{json.dumps(party_id)}: {json.dumps(transactions)}')
+            if on_progress:
+                on_progress(entity_type, index + 1, len(parties))
+        output.write("}")
+    output.write("}")
+
+def record_hash(record):
+    """Content hash of one record; key order and amount formatting ("100" vs "100.0") do not count"""
+    if isinstance(record, dict):
+        record = {key: (to_cents(value) if key in ('debit', 'credit') else value) for key, value in record.items()}
+    return hashlib.sha1(json.dumps(record, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")).hexdigest()
+
+def subtree_hash(records):
+    """Hash of a {key: record} subtree from its per-record hashes"""
+    digest = hashlib.sha1()
+    for key in sorted(records):
+        digest.update(f"{key}:{record_hash(records[key])};".encode("utf-8"))
+    return digest.hexdigest()
+
+def restore_updates(backup_data, delete_missing=False):
+    """Per-record multi-path updates bringing the live book to the backup; returns (record updates, deleted parties, summary).
+
+    Parties whose transaction subtree hashes match are skipped whole; otherwise only added or
+    changed records are written, each with its checkpoint, rollup, hash index and counter
+    adjustments. Records missing from the backup are deleted only when delete_missing is set."""
+    record_updates = []
+    deleted = []
+    summary = {"parties": 0, "parties_unchanged": 0, "parties_deleted": 0, "transactions": 0, "transactions_deleted": 0}
+
+    if record_hash(backup_data["settings"]) != record_hash(FirebaseDB._cached_get("settings")):
+        record_updates.append({"settings": backup_data["settings"]})
 
-# Settings Tab
-with tab4:
+    for entity_type, config in ENTITY_TYPES.items():
+        backup_parties = backup_data[config["collection"]] or {}
+        backup_transactions = backup_data[f"{entity_type}_transactions"] or {}
+        live_parties = FirebaseDB.load_parties(entity_type)
+        live_transactions = FirebaseDB.load_all_transactions(entity_type)
+        archived = archive_to_transactions(read_archive(entity_type)) if FirebaseDB.archive_boundary(entity_type) else {}
+        undated = False
+
+        for party_id, party in backup_parties.items():
+            if record_hash(party) != record_hash(live_parties.get(party_id)):
+                updates = {f"{entity_type}s/{party_id}": party}
+                if party_id not in live_parties:
+                    updates[f"meta/counts/{config['collection']}"] = increment(1)
+                record_updates.append(updates)
+                summary["parties"] += 1
+
+            wanted = backup_transactions.get(party_id) or {}
+            live = live_transactions.get(party_id) or {}
+            # Archived transactions are part of the book; a match there needs no write
+            book = {**archived.get(party_id, {}), **live}
+            if subtree_hash(wanted) == subtree_hash(book):
+                summary["parties_unchanged"] += 1
+                continue
+
+            for trans_id, transaction in wanted.items():
+                current = book.get(trans_id)
+                if current is None or record_hash(current) != record_hash(transaction):
+                    record_updates.append(transaction_change_updates(entity_type, party_id, trans_id, current, transaction))
+                    undated = undated or not is_dated_key(trans_id)
+                    summary["transactions"] += 1
+
+            if delete_missing:
+                for trans_id, transaction in live.items():
+                    if trans_id not in wanted:
+                        record_updates.append(transaction_change_updates(entity_type, party_id, trans_id, transaction, None))
+                        summary["transactions_deleted"] += 1
+
+        # Undated keys fall outside key-range reads, so checkpoints stop being trusted until a rekey and rebuild
+        if undated:
+            record_updates.append({f"meta/checkpoints/{entity_type}": None})
+
+        if delete_missing:
+            # Same deletion as delete_party, archived rows included; their files are purged once written
+            for party_id in set(live_parties) - set(backup_parties):
+                record_updates.append(FirebaseDB.party_deletion_updates(
+                    entity_type, party_id, live_transactions.get(party_id) or {}
+                ))
+                deleted.append((entity_type, party_id))
+                summary["parties_deleted"] += 1
+
+    summary["paths"] = sum(len(updates) for updates in record_updates)
+    summary["bytes"] = sum(payload_size(updates) for updates in record_updates)
+    return record_updates, deleted, summary
+
+def restore_backup(backup_data, delete_missing=False, on_progress=None):
+    """Write only the parts of a backup that differ from the live data; returns the restore summary"""
+    if not all(key in backup_data for key in BACKUP_REQUIRED_KEYS):
+        raise ValueError("Invalid backup file format. Missing required data.")
+
+    record_updates, deleted, summary = restore_updates(backup_data, delete_missing)
+    if record_updates:
+        committed = commit_import(record_updates, on_progress)
+        if committed < len(record_updates):
+            raise RuntimeError(f"only {committed} of {len(record_updates)} records were written")
+    for entity_type, party_id in deleted:
+        purge_archive(entity_type, party_id)
+    return summary
+
+def render_settings():
+    """Settings tab: preferences, data management and diagnostics"""
     st.header("⚙️ Settings")
     
     # General Settings
@@ -1273,28 +4919,10 @@ with tab4:
     
     if st.button("📥 Create Backup"):
         try:
-            # Load all data
-            all_customers = FirebaseDB.load_customers()
-            all_suppliers = FirebaseDB.load_suppliers()
-            
-            # Create backup data structure
-            backup_data = {
-                "customers": all_customers,
-                "suppliers": all_suppliers,
-                "settings": st.session_state.settings,
-                "customer_transactions": {},
-                "supplier_transactions": {}
-            }
-            
-            # Add transactions
-            for customer_id in all_customers:
-                backup_data["customer_transactions"][customer_id] = FirebaseDB.load_transactions("customer", customer_id)
-            
-            for supplier_id in all_suppliers:
-                backup_data["supplier_transactions"][supplier_id] = FirebaseDB.load_transactions("supplier", supplier_id)
-            
-            # Convert to JSON
-            backup_json = json.dumps(backup_data, indent=2)
+            # Parties and their live and archived transactions as one JSON document
+            buffer = io.StringIO()
+            write_backup(buffer)
+            backup_json = buffer.getvalue()
             
             # Create download button
             filename = f"firebase_ledger_backup_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
@@ -1310,12 +4938,41 @@ with tab4:
         except Exception as e:
             st.error(f"❌ Error creating backup: {e}")
     
+    # Analytics export
+    st.write("### 📊 Export Book for Analytics")
+    st.write("All parties and transactions as typed Parquet files: dictionary-encoded names, amounts in integer cents and real dates.")
+    
+    if st.button("📊 Export Book"):
+        try:
+            status = st.empty()
+            status.info("Exporting...")
+            data, rows = write_analytics_export(on_progress=lambda done: status.info(f"Exported {done:,} transactions..."))
+            status.success(f"✅ Exported {rows:,} transactions")
+            st.download_button(
+                label="📥 Download Analytics Export",
+                data=data,
+                file_name=f"ledger_book_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                mime="application/zip"
+            )
+        except ImportError:
+            st.error("❌ The analytics export needs the pyarrow package. Install it with `pip install pyarrow`.")
+        except Exception as e:
+            st.error(f"❌ Error exporting book: {e}")
+    
     # Restore data
     st.write("### 📤 Restore Data")
-    st.write("Restore data from a previously created backup file.")
+    st.write("Restore data from a previously created backup file. Only parties and transactions that differ from the live data are written.")
     st.warning("⚠️ This will overwrite your current data. Make sure to create a backup first.")
     
+    if "restore_summary" in st.session_state:
+        st.success(st.session_state.pop("restore_summary"))
+    
     uploaded_file = st.file_uploader("📁 Upload backup file", type=["json"])
+    delete_missing = st.checkbox(
+        "🗑️ Also delete parties and transactions that are not in the backup",
+        value=False,
+        key="restore_delete_missing"
+    )
     
     if uploaded_file is not None:
         if st.button("🔄 Restore Data"):
@@ -1324,38 +4981,43 @@ with tab4:
                 backup_data = json.loads(uploaded_file.getvalue().decode())
                 
                 # Validate backup data structure
-                required_keys = ["customers", "suppliers", "settings", "customer_transactions", "supplier_transactions"]
-                if not all(key in backup_data for key in required_keys):
+                if not all(key in backup_data for key in BACKUP_REQUIRED_KEYS):
                     st.error("❌ Invalid backup file format. Missing required data.")
                     st.stop()
                 
-                # Restore settings
+                progress = st.progress(0.0, text="Comparing with live data...")
+                summary = restore_backup(
+                    backup_data,
+                    delete_missing=delete_missing,
+                    on_progress=lambda done, total: progress.progress(done / total, text=f"Written {done} of {total} records")
+                )
                 st.session_state.settings = backup_data["settings"]
-                FirebaseDB.save_settings(backup_data["settings"])
                 
-                # Restore customers and their transactions
-                for customer_id, customer in backup_data["customers"].items():
-                    FirebaseDB.save_customer(customer_id, customer)
-                    
-                    # Restore customer transactions
-                    if customer_id in backup_data["customer_transactions"]:
-                        for trans_id, transaction in backup_data["customer_transactions"][customer_id].items():
-                            FirebaseDB.save_transaction("customer", customer_id, trans_id, transaction)
-                
-                # Restore suppliers and their transactions
-                for supplier_id, supplier in backup_data["suppliers"].items():
-                    FirebaseDB.save_supplier(supplier_id, supplier)
-                    
-                    # Restore supplier transactions
-                    if supplier_id in backup_data["supplier_transactions"]:
-                        for trans_id, transaction in backup_data["supplier_transactions"][supplier_id].items():
-                            FirebaseDB.save_transaction("supplier", supplier_id, trans_id, transaction)
-                
-                st.success("✅ Data restored successfully!")
+                # Shown after the rerun that picks up the restored settings
+                st.session_state.restore_summary = (
+                    f"✅ Data restored successfully! {summary['parties']} parties and {summary['transactions']} transactions written, "
+                    f"{summary['transactions_deleted']} transactions and {summary['parties_deleted']} parties deleted, "
+                    f"{summary['parties_unchanged']} parties unchanged ({summary['bytes'] / 1024:,.1f} KB sent)."
+                )
                 st.rerun()
             except Exception as e:
                 st.error(f"❌ Error restoring data: {e}")
     
+    # Transaction key and layout migrations
+    render_key_migration()
+    render_shard_migration()
+    
+    # Monthly balance checkpoints
+    render_checkpoints()
+    render_daily_totals()
+    
+    # Cold archive of closed periods
+    render_archive()
+    
+    # Integrity checks
+    render_verify_data()
+    render_duplicate_scan()
+    
     # Firebase Status
     st.write("### 🔥 Firebase Status")
     
@@ -1373,7 +5035,7 @@ with tab4:
         if st.button("🔍 Test Firebase Connection"):
             try:
                 # Try to read from Firebase
-                test_data = firebase_db.child("test").get()
+                FirebaseDB._fetch("test")
                 st.success("✅ Firebase connection test successful!")
             except Exception as e:
                 st.error(f"❌ Firebase connection test failed: {e}")
@@ -1381,6 +5043,14 @@ with tab4:
         st.error("🔴 **Firebase Connection Failed**")
         st.error("❌ Please check your secrets.toml configuration")
     
+    # Startup profile and call diagnostics
+    st.write("### ⏱️ Performance")
+    render_startup_profile()
+    render_profiler()
+    render_warm_cache()
+    render_diagnostics()
+    render_write_queue()
+    
     # Reset data
     st.write("### 🗑️ Reset Data")
     st.write("Reset all data to start fresh. This will delete all customers, suppliers, and transactions.")
@@ -1392,10 +5062,25 @@ with tab4:
         try:
             # Clear Firebase data
             if using_firebase:
-                firebase_db.child("customers").delete()
-                firebase_db.child("suppliers").delete()
-                firebase_db.child("customer_transactions").delete()
-                firebase_db.child("supplier_transactions").delete()
+                FirebaseDB._write({
+                    **{
+                        path: None
+                        for entity_type, config in ENTITY_TYPES.items()
+                        for path in (config["collection"], f"{entity_type}_transactions")
+                    },
+                    "checkpoints": None,
+                    "daily_totals": None,
+                    "txn_hashes": None,
+                    "meta/counts": None,
+                    "meta/checkpoints": None,
+                    "meta/daily_totals": None,
+                    "meta/txn_hashes": None,
+                    "meta/archive": None,
+                    "changelog": None,
+                    # A floor of now sends every warm snapshot back for a full reload
+                    "meta/changelog_floor": changelog_key()
+                })
+                shutil.rmtree(ARCHIVE_DIR, ignore_errors=True)
                 
                 # Reset session state
                 st.session_state.current_customer = None
@@ -1413,9 +5098,8 @@ with tab4:
         except Exception as e:
             st.error(f"❌ Error resetting data: {e}")
 
-# Sidebar with quick actions
-# Sidebar with quick actions
-with st.sidebar:
+def render_sidebar():
+    """Sidebar with quick actions"""
     st.header("🚀 Quick Actions")
     
     # Firebase status indicator
@@ -1424,14 +5108,15 @@ with st.sidebar:
     else:
         st.error("❌ Firebase Disconnected")
     
+    render_sync_status()
+    
     st.markdown("---")
     
-    # Quick stats
-    all_customers = FirebaseDB.load_customers()
-    all_suppliers = FirebaseDB.load_suppliers()
+    # Quick stats from the meta/counts node
+    party_counts = FirebaseDB.load_counts()
     
-    st.metric("👥 Customers", len(all_customers))
-    st.metric("🏢 Suppliers", len(all_suppliers))
+    for entity_type, config in ENTITY_TYPES.items():
+        st.metric(f"{config['icon']} {config['plural']}", party_counts[entity_type])
     
     # Quick navigation - SIMPLIFIED
     st.markdown("### 📋 Quick Navigation")
@@ -1439,6 +5124,7 @@ with st.sidebar:
     
     # Quick actions that actually work
     if st.button("🔄 Refresh Data", use_container_width=True):
+        clear_data_cache()
         st.rerun()
     
     if st.button("📥 Quick Backup", use_container_width=True):
@@ -1450,27 +5136,10 @@ with st.sidebar:
     st.markdown("### 🕒 Recent Activity")
     
     # Get recent transactions
-    all_transactions = []
-    
-    for customer_id, customer in all_customers.items():
-        customer_transactions = FirebaseDB.load_transactions("customer", customer_id)
-        if customer_transactions:
-            for trans_id, transaction in customer_transactions.items():
-                transaction['entity_name'] = customer.get('name', 'Unknown')
-                transaction['entity_type'] = 'Customer'
-                all_transactions.append(transaction)
-    
-    for supplier_id, supplier in all_suppliers.items():
-        supplier_transactions = FirebaseDB.load_transactions("supplier", supplier_id)
-        if supplier_transactions:
-            for trans_id, transaction in supplier_transactions.items():
-                transaction['entity_name'] = supplier.get('name', 'Unknown')
-                transaction['entity_type'] = 'Supplier'
-                all_transactions.append(transaction)
-    
-    # Sort by date and show recent 5
-    all_transactions.sort(key=lambda x: x.get('date', ''), reverse=True)
-    recent_transactions = all_transactions[:5]
+    all_parties = {entity_type: FirebaseDB.load_parties(entity_type) for entity_type in ENTITY_TYPES}
+    
+    # Show the 5 most recent
+    recent_transactions = load_recent_transactions(all_parties, 5)
     
     if recent_transactions:
         for transaction in recent_transactions:
@@ -1493,12 +5162,98 @@ with st.sidebar:
     st.info("☁️ Cloud-powered accounting")
     st.info("🔒 Secure & Real-time")
 
+def render_section(render, *args):
+    """Render one page section; a failed read shows an error instead of empty data"""
+    try:
+        render(*args)
+    except ReadError as e:
+        st.error(f"❌ Could not load data from Firebase: {e}")
+        st.info("Nothing was rendered rather than showing empty lists or zero balances. Your saved changes are safe.")
+        if st.button("🔁 Retry", key=f"retry_{render.__name__}_{'_'.join(map(str, args))}"):
+            st.rerun()
+
+def main():
+    """One run of the Streamlit page"""
+    # Start collecting this rerun's Firebase metrics
+    begin_rerun_metrics()
+    stale_reads().clear()
 
-# Footer
-st.markdown("---")
+    # Initialize session state
+    if 'settings' not in st.session_state:
+        st.session_state.settings = FirebaseDB.load_settings()
 
-# REPLACE with:
-st.markdown("""
+    if 'current_customer' not in st.session_state:
+        st.session_state.current_customer = None
+    if 'current_supplier' not in st.session_state:
+        st.session_state.current_supplier = None
+    if 'edit_customer' not in st.session_state:
+        st.session_state.edit_customer = None
+    if 'edit_supplier' not in st.session_state:
+        st.session_state.edit_supplier = None
+    if 'edit_transaction' not in st.session_state:
+        st.session_state.edit_transaction = None
+    if 'confirm_delete_customer' not in st.session_state:
+        st.session_state.confirm_delete_customer = None
+    if 'confirm_delete_supplier' not in st.session_state:
+        st.session_state.confirm_delete_supplier = None
+
+    apply_theme()
+
+    # Main app title
+    st.title("🔥 Firebase Ledger Management System")
+
+    # Firebase status indicator
+    if using_firebase:
+        st.success("🔥 **Connected to Firebase** | ☁️ **Real-time Database Active**")
+    else:
+        st.error("❌ **Firebase Connection Failed** | Please check your configuration")
+        pending_writes = write_queue().status()["pending"]
+        if pending_writes:
+            st.info(f"💾 {pending_writes} saved changes are waiting on this server and will sync once Firebase is reachable.")
+        st.stop()
+    # Filled in once the tabs have rendered and any offline fallbacks are known
+    stale_notice = st.empty()
+
+    # Create tabs
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["📊 Dashboard", "👥 Customers", "🏢 Suppliers", "🔍 Query", "⚙️ Settings"])
+
+    # Dashboard Tab
+    with tab1:
+        render_section(render_dashboard)
+
+    # Customers Tab
+    with tab2:
+        render_section(render_party_tab, "customer")
+
+    # Suppliers Tab
+    with tab3:
+        render_section(render_party_tab, "supplier")
+
+    # Query Tab
+    with tab4:
+        render_section(render_query_view)
+
+    # Settings Tab
+    with tab5:
+        render_section(render_settings)
+
+    # Sidebar with quick actions
+    with st.sidebar:
+        render_section(render_sidebar)
+
+    if stale_reads():
+        age = time.time() - min(stale_reads().values())
+        stale_notice.warning(
+            f"⚠️ Firebase is unreachable; showing data last read {age / 60:.0f} min ago. "
+            "New entries are saved on this server and sync once it is back."
+        )
+
+
+    # Footer
+    st.markdown("---")
+
+    # REPLACE with:
+    st.markdown("""
 <div style="text-align: center; color: #64748B; padding: 2rem; border-top: 1px solid #334155; margin-top: 3rem;">
     <h4 style="color: #E2E8F0; margin-bottom: 0.5rem;">📊 Ledger Management System</h4>
     <p style="margin: 0.25rem 0; font-size: 0.875rem;">Professional Edition | Powered by Firebase & Streamlit</p>
@@ -1508,13 +5263,19 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-# Auto-refresh indicator
-if st.session_state.settings.get("notification_enabled", True):
-    # Show connection status
-    if using_firebase:
-        st.toast("🔥 Connected to Firebase!", icon="✅")
-    else:
-        st.toast("❌ Firebase connection failed!", icon="🚨")
-
+    # Auto-refresh indicator
+    if st.session_state.settings.get("notification_enabled", True):
+        # Show connection status
+        if using_firebase:
+            st.toast("🔥 Connected to Firebase!", icon="✅")
+        else:
+            st.toast("❌ Firebase connection failed!", icon="🚨")
 
+    end_rerun_metrics()
+    record_script_run()
 
+if __name__ == "__main__":
+    if st.session_state.pop("profile_next_run", False) and profiler_allowed():
+        run_profiled(main)
+    else:
+        main()
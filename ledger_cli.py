@@ -0,0 +1,252 @@
+"""Headless command-line jobs for the ledger: backups, statements and maintenance.
+
+Reuses the FirebaseDB data layer from index1.py without a browser session, so nightly
+jobs can run from cron instead of holding a Streamlit worker:
+
+    python ledger_cli.py backup --output backups/ledger.json
+    python ledger_cli.py restore --input backups/ledger.json --yes
+    python ledger_cli.py statements --type customer --start 2024-04-01 --end 2025-03-31 --output fy25.zip
+    python ledger_cli.py rebuild
+    python ledger_cli.py archive --type customer --before 2024-01-01 --yes
+    python ledger_cli.py export --output book.zip
+    python ledger_cli.py verify --report verify.csv
+
+Firebase credentials are read from .streamlit/secrets.toml next to this file, as the app
+does. Writes go straight to Firebase (LEDGER_HEADLESS=1) rather than through the app's
+write queue journal. Exits non-zero when a job fails or verify finds differences.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import datetime
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger("ledger.cli")
+
+def parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a YYYY-MM-DD date: {value!r}")
+
+def abs_path(value):
+    # Resolved before the working directory moves to the app directory
+    return os.path.abspath(value)
+
+def load_app():
+    """Import index1.py headless, from the app directory so its secrets and data dir resolve"""
+    os.environ["LEDGER_HEADLESS"] = "1"
+    os.environ.setdefault("STREAMLIT_LOGGER_LEVEL", "error")
+    os.chdir(APP_DIR)
+    sys.path.insert(0, APP_DIR)
+    import index1
+
+    if not index1.using_firebase:
+        raise SystemExit("Firebase is not configured or unreachable; check .streamlit/secrets.toml")
+    return index1
+
+def replace_atomically(path, write):
+    """Write to a temporary file beside path and move it into place once complete"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def progress(label):
+    last = [0.0]
+    def report(done, total=None):
+        # At most one line every few seconds keeps cron mail short
+        now = time.monotonic()
+        if now - last[0] >= 5 or (total and done >= total):
+            last[0] = now
+            logger.info(f"{label}: {done}" + (f" of {total}" if total else ""))
+    return report
+
+# Jobs
+def run_backup(app, args):
+    path = args.output
+    reports = {entity_type: progress(f"backup {config['plural']}") for entity_type, config in app.ENTITY_TYPES.items()}
+
+    def write(temp_path):
+        with open(temp_path, "w", encoding="utf-8") as output:
+            app.write_backup(output, on_progress=lambda entity_type, done, total: reports[entity_type](done, total))
+            output.flush()
+            os.fsync(output.fileno())
+
+    replace_atomically(path, write)
+    logger.info(f"backup written to {path}")
+    return 0
+
+def run_restore(app, args):
+    if not args.yes:
+        raise SystemExit("restore overwrites live data; pass --yes to confirm")
+    with open(args.input, encoding="utf-8") as backup:
+        backup_data = json.load(backup)
+    summary = app.restore_backup(backup_data, delete_missing=args.delete_missing, on_progress=progress("restore records"))
+    logger.info(f"restored {args.input}: {json.dumps(summary)}")
+    return 0
+
+def run_statements(app, args):
+    if args.start > args.end:
+        raise SystemExit("--start must be on or before --end")
+
+    entity_type = args.type
+    parties = app.FirebaseDB.load_parties(entity_type)
+    party_ids = sorted(parties, key=lambda x: parties[x].get('name', '').lower())
+
+    def statements():
+        # Chunks of parties keep one period's lines in memory at a time
+        checkpoints = app.FirebaseDB.load_checkpoints(entity_type) if app.FirebaseDB.checkpoints_ready(entity_type) else None
+        size = app.BACKUP_CHUNK_PARTIES if checkpoints is not None else len(party_ids) or 1
+        for start in range(0, len(party_ids), size):
+            chunk = party_ids[start:start + size]
+            for statement in app.load_party_statements(entity_type, chunk, args.start, args.end, checkpoints=checkpoints):
+                if args.all or statement[1] != 0 or not statement[2].empty:
+                    yield statement
+
+    writer = app.write_statements_workbook if args.format == "workbook" else app.write_statements_zip
+    report = progress("statements")
+    written = [0]
+
+    def write(temp_path):
+        _, written[0] = writer(
+            statements(), parties, args.start, args.end,
+            on_progress=lambda done, party: report(done, len(party_ids)),
+            output=temp_path
+        )
+
+    replace_atomically(args.output, write)
+    logger.info(f"{written[0]} statements written to {args.output}")
+    return 0
+
+def run_rebuild(app, args):
+    jobs = {
+        "counts": app.FirebaseDB.rebuild_counts,
+        "checkpoints": lambda: all([app.FirebaseDB.rebuild_checkpoints(entity_type) for entity_type in app.ENTITY_TYPES]),
+        "daily": app.FirebaseDB.rebuild_daily_totals,
+        "hashes": app.FirebaseDB.rebuild_fingerprints,
+        "changelog": lambda: app.FirebaseDB.prune_changelog() >= 0
+    }
+    failed = []
+    for name in args.only or list(jobs):
+        started = time.perf_counter()
+        ok = jobs[name]()
+        logger.info(f"rebuild {name}: {'ok' if ok else 'FAILED'} in {time.perf_counter() - started:.1f}s")
+        if not ok:
+            failed.append(name)
+    return 1 if failed else 0
+
+def run_archive(app, args):
+    if not app.FirebaseDB.checkpoints_ready(args.type):
+        raise SystemExit(f"build the {args.type} checkpoints first: python ledger_cli.py rebuild --only checkpoints")
+    if not args.yes:
+        raise SystemExit("archiving removes transactions from Firebase; pass --yes to confirm")
+    moved, total = app.archive_transactions(args.type, args.before, on_progress=progress(f"archive {args.type}"))
+    app.search_index().invalidate()
+    if moved < total:
+        logger.error(f"archived only {moved} of {total} transaction paths before {args.before}; run the archive again")
+        return 1
+    logger.info(f"archived {moved} transaction paths before {args.before}")
+    return 0
+
+def run_export(app, args):
+    def write(temp_path):
+        data, rows = app.write_analytics_export(on_progress=progress("export"))
+        with open(temp_path, "wb") as output:
+            output.write(data)
+        logger.info(f"exported {rows} transactions")
+
+    replace_atomically(args.output, write)
+    logger.info(f"analytics export written to {args.output}")
+    return 0
+
+def run_verify(app, args):
+    issues = []
+    repairs = {}
+    for entity_type, config in app.ENTITY_TYPES.items():
+        book_issues, book_repairs = app.verify_book(entity_type, on_progress=progress(f"verify {config['plural']}"))
+        issues.extend(book_issues)
+        repairs.update(book_repairs)
+
+    if args.report:
+        replace_atomically(args.report, lambda temp_path: app.pd.DataFrame(issues).to_csv(temp_path, index=False))
+    logger.info(f"{len(issues)} differences, {len(repairs)} repairable paths")
+
+    if repairs and args.repair:
+        if not app.FirebaseDB.batch_update(repairs):
+            return 1
+        logger.info("repairs applied; run verify again to confirm")
+        return 0
+    return 1 if issues else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless ledger jobs")
+    parser.add_argument("--verbose", action="store_true", help="log every Firebase call")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    backup = commands.add_parser("backup", help="write a restorable JSON backup of the whole book")
+    backup.add_argument("--output", type=abs_path)
+    backup.set_defaults(run=run_backup)
+
+    restore = commands.add_parser("restore", help="restore a JSON backup, writing only records that differ")
+    restore.add_argument("--input", type=abs_path, required=True)
+    restore.add_argument("--delete-missing", action="store_true", help="also delete records that are not in the backup")
+    restore.add_argument("--yes", action="store_true")
+    restore.set_defaults(run=run_restore)
+
+    statements = commands.add_parser("statements", help="period statements for every party of one book")
+    statements.add_argument("--type", choices=["customer", "supplier"], required=True)
+    statements.add_argument("--start", type=parse_date, required=True)
+    statements.add_argument("--end", type=parse_date, required=True)
+    statements.add_argument("--format", choices=["zip", "workbook"], default="zip")
+    statements.add_argument("--all", action="store_true", help="include parties with nothing to report")
+    statements.add_argument("--output", type=abs_path, required=True)
+    statements.set_defaults(run=run_statements)
+
+    rebuild = commands.add_parser("rebuild", help="rebuild counters, checkpoints, daily totals and the hash index; prune the change log")
+    rebuild.add_argument("--only", nargs="+", choices=["counts", "checkpoints", "daily", "hashes", "changelog"])
+    rebuild.set_defaults(run=run_rebuild)
+
+    archive = commands.add_parser("archive", help="move transactions before a date into the Parquet archive")
+    archive.add_argument("--type", choices=["customer", "supplier"], required=True)
+    archive.add_argument("--before", type=parse_date, required=True)
+    archive.add_argument("--yes", action="store_true")
+    archive.set_defaults(run=run_archive)
+
+    export = commands.add_parser("export", help="Parquet analytics export of the whole book")
+    export.add_argument("--output", type=abs_path, required=True)
+    export.set_defaults(run=run_export)
+
+    verify = commands.add_parser("verify", help="check derived data against the transactions")
+    verify.add_argument("--report", type=abs_path, help="write the differences to this CSV file")
+    verify.add_argument("--repair", action="store_true", help="apply the repairable differences")
+    verify.set_defaults(run=run_verify)
+
+    args = parser.parse_args()
+    if args.command == "backup" and not args.output:
+        # The default lands in the caller's directory, so it is resolved before load_app() moves away
+        args.output = abs_path(f"firebase_ledger_backup_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s %(message)s"
+    )
+
+    app = load_app()
+    try:
+        sys.exit(args.run(app, args))
+    except Exception:
+        logger.exception(f"{args.command} failed")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""Concurrent multi-session load test for index1.py.
+
+Drives simulated operator sessions in parallel through streamlit.testing.v1.AppTest
+against an in-memory fake of the Firebase Realtime Database, and reports rerun
+latency percentiles, backend calls per rerun and process memory at each level of
+concurrency.
+
+    python loadtest.py --sessions 1 4 8 16 --parties 200 --transactions 20000
+
+Every session browses the Dashboard, searches particulars, opens a customer ledger
+and adds a transaction. Sessions share one process, so process-wide caches, the
+write queue and the search index are shared exactly as they are on a real server.
+"""
+import os
+import sys
+import json
+import copy
+import time
+import random
+import argparse
+import tempfile
+import threading
+import resource
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index1.py")
+PUSH_CHARS = "-0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+ITEMS = ["cement", "steel rods", "bricks", "sand", "paint", "tiles", "pipes", "wiring", "timber", "glass"]
+FAKE_SECRETS = {"database_url": "https://loadtest.invalid"}
+
+# In-memory Realtime Database: just the reference/query surface index1.py uses
+def split_path(path):
+    return [part for part in str(path).strip("/").split("/") if part]
+
+class FakeDatabase:
+    def __init__(self, latency_ms=0.0):
+        self.lock = threading.Lock()
+        self.root = {}
+        self.latency = latency_ms / 1000
+        self.calls = 0
+
+    def _wait(self):
+        with self.lock:
+            self.calls += 1
+        if self.latency:
+            # Jittered round trip, outside the lock so calls overlap like real requests
+            time.sleep(random.uniform(0.5, 1.5) * self.latency)
+
+    def node(self, parts):
+        node = self.root
+        for part in parts:
+            if not isinstance(node, dict):
+                return None
+            node = node.get(part)
+        return node
+
+    def assign(self, parts, value):
+        if isinstance(value, dict) and ".sv" in value:
+            current = self.node(parts)
+            value = (current if isinstance(current, (int, float)) else 0) + value[".sv"].get("increment", 0)
+        if not parts:
+            self.root = value if isinstance(value, dict) else {}
+            return
+        node = self.root
+        for part in parts[:-1]:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = node[part] = {}
+            node = child
+        if value is None or value == {}:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = copy.deepcopy(value)
+
+class FakeQuery:
+    def __init__(self, reference):
+        self.reference = reference
+        self.start = None
+        self.end = None
+        self.last = None
+
+    def start_at(self, value):
+        self.start = value
+        return self
+
+    def end_at(self, value):
+        self.end = value
+        return self
+
+    def limit_to_last(self, count):
+        self.last = count
+        return self
+
+    def get(self):
+        database = self.reference.database
+        database._wait()
+        with database.lock:
+            node = database.node(self.reference.parts)
+            if not isinstance(node, dict):
+                return None
+            keys = sorted(
+                key for key in node
+                if (self.start is None or key >= self.start) and (self.end is None or key <= self.end)
+            )
+            if self.last is not None:
+                keys = keys[-self.last:]
+            return {key: copy.deepcopy(node[key]) for key in keys} or None
+
+class FakeReference:
+    def __init__(self, database, parts):
+        self.database = database
+        self.parts = parts
+
+    def child(self, path):
+        return FakeReference(self.database, self.parts + split_path(path))
+
+    def get(self, shallow=False):
+        self.database._wait()
+        with self.database.lock:
+            node = self.database.node(self.parts)
+            if shallow and isinstance(node, dict):
+                return {key: True for key in node}
+            return copy.deepcopy(node)
+
+    def set(self, value):
+        self.database._wait()
+        with self.database.lock:
+            self.database.assign(self.parts, value)
+
+    def update(self, updates):
+        self.database._wait()
+        with self.database.lock:
+            for path, value in updates.items():
+                self.database.assign(self.parts + split_path(path), value)
+
+    def delete(self):
+        self.set(None)
+
+    def order_by_key(self):
+        return FakeQuery(self)
+
+def install_fake_backend(database):
+    """Point firebase_admin at the fake before any session runs the app"""
+    import firebase_admin
+    from firebase_admin import db
+
+    firebase_admin._apps["[DEFAULT]"] = object()
+    db.reference = lambda path="/", *args, **kwargs: FakeReference(database, split_path(path))
+
+# Seed data
+def push_key(date):
+    return date.replace("-", "") + "-" + "".join(random.choice(PUSH_CHARS) for _ in range(20))
+
+def seed(database, parties, transactions):
+    """Customers and suppliers with dated transactions spread over the last two years"""
+    today = time.time()
+    party_ids = {"customer": [], "supplier": []}
+    for index in range(parties):
+        entity_type = "customer" if index % 4 else "supplier"
+        party_id = f"{entity_type}-{index:06d}"
+        party_ids[entity_type].append(party_id)
+        database.assign([f"{entity_type}s", party_id], {
+            "name": f"{entity_type.title()} {index}",
+            "phone": f"9{index:09d}",
+            "email": "",
+            "address": "",
+            "created_on": "2024-01-01"
+        })
+
+    for index in range(transactions):
+        entity_type = "customer" if index % 4 else "supplier"
+        party_id = random.choice(party_ids[entity_type])
+        date = time.strftime("%Y-%m-%d", time.localtime(today - random.randint(0, 730) * 86400))
+        amount = str(float(random.randint(1, 50000)))
+        debit, credit = (amount, "0.0") if random.random() < 0.5 else ("0.0", amount)
+        database.assign([f"{entity_type}_transactions", party_id, push_key(date)], {
+            "date": date,
+            "particular": f"{random.choice(ITEMS)} invoice INV-{index:06d}",
+            "debit": debit,
+            "credit": credit
+        })
+    return party_ids
+
+# Sessions
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Peak RSS where /proc is unavailable (KiB on Linux, bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+class SessionResult:
+    def __init__(self):
+        self.latencies = []      # ms per user action (one or more reruns)
+        self.calls = []          # backend calls per rerun
+        self.errors = []
+
+def run_action(at, result, action, timeout):
+    """Run one user action and record its latency and the app's per-rerun call counts"""
+    runs_before = len(at.session_state["metrics"]["runs"]) if "metrics" in at.session_state else 0
+    started = time.perf_counter()
+    action().run(timeout=timeout)
+    result.latencies.append((time.perf_counter() - started) * 1000)
+
+    if at.exception:
+        result.errors.extend(str(e.message) for e in at.exception)
+    if "metrics" in at.session_state:
+        for run in at.session_state["metrics"]["runs"][runs_before:]:
+            result.calls.append(run["calls"])
+
+def find_button(at, label):
+    for button in at.button:
+        if button.label == label:
+            return button
+    raise LookupError(f"no button labelled {label!r}")
+
+def run_session(session_id, party_ids, rounds, timeout, result):
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(session_id)
+    try:
+        at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        at.secrets["firebase"] = FAKE_SECRETS
+
+        # Browse the Dashboard (every tab renders on each run)
+        run_action(at, result, lambda: at, timeout)
+
+        for _ in range(rounds):
+            term = rng.choice(ITEMS).split()[0]
+            run_action(at, result, lambda: at.text_input(key="transaction_search").input(term), timeout)
+
+            party_id = rng.choice(party_ids["customer"])
+            run_action(at, result, lambda: at.selectbox(key="customer_select").set_value(party_id), timeout)
+
+            at.text_area(key=f"customer_particular_{party_id}").input(f"load test {session_id} {rng.choice(ITEMS)}")
+            at.number_input(key=f"customer_credit_{party_id}").set_value(float(rng.randint(1, 1000)))
+            run_action(at, result, lambda: find_button(at, "➕ Add Transaction").click(), timeout)
+    except Exception as e:
+        result.errors.append(f"session {session_id}: {e!r}")
+
+def run_level(sessions, party_ids, rounds, timeout, database):
+    results = [SessionResult() for _ in range(sessions)]
+    calls_before = database.calls
+    threads = [
+        threading.Thread(target=run_session, args=(index, party_ids, rounds, timeout, results[index]), daemon=True)
+        for index in range(sessions)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = [ms for result in results for ms in result.latencies]
+    calls = [count for result in results for count in result.calls]
+    return {
+        "sessions": sessions,
+        "actions": len(latencies),
+        "p50_ms": round(percentile(latencies, 0.50), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "calls_per_rerun": round(sum(calls) / len(calls), 1) if calls else 0.0,
+        "max_calls_per_rerun": max(calls) if calls else 0,
+        "backend_calls": database.calls - calls_before,
+        "wall_s": round(elapsed, 1),
+        "rss_mb": round(rss_mb(), 1),
+        "errors": [error for result in results for error in result.errors][:10]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent AppTest load test for index1.py")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8], help="concurrency levels to run")
+    parser.add_argument("--rounds", type=int, default=3, help="search/ledger/add rounds per session")
+    parser.add_argument("--parties", type=int, default=200)
+    parser.add_argument("--transactions", type=int, default=20000)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="simulated backend round trip")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds allowed per rerun")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    # Keep the write-queue journal out of the working tree
+    os.environ.setdefault("LEDGER_DATA_DIR", tempfile.mkdtemp(prefix="ledger-loadtest-"))
+
+    database = FakeDatabase(latency_ms=args.latency_ms)
+    party_ids = seed(database, args.parties, args.transactions)
+    install_fake_backend(database)
+
+    report = []
+    print(f"{'sessions':>8} {'actions':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'calls/rerun':>12} {'rss MB':>8}  errors")
+    for sessions in args.sessions:
+        level = run_level(sessions, party_ids, args.rounds, args.timeout, database)
+        report.append(level)
+        print(
+            f"{level['sessions']:>8} {level['actions']:>8} {level['p50_ms']:>9} {level['p95_ms']:>9} "
+            f"{level['p99_ms']:>9} {level['calls_per_rerun']:>12} {level['rss_mb']:>8}  {len(level['errors'])}"
+        )
+        for error in level["errors"]:
+            print(f"         ! {error}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=2)
+
+if __name__ == "__main__":
+    main()